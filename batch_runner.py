@@ -0,0 +1,389 @@
+"""
+OpenAI Batch API mode for bulk archive runs.
+
+Documents are uploaded, a JSONL file of `/v1/responses` requests is built with the
+same system prompt as interactive extraction, and the requests are submitted as one
+or more batches. Results are streamed back through the metadata writer and matched
+to their source files by `custom_id`.
+
+All progress is kept in a state file next to the JSON output, so an interrupted run
+can be restarted with the same command: uploaded files are not re-uploaded,
+submitted batches are polled rather than resubmitted, and records already written
+are skipped.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import DEFAULT_MODEL
+from metadata_extractor import MetadataExtractor
+from openai_client import build_request_input, clean_response_text, usage_from_response
+
+BATCH_ENDPOINT = "/v1/responses"
+BATCH_COMPLETION_WINDOW = "24h"
+# OpenAI accepts at most 50,000 requests and 200 MB per batch input file. Every line
+# carries the full system prompt (~55 KB), so the size limit is usually reached first;
+# input files are cut 10 MB short of it.
+MAX_REQUESTS_PER_BATCH = 50000
+MAX_BATCH_INPUT_BYTES = 190 * 1024 * 1024
+_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def make_custom_id(pdf_path: str) -> str:
+    """Return a stable batch custom_id for a source file."""
+    return "doc-" + hashlib.sha256(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:32]
+
+
+def response_output_text(body: Dict[str, Any]) -> str:
+    """
+    Collect the output text from a raw Responses API body (as found in batch results).
+
+    Args:
+        body (dict): The `response.body` object of a batch result line
+
+    Returns:
+        str: Concatenated output_text parts
+    """
+    if body.get("output_text"):
+        return body["output_text"]
+    texts = []
+    for item in body.get("output") or []:
+        if item.get("type") != "message":
+            continue
+        for part in item.get("content") or []:
+            if part.get("type") == "output_text":
+                texts.append(part.get("text", ""))
+    return "".join(texts)
+
+
+class BatchRunner:
+    def __init__(self, extractor: MetadataExtractor, writer: Any, state_file: str,
+                 poll_interval: float = 60.0, workers: int = 1,
+                 max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH,
+                 max_batch_bytes: int = MAX_BATCH_INPUT_BYTES) -> None:
+        """
+        Initialize the batch runner.
+
+        Args:
+            extractor (MetadataExtractor): Extractor whose client and system prompt are used
+            writer: Metadata writer exposing write_metadata(metadata, path, original_format)
+            state_file (str): Path of the JSON file that records batch progress
+            poll_interval (float): Seconds between batch status checks
+            workers (int): Number of concurrent uploads
+            max_requests_per_batch (int): Most requests per submitted batch
+            max_batch_bytes (int): Largest JSONL input file per submitted batch, in bytes
+        """
+        self.extractor = extractor
+        self.writer = writer
+        self.state_file = state_file
+        self.done_file = state_file + ".done"
+        self.poll_interval = poll_interval
+        self.workers = max(1, workers)
+        self.max_requests_per_batch = max_requests_per_batch
+        self.max_batch_bytes = max_batch_bytes
+        self.openai = extractor.client.client
+        self.system_prompt = extractor.client.system_prompt
+        self.state = self._load_state()
+        self._written = self._load_done()
+
+    # ── state persistence ─────────────────────────────────────────────────────
+
+    def _load_state(self) -> Dict[str, Any]:
+        """Load the batch state file, or start a new one."""
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            print(f"Resuming batch run from state file: {self.state_file}")
+            return state
+        return {"created_at": datetime.now().isoformat(), "documents": {}, "batches": []}
+
+    def _save_state(self) -> None:
+        """Atomically write the state file."""
+        self.state["last_updated"] = datetime.now().isoformat()
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.state_file)
+
+    def _load_done(self) -> Set[str]:
+        """Return the custom_ids whose records have already been written."""
+        if not os.path.exists(self.done_file):
+            return set()
+        with open(self.done_file, 'r', encoding='utf-8') as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _mark_written(self, custom_id: str) -> None:
+        """Append a custom_id to the written log (O(1), survives crashes mid-stream)."""
+        with open(self.done_file, 'a', encoding='utf-8') as f:
+            f.write(custom_id + "\n")
+        self._written.add(custom_id)
+
+    # ── pipeline ──────────────────────────────────────────────────────────────
+
+    def run(self, jobs: List[Tuple[str, str]], first_pages: int = 0, last_pages: int = 0,
+            context_prompt: Optional[str] = None) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+        Upload, submit, poll and collect results for every job.
+
+        Args:
+            jobs: List of (pdf_path, original_format) tuples
+            first_pages (int): Number of pages to include from the start
+            last_pages (int): Number of pages to include from the end
+            context_prompt (str, optional): Custom context to include in the prompt
+
+        Returns:
+            Tuple of (processed file paths, list of (file_path, error_message) for failures)
+        """
+        documents = self.state["documents"]
+        result_cache = self.extractor.result_cache
+        cached_files: List[str] = []
+        for pdf_path, original_format in jobs:
+            custom_id = make_custom_id(pdf_path)
+            if custom_id in documents:
+                continue
+            if result_cache:
+                # Documents already extracted with the same settings skip the batch entirely
+                cache_key = self.extractor.result_key(pdf_path, first_pages, last_pages, context_prompt,
+                                                     input_mode="file")
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    self.writer.write_metadata(cached, pdf_path, original_format)
+                    cached_files.append(pdf_path)
+                    continue
+            else:
+                cache_key = None
+            documents[custom_id] = {"pdf_path": pdf_path, "original_format": original_format,
+                                    "file_id": None, "batch_id": None, "error": None,
+                                    "cache_key": cache_key}
+        self._save_state()
+        if cached_files:
+            print(f"Wrote {len(cached_files)} cached result(s) without submitting them")
+
+        self._upload_pending(first_pages, last_pages)
+        self._submit_pending(context_prompt)
+        self._wait_for_batches()
+        processed_files, failed_files = self._collect_results()
+        return cached_files + processed_files, failed_files
+
+    def _upload_pending(self, first_pages: int, last_pages: int) -> None:
+        """Upload every document that has no file_id yet."""
+        # Includes documents whose upload failed on a previous run
+        pending = [(cid, doc) for cid, doc in self.state["documents"].items()
+                   if not doc.get("file_id") and not doc.get("batch_id")]
+        if not pending:
+            return
+        print(f"\nUploading {len(pending)} file(s) for batch submission")
+
+        def upload(item: Tuple[str, Dict[str, Any]]) -> None:
+            custom_id, doc = item
+            doc["error"] = None
+            try:
+                doc["file_id"] = self.extractor.upload_document(doc["pdf_path"], first_pages, last_pages)
+            except Exception as e:
+                print(f"Error uploading {doc['pdf_path']}: {str(e)}")
+                doc["error"] = str(e)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for index, _ in enumerate(executor.map(upload, pending), 1):
+                # Persist periodically so a crash costs at most a few re-uploads
+                if index % 25 == 0:
+                    self._save_state()
+        self._save_state()
+
+    def _request_line(self, custom_id: str, context_prompt: Optional[str]) -> bytes:
+        """Return the encoded JSONL line of one batch request."""
+        doc = self.state["documents"][custom_id]
+        line = {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": DEFAULT_MODEL,
+                "input": build_request_input(self.system_prompt, doc["file_id"], context_prompt),
+                "prompt_cache_key": self.extractor.client.prompt_cache_key,
+            },
+        }
+        return (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _write_chunks(self, ready: List[str], context_prompt: Optional[str]) -> Iterator[Tuple[List[str], str]]:
+        """
+        Write request lines into temporary JSONL files that stay within the batch limits.
+
+        A file is cut when the next line would take it past max_batch_bytes or
+        max_requests_per_batch. The caller deletes each file once it has been uploaded.
+
+        Yields:
+            Tuple of (custom_ids in the file, path of the file)
+        """
+        chunk: List[str] = []
+        size = 0
+        f = None
+        jsonl_path = None
+        try:
+            for custom_id in ready:
+                line = self._request_line(custom_id, context_prompt)
+                if len(line) > self.max_batch_bytes:
+                    self.state["documents"][custom_id]["error"] = (
+                        f"Batch request is {len(line)} bytes, over the {self.max_batch_bytes} byte input file limit")
+                    continue
+                if chunk and (len(chunk) >= self.max_requests_per_batch or size + len(line) > self.max_batch_bytes):
+                    f.close()
+                    f = None
+                    yield chunk, jsonl_path
+                    chunk, size = [], 0
+                if f is None:
+                    fd, jsonl_path = tempfile.mkstemp(suffix='.jsonl')
+                    f = os.fdopen(fd, 'wb')
+                f.write(line)
+                chunk.append(custom_id)
+                size += len(line)
+            if chunk:
+                f.close()
+                f = None
+                yield chunk, jsonl_path
+        finally:
+            # Only reached with an open file if the run stopped part way through a chunk
+            if f is not None:
+                f.close()
+                os.unlink(jsonl_path)
+
+    def _submit_pending(self, context_prompt: Optional[str]) -> None:
+        """Build JSONL input files for uploaded documents and submit them as batches."""
+        ready = [cid for cid, doc in self.state["documents"].items()
+                 if doc.get("file_id") and not doc.get("batch_id")]
+        for chunk, jsonl_path in self._write_chunks(ready, context_prompt):
+            try:
+                with open(jsonl_path, 'rb') as f:
+                    input_file = self.openai.files.create(file=f, purpose="batch")
+            finally:
+                os.unlink(jsonl_path)
+
+            batch = self.openai.batches.create(
+                input_file_id=input_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=BATCH_COMPLETION_WINDOW,
+            )
+            for custom_id in chunk:
+                self.state["documents"][custom_id]["batch_id"] = batch.id
+            self.state["batches"].append({
+                "batch_id": batch.id,
+                "input_file_id": input_file.id,
+                "status": batch.status,
+                "output_file_id": None,
+                "error_file_id": None,
+                "collected": False,
+                "request_count": len(chunk),
+            })
+            # Record the submission immediately so a restart polls instead of resubmitting
+            self._save_state()
+            print(f"Submitted batch {batch.id} with {len(chunk)} request(s)")
+        self._save_state()
+
+    def _wait_for_batches(self) -> None:
+        """Poll submitted batches until each reaches a terminal status."""
+        while True:
+            waiting = [b for b in self.state["batches"] if b["status"] not in _TERMINAL_STATUSES]
+            if not waiting:
+                return
+            for entry in waiting:
+                batch = self.openai.batches.retrieve(entry["batch_id"])
+                entry["status"] = batch.status
+                entry["output_file_id"] = batch.output_file_id
+                entry["error_file_id"] = batch.error_file_id
+                counts = batch.request_counts
+                if counts is not None:
+                    print(f"Batch {batch.id}: {batch.status} "
+                          f"({counts.completed}/{counts.total} completed, {counts.failed} failed)")
+                else:
+                    print(f"Batch {batch.id}: {batch.status}")
+            self._save_state()
+            if any(b["status"] not in _TERMINAL_STATUSES for b in self.state["batches"]):
+                time.sleep(self.poll_interval)
+
+    def _iter_result_lines(self, file_id: str):
+        """Stream a batch output/error file one parsed JSON line at a time."""
+        with self.openai.files.with_streaming_response.content(file_id) as response:
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def _collect_results(self) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """Write the results of finished batches and report successes and failures."""
+        documents = self.state["documents"]
+        processed_files: List[str] = []
+        failed_files: List[Tuple[str, str]] = []
+        seen: Set[str] = set()
+
+        for entry in self.state["batches"]:
+            if entry.get("collected"):
+                continue
+            members = [cid for cid, doc in documents.items() if doc.get("batch_id") == entry["batch_id"]]
+            if entry["status"] != "completed" and not entry.get("output_file_id") and not entry.get("error_file_id"):
+                for cid in members:
+                    seen.add(cid)
+                    failed_files.append((documents[cid]["pdf_path"], f"Batch {entry['batch_id']} {entry['status']}"))
+
+            # Unknown custom_ids are skipped; results are keyed by custom_id, not position
+            for file_id in (entry.get("output_file_id"), entry.get("error_file_id")):
+                if not file_id:
+                    continue
+                for result in self._iter_result_lines(file_id):
+                    custom_id = result.get("custom_id")
+                    doc = documents.get(custom_id)
+                    if doc is None:
+                        print(f"Warning: batch result for unknown custom_id {custom_id}")
+                        continue
+                    seen.add(custom_id)
+                    if custom_id in self._written:
+                        processed_files.append(doc["pdf_path"])
+                        continue
+                    try:
+                        response = result.get("response") or {}
+                        if result.get("error") or response.get("status_code") != 200:
+                            error = result.get("error") or (response.get("body") or {}).get("error")
+                            raise ValueError(f"Batch request failed: {error}")
+                        body = response.get("body") or {}
+                        metadata = clean_response_text(response_output_text(body))
+                        usage = usage_from_response(body)
+                        self.extractor.client.usage.add(usage)
+                        self.writer.write_metadata(metadata, doc["pdf_path"], doc["original_format"], usage=usage)
+                        self._mark_written(custom_id)
+                        if self.extractor.result_cache and doc.get("cache_key"):
+                            self.extractor.result_cache.put(doc["cache_key"], metadata)
+                        processed_files.append(doc["pdf_path"])
+                        print(f"Successfully processed and added to JSON: {doc['pdf_path']}")
+                    except Exception as e:
+                        print(f"Error processing {doc['pdf_path']}: {str(e)}")
+                        failed_files.append((doc["pdf_path"], str(e)))
+
+            for cid in members:
+                if cid not in seen:
+                    seen.add(cid)
+                    failed_files.append((documents[cid]["pdf_path"], "No result returned by batch"))
+                # Release unwritten documents so the next run resubmits them
+                if cid not in self._written:
+                    documents[cid]["batch_id"] = None
+                elif self.extractor.janitor:
+                    self.extractor.janitor.enqueue(documents[cid]["file_id"])
+            if self.extractor.janitor:
+                for key in ("input_file_id", "output_file_id", "error_file_id"):
+                    self.extractor.janitor.enqueue(entry.get(key))
+            entry["collected"] = True
+
+        for cid, doc in documents.items():
+            if cid in seen:
+                continue
+            if doc.get("error"):
+                failed_files.append((doc["pdf_path"], doc["error"]))
+            elif cid in self._written:
+                processed_files.append(doc["pdf_path"])
+
+        self._save_state()
+        return processed_files, failed_files
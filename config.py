@@ -12,11 +12,37 @@ import yaml
 DEFAULT_MODEL = "gpt-5"
 FILE_PURPOSE = "user_data"
 
+# Input modes: "file" uploads the (sliced) PDF; "text" sends the locally extracted
+# text layer as input_text and falls back to "file" for pages without one; "image"
+# renders image-only pages (photos, scans) to JPEGs sent as input_image and falls
+# back to "file" for other pages
+INPUT_MODES = ("file", "text", "image")
+TEXT_INPUT_CHAR_BUDGET = 60000
+IMAGE_INPUT_MAX_EDGE = 1600
+IMAGE_INPUT_JPEG_QUALITY = 80
+# Documents with more selected pages than this are uploaded as PDFs in "image" mode
+IMAGE_INPUT_MAX_PAGES = 20
+
+# Partial PDFs are built in memory; larger slices spill over to a temporary file
+PARTIAL_PDF_SPILL_MB = 32
+
+# --pages auto:N scores at most this many pages of a long document (three quarters
+# from the start, where title pages and summaries usually are, the rest from the end)
+AUTO_PAGES_SCAN_LIMIT = 60
+
 _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Default profile (ICAEW) kept for backward compatibility
 DEFAULT_PROFILE_PATH = os.path.join(_BASE_DIR, "profiles", "icaew.yaml")
 
+# Local caches (uploads, extraction results); override the location with METADATA_CACHE_DIR
+CACHE_DIR = os.getenv("METADATA_CACHE_DIR", os.path.join(_BASE_DIR, ".cache"))
+UPLOAD_CACHE_PATH = os.path.join(CACHE_DIR, "uploads.sqlite")
+UPLOAD_CACHE_TTL_DAYS = 30
+RESULT_CACHE_PATH = os.path.join(CACHE_DIR, "results.sqlite")
+RESULT_CACHE_MAX_MB = 512
+CATALOG_PATH = os.path.join(CACHE_DIR, "catalog.sqlite")
+
 
 def load_profile(profile_path: str = None) -> dict:
     """Load a YAML profile. Falls back to the ICAEW profile if path is None."""
@@ -427,3 +453,21 @@ def get_subject_constraints(profile_path: str = None) -> tuple:
         return set(), 0
     topic_path = os.path.join(_BASE_DIR, topic_file)
     return load_valid_topics(topic_path), subject_max
+
+
+# ── upload optimisation ───────────────────────────────────────────────────────
+
+UPLOAD_OPTIMISATION_DEFAULTS = {
+    "enabled": False,
+    "max_dpi": 150,
+    "jpeg_quality": 75,
+    "target_mb": None,
+}
+
+
+def get_upload_optimisation(profile_path: str = None) -> dict:
+    """Return the profile's upload_optimisation settings, filled in from the defaults."""
+    profile = load_profile(profile_path)
+    settings = dict(UPLOAD_OPTIMISATION_DEFAULTS)
+    settings.update(profile.get("upload_optimisation") or {})
+    return settings
@@ -0,0 +1,262 @@
+"""
+Pre-flight catalog of the input corpus.
+
+`main.py --scan` (or `python corpus_catalog.py scan`) walks the input files in
+parallel before a run and records, per file: size, mtime, SHA-256, page count,
+whether the first pages have a text layer, and whether the file is encrypted or
+corrupt. The catalog is a SQLite database next to the other caches; unchanged
+files (same size and mtime) are not rescanned.
+
+main.py uses it to skip bad files up front instead of failing halfway through,
+to process the largest files first (so one big document doesn't run on alone at
+the end) and to estimate the run time from previously recorded extraction times.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import CATALOG_PATH
+
+# Used for the run-time estimate until the catalog has recorded extraction times
+DEFAULT_SECONDS_PER_DOCUMENT = 30.0
+# Pages checked for a text layer
+TEXT_LAYER_SAMPLE_PAGES = 3
+
+STATUS_OK = "ok"
+STATUS_ENCRYPTED = "encrypted"
+STATUS_CORRUPT = "corrupt"
+
+_COLUMNS = ("path", "size", "mtime", "sha256", "page_count", "has_text_layer", "status", "error",
+            "scanned_at", "extract_seconds")
+
+
+def scan_file(pdf_path: str) -> Dict[str, Any]:
+    """
+    Inspect one PDF. Runs in a worker process, so it only takes and returns plain data.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+
+    Returns:
+        dict: Catalog row for the file
+    """
+    from page_window import PageWindowReader
+    from pdf_utils import MIN_PAGE_TEXT_CHARS
+    from upload_cache import sha256_file
+
+    # A file that vanished or became unreadable since it was listed is recorded as corrupt
+    # (size, mtime and hash 0/empty, so it is rescanned once it is readable again)
+    entry = {"path": os.path.abspath(pdf_path), "size": 0, "mtime": 0.0, "sha256": "",
+             "page_count": None, "has_text_layer": None, "status": STATUS_OK, "error": None,
+             "scanned_at": time.time()}
+    try:
+        stat = os.stat(pdf_path)
+        entry.update(size=stat.st_size, mtime=stat.st_mtime, sha256=sha256_file(pdf_path))
+        with PageWindowReader(pdf_path) as window:
+            if window.encrypted:
+                entry["status"] = STATUS_ENCRYPTED
+                entry["error"] = "Encrypted with a password"
+                return entry
+            entry["page_count"] = window.page_count
+            if not entry["page_count"]:
+                raise ValueError("PDF has no pages")
+            has_text = False
+            for i in range(min(TEXT_LAYER_SAMPLE_PAGES, entry["page_count"])):
+                if len((window.page(i).extract_text() or "").strip()) >= MIN_PAGE_TEXT_CHARS:
+                    has_text = True
+                    break
+            entry["has_text_layer"] = has_text
+    except Exception as e:
+        entry["status"] = STATUS_CORRUPT
+        entry["error"] = str(e) or e.__class__.__name__
+    return entry
+
+
+class CorpusCatalog:
+    def __init__(self, db_path: str = CATALOG_PATH) -> None:
+        """
+        Open (creating if needed) the catalog database.
+
+        Args:
+            db_path (str): Path to the SQLite database file
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " page_count INTEGER,"
+            " has_text_layer INTEGER,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " scanned_at REAL NOT NULL,"
+            " extract_seconds REAL)")
+        self._conn.commit()
+
+    def get(self, pdf_path: str) -> Optional[Dict[str, Any]]:
+        """Return the catalog row for a file, or None if it has not been scanned."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM files WHERE path = ?",
+                                     (os.path.abspath(pdf_path),)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def is_current(self, pdf_path: str) -> bool:
+        """Return True if the file was scanned and has not changed since (same size and mtime)."""
+        entry = self.get(pdf_path)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(pdf_path)
+        except OSError:
+            return False
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        """Store a scan result, keeping the recorded extraction time if the content is unchanged."""
+        with self._lock:
+            old = self._conn.execute("SELECT sha256, extract_seconds FROM files WHERE path = ?",
+                                     (entry["path"],)).fetchone()
+            extract_seconds = old[1] if old and old[0] == entry["sha256"] else None
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO files ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                tuple(entry.get(column) for column in _COLUMNS[:-1]) + (extract_seconds,))
+            self._conn.commit()
+
+    def scan(self, pdf_paths: Iterable[str], workers: int = 4) -> Dict[str, Dict[str, Any]]:
+        """
+        Scan files that are new or changed, in parallel, and return the rows for all of them.
+
+        Args:
+            pdf_paths: Files to scan
+            workers (int): Number of worker processes
+
+        Returns:
+            dict: Maps each given path to its catalog row
+        """
+        pdf_paths = list(dict.fromkeys(pdf_paths))
+        stale = [path for path in pdf_paths if not self.is_current(path)]
+        if stale:
+            print(f"Scanning {len(stale)} file(s) ({len(pdf_paths) - len(stale)} unchanged since the last scan)")
+            if workers > 1 and len(stale) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for entry in executor.map(scan_file, stale, chunksize=max(1, len(stale) // (workers * 4))):
+                        self.put(entry)
+            else:
+                for path in stale:
+                    self.put(scan_file(path))
+        return {path: self.get(path) for path in pdf_paths}
+
+    def record_duration(self, pdf_path: str, seconds: float) -> None:
+        """Record how long extracting a file took, for later run-time estimates."""
+        with self._lock:
+            self._conn.execute("UPDATE files SET extract_seconds = ? WHERE path = ?",
+                               (seconds, os.path.abspath(pdf_path)))
+            self._conn.commit()
+
+    def seconds_per_document(self) -> Optional[float]:
+        """Return the mean recorded extraction time, or None if nothing has been timed yet."""
+        with self._lock:
+            mean, count = self._conn.execute(
+                "SELECT AVG(extract_seconds), COUNT(extract_seconds) FROM files "
+                "WHERE extract_seconds IS NOT NULL").fetchone()
+        return mean if count else None
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def order_largest_first(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sort catalog rows by page count, then size, largest first."""
+    return sorted(entries, key=lambda entry: (entry["page_count"] or 0, entry["size"]), reverse=True)
+
+
+def estimate_run_seconds(entries: List[Dict[str, Any]], workers: int,
+                         seconds_per_document: Optional[float] = None) -> float:
+    """
+    Estimate the wall-clock time for extracting the given files.
+
+    Documents are assumed to take the mean recorded time (or DEFAULT_SECONDS_PER_DOCUMENT),
+    with files that were timed before using their own time.
+
+    Args:
+        entries (list): Catalog rows of the files to process
+        workers (int): Number of concurrent workers
+        seconds_per_document (float, optional): Mean time per document
+
+    Returns:
+        float: Estimated seconds
+    """
+    if not entries:
+        return 0.0
+    default = seconds_per_document or DEFAULT_SECONDS_PER_DOCUMENT
+    durations = [entry["extract_seconds"] or default for entry in entries]
+    # With largest-first scheduling the run takes about the total spread over the
+    # workers, but never less than its longest single document
+    return max(sum(durations) / max(1, workers), max(durations))
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as e.g. '1h 05m' or '3m 20s'."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def main():
+    """Command line interface for scanning a folder into the catalog and reporting on it."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Scan PDFs into the corpus catalog used by main.py --scan',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  # Scan a folder (only new or changed files are parsed) and report:
+  python corpus_catalog.py scan ./my-documents
+
+  # Estimate the run time with 8 workers:
+  python corpus_catalog.py scan ./my-documents --workers 8
+        '''
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    scan_parser = subparsers.add_parser('scan', help='Scan a folder into the catalog')
+    scan_parser.add_argument('folder', help='Folder containing PDF files')
+    scan_parser.add_argument('--workers', type=int, default=4, help='Worker processes (default: 4)')
+    parser.add_argument('--catalog', default=CATALOG_PATH,
+                        help=f'Path to the catalog database (default: {CATALOG_PATH})')
+    args = parser.parse_args()
+
+    pdf_paths = sorted(os.path.join(args.folder, name) for name in os.listdir(args.folder)
+                       if name.lower().endswith('.pdf'))
+    catalog = CorpusCatalog(args.catalog)
+    entries = list(catalog.scan(pdf_paths, workers=args.workers).values())
+    ok = [entry for entry in entries if entry["status"] == STATUS_OK]
+    print(f"{len(entries)} file(s): {len(ok)} ok, "
+          f"{sum(1 for entry in entries if entry['status'] == STATUS_ENCRYPTED)} encrypted, "
+          f"{sum(1 for entry in entries if entry['status'] == STATUS_CORRUPT)} corrupt")
+    print(f"{sum(entry['page_count'] or 0 for entry in ok)} page(s), "
+          f"{sum(entry['size'] for entry in ok) / 1048576:.1f} MB, "
+          f"{sum(1 for entry in ok if not entry['has_text_layer'])} file(s) without a text layer")
+    for entry in entries:
+        if entry["status"] != STATUS_OK:
+            print(f"  {entry['status']}: {entry['path']} ({entry['error']})")
+    print(f"Estimated run time with {args.workers} worker(s): "
+          f"{format_duration(estimate_run_seconds(ok, args.workers, catalog.seconds_per_document()))}")
+    catalog.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Bounded worker pool for running metadata extraction on several documents at once.
+
+Extraction is dominated by network waits (upload + model call), so documents are
+processed on a fixed-size thread pool. Results are funnelled through a queue to a
+single writer thread, which is the only thread that touches the output writer.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from run_journal import RunJournal
+
+# Sentinel placed on the results queue once every job has reported back
+_DONE = object()
+
+
+class ExtractionPool:
+    def __init__(self,
+                 extract_fn: Callable[[str, str], tuple],
+                 write_fn: Callable[..., None],
+                 workers: int = 4,
+                 ordered: bool = False,
+                 journal: Optional[RunJournal] = None) -> None:
+        """
+        Initialize the extraction pool.
+
+        Args:
+            extract_fn: Called as extract_fn(pdf_path, original_format) on a worker thread;
+                returns (metadata, original_path, original_format, ...) like MetadataExtractor.extract_metadata
+            write_fn: Called on the writer thread with the tuple returned by extract_fn unpacked; may
+                return a Future (e.g. from MetadataSink.submit), in which case the file counts as
+                written when the future resolves
+            workers (int): Number of documents to extract concurrently
+            ordered (bool): Write records in input order rather than completion order
+            journal (RunJournal, optional): Journal that written and failed files are recorded in
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.extract_fn = extract_fn
+        self.write_fn = write_fn
+        self.workers = workers
+        self.ordered = ordered
+        self.journal = journal
+        self.processed_files: List[str] = []
+        self.failed_files: List[Tuple[str, str]] = []  # List of (file_path, error_message) tuples
+        self._pending: List[Future] = []
+        self._outcome_lock = threading.Lock()
+        # First exception raised while writing or recording a result; run() re-raises it
+        self._writer_error: Optional[BaseException] = None
+
+    def run(self, jobs: List[Tuple[str, str]]) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+        Extract and write metadata for every job.
+
+        Args:
+            jobs: List of (pdf_path, original_format) tuples
+
+        Returns:
+            Tuple of (processed file paths, list of (file_path, error_message) for failures)
+
+        Raises:
+            Exception: The first error raised by write_fn's bookkeeping or the journal on the
+                writer thread, once every submitted job has been handled
+        """
+        total = len(jobs)
+        results: "queue.Queue" = queue.Queue()
+        # Caps the number of documents submitted but not yet written, so a slow
+        # document at the head of an ordered run cannot make the buffer grow unbounded
+        window = threading.BoundedSemaphore(self.workers * 4)
+
+        writer = threading.Thread(target=self._write_loop, args=(results, window, total),
+                                  name="metadata-writer", daemon=True)
+        writer.start()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract") as executor:
+            for index, (pdf_path, original_format) in enumerate(jobs, 1):
+                window.acquire()
+                executor.submit(self._extract_one, index, total, pdf_path, original_format, results)
+
+        results.put(_DONE)
+        writer.join()
+        # Records handed to a sink resolve once they are durable
+        wait(self._pending)
+        if self._writer_error is not None:
+            raise self._writer_error
+        return self.processed_files, self.failed_files
+
+    def _extract_one(self, index: int, total: int, pdf_path: str, original_format: str,
+                     results: "queue.Queue") -> None:
+        """Run one extraction on a worker thread and hand the outcome to the writer."""
+        print(f"\n[{index}/{total}] Processing: {pdf_path}")
+        try:
+            outcome = self.extract_fn(pdf_path, original_format)
+            results.put((index, pdf_path, outcome, None))
+        except Exception as e:
+            results.put((index, pdf_path, None, str(e)))
+
+    def _write_loop(self, results: "queue.Queue", window: threading.BoundedSemaphore, total: int) -> None:
+        """Consume extraction outcomes and write them, optionally restoring input order."""
+        pending: Dict[int, tuple] = {}
+        next_index = 1
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            if not self.ordered:
+                self._write_one(item, total, window)
+                continue
+            pending[item[0]] = item
+            while next_index in pending:
+                self._write_one(pending.pop(next_index), total, window)
+                next_index += 1
+
+    def _write_one(self, item: tuple, total: int, window: threading.BoundedSemaphore) -> None:
+        """Handle one result on the writer thread, keeping the thread alive if that raises."""
+        try:
+            self._handle_result(item, total)
+        except Exception as e:
+            # Without the writer thread nothing releases the window and run() would block forever
+            self._note_writer_error(item[1], e)
+        finally:
+            window.release()
+
+    def _note_writer_error(self, pdf_path: str, error: BaseException) -> None:
+        """Count the file as failed and keep the first writer-side exception for run() to raise."""
+        print(f"Error recording the result for {pdf_path}: {str(error)}")
+        with self._outcome_lock:
+            if self._writer_error is None:
+                self._writer_error = error
+            if pdf_path not in self.processed_files:
+                self.failed_files.append((pdf_path, str(error)))
+
+    def _handle_result(self, item: tuple, total: int) -> None:
+        """Write a successful extraction or record the failure."""
+        index, pdf_path, outcome, error = item
+        if error is None:
+            metadata, original_path = outcome[0], outcome[1]
+            print(f"\n[{index}/{total}] Extracted Metadata:")
+            print(metadata)
+            try:
+                written = self.write_fn(*outcome)
+            except Exception as e:
+                error = str(e)
+            else:
+                if isinstance(written, Future):
+                    # Queued on a group-commit sink; the file counts as written once the record is durable
+                    self._pending.append(written)
+                    written.add_done_callback(
+                        lambda future: self._record_written(index, total, pdf_path, original_path, future))
+                else:
+                    self._record_outcome(index, total, pdf_path, original_path, None)
+                return
+        self._record_outcome(index, total, pdf_path, pdf_path, error)
+
+    def _record_written(self, index: int, total: int, pdf_path: str, original_path: str,
+                        future: Future) -> None:
+        """Record the outcome of a sink write (called on the sink thread, whose callback errors are lost)."""
+        try:
+            self._record_outcome(index, total, pdf_path, original_path, future.exception())
+        except Exception as e:
+            self._note_writer_error(pdf_path, e)
+
+    def _record_outcome(self, index: int, total: int, pdf_path: str, original_path: str,
+                        error: Optional[Any]) -> None:
+        """Note a file as written or failed (called on the writer or sink thread)."""
+        with self._outcome_lock:
+            if error is None:
+                self.processed_files.append(pdf_path)
+                if self.journal:
+                    self.journal.record(pdf_path, "written")
+                print(f"[{index}/{total}] Successfully processed and added to JSON: {original_path}")
+                return
+            error = str(error)
+            print(f"[{index}/{total}] Error processing {pdf_path}: {error}")
+            self.failed_files.append((pdf_path, error))
+            if self.journal:
+                self.journal.record(pdf_path, "failed", error=error)
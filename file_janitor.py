@@ -0,0 +1,246 @@
+"""
+Background deletion of uploaded files.
+
+Every upload leaves a `user_data` file on the OpenAI account. FileJanitor takes the
+deletions off the hot path: extraction enqueues a file_id once it is finished
+with it, and a background thread deletes queued files in bulk with bounded
+concurrency.
+
+Files left behind by earlier runs can be listed and purged with:
+    python file_janitor.py list [--older-than-days N]
+    python file_janitor.py cleanup [--older-than-days N] [--journal PATH ...] [--keep-cached] (--dry-run | --yes)
+
+cleanup only deletes files this tool recorded, in the upload cache or a run
+journal, and never one that an unfinished run (an "uploaded" or "extracted"
+journal entry) may still use.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from config import FILE_PURPOSE, UPLOAD_CACHE_PATH
+
+# Default age filter for the list and cleanup commands, so a run still in progress is left alone
+DEFAULT_OLDER_THAN_DAYS = 1.0
+
+# Sentinel that tells the worker thread to finish
+_STOP = object()
+
+
+def _delete_file(client: Any, file_id: str) -> bool:
+    """Delete one remote file; a file that is already gone counts as deleted."""
+    try:
+        client.files.delete(file_id)
+        return True
+    except Exception as e:
+        if getattr(e, 'status_code', None) == 404:
+            return True
+        print(f"Warning: could not delete file {file_id}: {str(e)}")
+        return False
+
+
+class FileJanitor:
+    def __init__(self, client: Any, concurrency: int = 4, batch_size: int = 50,
+                 upload_cache: Optional[Any] = None) -> None:
+        """
+        Initialize the janitor and start its background thread.
+
+        Args:
+            client: OpenAI client used for deletions
+            concurrency (int): Maximum deletions in flight at once
+            batch_size (int): Maximum file_ids collected into one bulk deletion
+            upload_cache (UploadCache, optional): Cache whose entries are dropped
+                for deleted files, so they are not reused afterwards
+        """
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.upload_cache = upload_cache
+        self.deleted = 0
+        self.failed = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="file-janitor", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, file_id: str) -> None:
+        """Schedule a remote file for deletion."""
+        if file_id:
+            self._queue.put(file_id)
+
+    def close(self) -> None:
+        """Wait for all queued deletions to finish and stop the background thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.deleted or self.failed:
+            print(f"Deleted {self.deleted} uploaded file(s)"
+                  f"{f', {self.failed} could not be deleted' if self.failed else ''}")
+
+    def _run(self) -> None:
+        """Collect queued file_ids into batches and delete each batch concurrently."""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="file-delete") as executor:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if _STOP in batch:
+                    stopping = True
+                    batch = [item for item in batch if item is not _STOP]
+                self._delete_batch(executor, batch)
+
+    def _delete_batch(self, executor: ThreadPoolExecutor, file_ids: List[str]) -> None:
+        """Delete a batch of files and drop them from the upload cache."""
+        for file_id, ok in zip(file_ids, executor.map(lambda fid: _delete_file(self.client, fid), file_ids)):
+            if ok:
+                self.deleted += 1
+                if self.upload_cache:
+                    self.upload_cache.invalidate_file_id(file_id)
+            else:
+                self.failed += 1
+
+
+def iter_remote_files(client: Any, purpose: str = FILE_PURPOSE,
+                      older_than_days: float = 0) -> Iterator[Any]:
+    """
+    Yield remote files page by page, optionally only those older than a cutoff.
+
+    Args:
+        client: OpenAI client
+        purpose (str): File purpose to list
+        older_than_days (float): Only yield files created more than this many days ago
+
+    Yields:
+        FileObject: Matching remote files
+    """
+    cutoff = time.time() - older_than_days * 86400
+    page = client.files.list(purpose=purpose, limit=100)
+    page_number = 1
+    while True:
+        print(f"Listing files: page {page_number} ({len(page.data)} file(s))")
+        for file in page.data:
+            if file.created_at <= cutoff:
+                yield file
+        if not page.has_next_page():
+            return
+        page = page.get_next_page()
+        page_number += 1
+
+
+def recorded_file_ids(upload_cache: Optional[Any], journal_paths: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+    """
+    Collect the file_ids this tool uploaded, from the upload cache and run journals.
+
+    Args:
+        upload_cache (UploadCache, optional): Cache of uploads
+        journal_paths: Run journals (see run_journal.py)
+
+    Returns:
+        Tuple of (recorded file_ids, file_ids of files an unfinished run may still use)
+    """
+    from run_journal import load_journal
+
+    recorded = set(upload_cache.file_ids()) if upload_cache else set()
+    live: Set[str] = set()
+    for path in journal_paths:
+        for entry in load_journal(path).values():
+            if not entry["file_id"]:
+                continue
+            recorded.add(entry["file_id"])
+            # A resumed run reuses the upload of a file that was not written yet
+            if entry["state"] in ("uploaded", "extracted"):
+                live.add(entry["file_id"])
+    return recorded, live
+
+
+def main():
+    """Command line interface for listing and purging orphaned uploads."""
+    import argparse
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    parser = argparse.ArgumentParser(
+        description='List or purge files uploaded by earlier extraction runs',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  # List uploaded files older than a day:
+  python file_janitor.py list --older-than-days 1
+
+  # Show which recorded uploads older than a week would be deleted:
+  python file_janitor.py cleanup --older-than-days 7 --journal output.json.journal --dry-run
+
+  # Delete them, keeping files still referenced by the upload cache:
+  python file_janitor.py cleanup --older-than-days 7 --journal output.json.journal --keep-cached --yes
+        '''
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('list', 'List uploaded files'), ('cleanup', 'Delete uploaded files')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('--purpose', default=FILE_PURPOSE,
+                         help=f'File purpose to match (default: {FILE_PURPOSE})')
+        sub.add_argument('--older-than-days', type=float, default=DEFAULT_OLDER_THAN_DAYS,
+                         help=f'Only match files created more than N days ago (default: {DEFAULT_OLDER_THAN_DAYS:g})')
+        if name == 'cleanup':
+            sub.add_argument('--cache', default=UPLOAD_CACHE_PATH,
+                             help=f'Path to the upload cache database (default: {UPLOAD_CACHE_PATH})')
+            sub.add_argument('--journal', action='append', default=[], metavar='PATH',
+                             help='Run journal whose uploads may be deleted (repeatable); uploads of files '
+                                  'it has not finished are kept')
+            sub.add_argument('--keep-cached', action='store_true',
+                             help='Keep files referenced by the upload cache')
+            sub.add_argument('--concurrency', type=int, default=8,
+                             help='Maximum deletions in flight (default: 8)')
+            sub.add_argument('--dry-run', action='store_true',
+                             help='Show what would be deleted without deleting')
+            sub.add_argument('--yes', action='store_true',
+                             help='Delete without further confirmation (required unless --dry-run)')
+    args = parser.parse_args()
+    if args.command == 'cleanup' and not (args.dry_run or args.yes):
+        parser.error('cleanup deletes files; pass --dry-run to preview or --yes to confirm')
+    if args.older_than_days < 0:
+        parser.error('--older-than-days must not be negative')
+
+    load_dotenv()
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+    if args.command == 'list':
+        total = 0
+        for file in iter_remote_files(client, args.purpose, args.older_than_days):
+            print(f"  {file.id}  {file.filename}  {file.bytes} bytes  created {time.ctime(file.created_at)}")
+            total += 1
+        print(f"{total} file(s)")
+        return
+
+    upload_cache = None
+    if os.path.exists(args.cache):
+        from upload_cache import UploadCache
+        upload_cache = UploadCache(args.cache)
+    recorded, keep = recorded_file_ids(upload_cache, args.journal)
+    if args.keep_cached and upload_cache:
+        keep |= upload_cache.file_ids()
+    candidates = recorded - keep
+    if not candidates:
+        print("No recorded uploads to delete")
+        return
+
+    # Collect IDs first: deleting while paging would invalidate the list cursor
+    file_ids = [f.id for f in iter_remote_files(client, args.purpose, args.older_than_days)
+                if f.id in candidates]
+    if args.dry_run:
+        print(f"Would delete {len(file_ids)} file(s) ({len(keep)} kept as cached or in use)")
+        return
+    janitor = FileJanitor(client, concurrency=args.concurrency, upload_cache=upload_cache)
+    for file_id in file_ids:
+        janitor.enqueue(file_id)
+    janitor.close()
+
+
+if __name__ == '__main__':
+    main()
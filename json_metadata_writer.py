@@ -1,191 +1,559 @@
 """
 Module for writing metadata to JSON files in real-time.
+
+By default records are written straight into the JSON envelope ({metadata,
+created_at, last_updated, total_records}), which stays complete at all times. The
+sidecar index (output_index.py) holds the byte offset where the records array
+ends, so each batch overwrites only the tail of the file: the new records and the
+closing fields. The file is laid out exactly as json.dump(..., indent=2) would
+write it. In journal mode each record is appended as one JSON line to
+`<json_file>.records.jsonl` instead, and compact() folds the lines into the JSON
+file at the end of the run. Lines left behind by an interrupted run are folded in
+the next time the file is opened.
+
+With rotation (rotate_records / rotate_mb), records go to numbered shards
+(output.0001.json, output.0002.json, ...) listed in output.manifest.json; a new
+shard is started once the current one reaches the record count or size limit.
+
+A rerun writes an asset's record again. The duplicates policy decides what
+happens: keep "all" versions (the default), keep the "newest" (the earlier record
+is removed) or keep the "first" (the new record is dropped). Known asset IDs are
+loaded from the sidecar index on the first write. In journal mode replacing is a
+tombstone line plus the new record; the old record leaves the JSON file at compaction.
 """
 
 import json
 import os
-from typing import Dict, List, Any
+import textwrap
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
 from datetime import datetime
 
-from config import get_subject_constraints, validate_subjects
+from output_index import IndexEntry, OutputIndex
+from output_manifest import (manifest_path_for, new_manifest, read_manifest, shard_path_for, shard_paths,
+                             write_manifest)
+from record_builder import DUPLICATE_POLICIES, MetadataRecordBuilder
+from record_reader import iter_records, read_tombstones, tombstone_line
+
+# Start of the JSON envelope, up to the first record
+ENVELOPE_HEAD = '{\n  "metadata": ['
+
+
+def records_path_for(json_file: str) -> str:
+    """Return the path of the append-only records journal for an output JSON file."""
+    return json_file + ".records.jsonl"
+
+
+def _journal_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the records appended to a journal, skipping a line truncated by a crash."""
+    if os.path.exists(path):
+        yield from iter_records(path)
+
+
+def _read_record(json_file: str, offset: int, length: int) -> Dict[str, Any]:
+    """Read one record at a byte offset recorded in the index."""
+    with open(json_file, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.read(length).decode("utf-8"))
+
+
+def _matches(record: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """Return True if the record has every filtered field value."""
+    return all(record.get(field) == value for field, value in filters.items())
+
+
+def serialise_record(record: Dict[str, Any]) -> str:
+    """Return a record as it appears in the envelope written by json.dump(..., indent=2)."""
+    return textwrap.indent(json.dumps(record, indent=2, ensure_ascii=False), "    ")
+
+
+def envelope_tail(total_records: int, created_at: str, last_updated: str) -> str:
+    """Return the end of the JSON envelope, from the close of the records array."""
+    return (("\n  ]" if total_records else "]") + ",\n"
+            f'  "created_at": {json.dumps(created_at)},\n'
+            f'  "last_updated": {json.dumps(last_updated)},\n'
+            f'  "total_records": {total_records}\n}}')
+
 
+def _write_entries(f: Any, records: Iterable[Dict[str, Any]], position: int,
+                   first: bool) -> Tuple[List[IndexEntry], int]:
+    """Write records into the records array at position; return their index entries and the new end."""
+    entries = []
+    for record in records:
+        separator = b"\n" if first else b",\n"
+        first = False
+        data = serialise_record(record).encode("utf-8")
+        f.write(separator + data)
+        entries.append((record.get("asset_id", ""), record.get("original_format", "unknown"),
+                        position + len(separator), len(data)))
+        position += len(separator) + len(data)
+    return entries, position
 
-class JSONMetadataWriter:
-    def __init__(self, json_file: str, profile_path: str = None) -> None:
+
+def _write_envelope(json_file: str, index: OutputIndex, records: Iterable[Dict[str, Any]],
+                    envelope: Dict[str, Any]) -> None:
+    """
+    Write a whole JSON file (replaced atomically) and rebuild its index.
+
+    Args:
+        json_file (str): File to write
+        index (OutputIndex): The file's index
+        records (iterable): Records to write, streamed
+        envelope (dict): created_at and last_updated (default: now); read after the records,
+            so it may be filled in by iter_records as they are read
+    """
+    temp_file = json_file + ".tmp"
+    with open(temp_file, 'wb') as f:
+        head = ENVELOPE_HEAD.encode("utf-8")
+        f.write(head)
+        entries, records_end = _write_entries(f, records, len(head), first=True)
+        now = datetime.now().isoformat()
+        created_at = envelope.get("created_at") or now
+        last_updated = envelope.get("last_updated") or now
+        f.write(envelope_tail(len(entries), created_at, last_updated).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        json_size = f.tell()
+    os.replace(temp_file, json_file)
+    index.rebuild(entries, created_at, last_updated, records_end, json_size)
+
+
+def _copy_without(json_file: str, index: OutputIndex, asset_ids: Set[str]) -> int:
+    """
+    Rewrite a JSON file without the records of some assets, copying the other records byte for byte.
+
+    Returns:
+        int: Number of records removed
+    """
+    summary = index.summary()
+    rows = index.entries()
+    entries: List[IndexEntry] = []
+    temp_file = json_file + ".tmp"
+    with open(json_file, 'rb') as source, open(temp_file, 'wb') as f:
+        head = ENVELOPE_HEAD.encode("utf-8")
+        f.write(head)
+        position = len(head)
+        for asset_id, original_format, offset, length in rows:
+            if asset_id in asset_ids:
+                continue
+            source.seek(offset)
+            separator = b",\n" if entries else b"\n"
+            f.write(separator + source.read(length))
+            entries.append((asset_id, original_format, position + len(separator), length))
+            position += len(separator) + length
+        last_updated = datetime.now().isoformat()
+        f.write(envelope_tail(len(entries), summary["created_at"], last_updated).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        json_size = f.tell()
+    os.replace(temp_file, json_file)
+    index.rebuild(entries, summary["created_at"], last_updated, position, json_size)
+    return len(rows) - len(entries)
+
+
+class JSONMetadataWriter(MetadataRecordBuilder):
+    def __init__(self, json_file: str, profile_path: str = None, journal: bool = False,
+                 rotate_records: int = 0, rotate_mb: float = 0, duplicates: str = "all") -> None:
         """
         Initialize the JSON metadata writer.
 
         Args:
             json_file (str): Path to the JSON file to write to
             profile_path (str): Path to a YAML profile file (used for subject validation)
+            journal (bool): Append records to a JSON-lines journal (O(1) per record) and build
+                the JSON file with compact() instead of rewriting it for every record
+            rotate_records (int): If set, start a new shard once the current one holds this many records
+            rotate_mb (float): If set, start a new shard once the current one reaches this size
+            duplicates (str): One of DUPLICATE_POLICIES: keep all records of an asset, only the
+                newest or only the first
         """
+        super().__init__(profile_path, duplicates)
+        self.output_file = json_file
+        # Asset IDs in the output, loaded on first use (duplicate policies other than "all")
+        self._assets: Optional[Set[str]] = None
+        self.journal = journal
+        self.records_path = records_path_for(json_file)
+        self.rotate_records = rotate_records
+        self.rotate_bytes = int(rotate_mb * 1024 * 1024)
+        self.manifest_path = None
+        self.manifest = None
+        if rotate_records or rotate_mb:
+            # Carry on writing to the last shard of an earlier run
+            self.manifest_path = manifest_path_for(json_file)
+            if os.path.exists(self.manifest_path):
+                self.manifest = read_manifest(self.manifest_path)
+            else:
+                self.manifest = new_manifest()
+            if not self.manifest["shards"]:
+                self.manifest["shards"].append({"file": os.path.basename(shard_path_for(json_file, 1))})
+            json_file = shard_paths(self.manifest_path, self.manifest)[-1]
         self.json_file = json_file
-        self._valid_topics, self._subject_max = get_subject_constraints(profile_path)
+        self._journal_file = None
+        # Journal records per asset and assets tombstoned since the last compaction, for the
+        # journal counts kept in the index (duplicate policies other than "all")
+        self._journal_counts: Dict[str, int] = {}
+        self._tombstoned: Set[str] = set()
+        self.index = OutputIndex(json_file)
         self._initialize_json()
+        if self.manifest is not None:
+            self._update_manifest()
+        # Records from an interrupted journal-mode run belong in the JSON file
+        if os.path.exists(self.records_path):
+            self.compact()
+        else:
+            self._reset_journal_counts()
+        if journal:
+            self._journal_file = open(self.records_path, 'a', encoding='utf-8')
+
+    @property
+    def output_path(self) -> str:
+        """The JSON file, or the manifest of its shards."""
+        return self.manifest_path or self.output_file
 
     def _initialize_json(self) -> None:
-        """Create JSON file with initial structure if it doesn't exist or is empty/invalid."""
-        needs_init = True
+        """Create JSON file with initial structure if it doesn't exist or is empty/invalid, and index it."""
         if os.path.exists(self.json_file) and os.path.getsize(self.json_file) > 0:
+            if self.index.is_current():
+                return
             try:
-                with open(self.json_file, 'r', encoding='utf-8') as f:
-                    json.load(f)
-                needs_init = False
-            except json.JSONDecodeError:
-                pass
+                self._reindex()
+                return
+            except ValueError:
+                if self._repair():
+                    return
 
-        if needs_init:
-            initial_data = {
-                "metadata": [],
-                "created_at": datetime.now().isoformat(),
-                "last_updated": datetime.now().isoformat(),
-                "total_records": 0
-            }
-            with open(self.json_file, 'w', encoding='utf-8') as f:
-                json.dump(initial_data, f, indent=2, ensure_ascii=False)
+        self._rewrite([], {})
 
-    def _clean_text(self, text: str) -> str:
-        """
-        Clean text to remove problematic characters and ensure consistent formatting.
-        
-        Args:
-            text (str): The text to clean
-            
-        Returns:
-            str: Cleaned text
-        """
-        if not text:
-            return ""
-        
-        # Replace problematic Unicode characters with ASCII equivalents
-        replacements = {
-            '—': ':',  # em-dash to colon
-            '–': ':',  # en-dash to colon
-            '"': '"',  # smart quotes to straight quotes
-            '"': '"',
-            ''': "'",  # smart apostrophes to straight apostrophes
-            ''': "'",
-            '…': '...',  # ellipsis to three dots
-            'â€"': ':',  # common encoding issue
-            'â€"': ':',  # common encoding issue
-        }
-        
-        cleaned = text
-        for old, new in replacements.items():
-            cleaned = cleaned.replace(old, new)
-        
-        # Remove any other non-ASCII characters that might cause issues
-        cleaned = ''.join(char for char in cleaned if ord(char) < 128 or char in ';:,.-()')
-        
-        return cleaned.strip()
-
-    def _parse_metadata(self, metadata_str: str) -> Dict[str, Any]:
-        """
-        Parse the metadata JSON string into a dictionary.
+    def _reindex(self) -> None:
+        """Read a file written by an older version or changed by hand, lay it out afresh and index it."""
+        envelope: Dict[str, Any] = {}
+        self._rewrite(iter_records(self.json_file, envelope), envelope)
 
-        Args:
-            metadata_str (str): The metadata JSON string from OpenAI
+    def _repair(self) -> bool:
+        """
+        Restore a file left half-written by a crash, from the records the index knows about.
 
         Returns:
-            Dict[str, Any]: Dictionary of metadata fields and values
-
-        Raises:
-            ValueError: If the JSON is invalid
+            bool: True if the file was repaired
         """
+        summary = self.index.summary()
+        if summary is None or summary["records_end"] > os.path.getsize(self.json_file):
+            return False
+        with open(self.json_file, 'r+b') as f:
+            f.seek(summary["records_end"])
+            f.write(envelope_tail(summary["total_records"], summary["created_at"],
+                                  summary["last_updated"]).encode("utf-8"))
+            f.truncate()
+            json_size = f.tell()
         try:
-            # Parse JSON string into dictionary
-            metadata_dict = json.loads(metadata_str)
-            
-            # Clean all text values and validate subjects
-            cleaned_dict = {}
-            for key, value in metadata_dict.items():
-                if key == 'Subject' and isinstance(value, list):
-                    validated = validate_subjects(value, self._valid_topics, self._subject_max)
-                    if len(validated) < len(value):
-                        print(f"  Subject validation: reduced from {len(value)} to {len(validated)} item(s)")
-                    cleaned_dict[key] = validated
-                elif isinstance(value, str):
-                    cleaned_dict[key] = self._clean_text(value)
-                else:
-                    cleaned_dict[key] = value
-            
-            return cleaned_dict
-
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON format: {str(e)}")
-        except Exception as e:
-            raise ValueError(f"Error parsing metadata: {str(e)}")
+            for _ in iter_records(self.json_file):
+                pass
+        except ValueError:
+            return False
+        self.index.append([], summary["last_updated"], summary["records_end"], json_size)
+        print(f"Repaired {self.json_file} ({summary['total_records']} record(s))")
+        return True
+
+    def _rewrite(self, records: Iterable[Dict[str, Any]], envelope: Dict[str, Any]) -> None:
+        """Write the whole JSON file (replaced atomically) and rebuild the index."""
+        _write_envelope(self.json_file, self.index, records, envelope)
+
+    def _append(self, records: List[Dict[str, Any]], fsync: bool) -> None:
+        """Write records over the tail of the JSON file, then rewrite the tail. Call with the lock held."""
+        if not self.index.is_current():
+            # Changed behind our back
+            self._reindex()
+        summary = self.index.summary()
+        last_updated = datetime.now().isoformat()
+        with open(self.json_file, 'r+b') as f:
+            f.seek(summary["records_end"])
+            entries, records_end = _write_entries(f, records, summary["records_end"],
+                                                       first=summary["total_records"] == 0)
+            f.write(envelope_tail(summary["total_records"] + len(records), summary["created_at"],
+                                  last_updated).encode("utf-8"))
+            f.truncate()
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+            json_size = f.tell()
+        self.index.append(entries, last_updated, records_end, json_size)
+
+    def _write_batch(self, records: List[Dict[str, Any]], fsync: bool) -> None:
+        """Append records to the output, rotating to new shards as they fill. Call with the lock held."""
+        while records:
+            if self.manifest is not None and self._shard_full():
+                self._rotate()
+            count = len(records)
+            if self.manifest is not None:
+                count = self._shard_room(records)
+            self._append(records[:count], fsync)
+            records = records[count:]
+            if self.manifest is not None:
+                self._update_manifest()
+
+    def _shard_room(self, records: List[Dict[str, Any]]) -> int:
+        """Return how many of the records fit in the current shard (at least one)."""
+        summary = self.index.summary()
+        count = len(records)
+        if self.rotate_records:
+            count = min(count, self.rotate_records - summary["total_records"])
+        if self.rotate_bytes:
+            room = self.rotate_bytes - summary["json_size"]
+            for i, record in enumerate(records[:count]):
+                room -= len(serialise_record(record).encode("utf-8")) + 2
+                if room < 0:
+                    count = i + 1
+                    break
+        return max(1, count)
+
+    def _shard_full(self) -> bool:
+        summary = self.index.summary()
+        return bool((self.rotate_records and summary["total_records"] >= self.rotate_records)
+                    or (self.rotate_bytes and summary["json_size"] >= self.rotate_bytes))
+
+    def _rotate(self) -> None:
+        """Start the next shard."""
+        self.index.close()
+        self.json_file = shard_path_for(self.output_file, len(self.manifest["shards"]) + 1)
+        self.manifest["shards"].append({"file": os.path.basename(self.json_file)})
+        self.index = OutputIndex(self.json_file)
+        self._initialize_json()
+        self._update_manifest()
+        print(f"Rotated output to {self.json_file}")
+
+    def _update_manifest(self, position: int = -1, index: Optional[OutputIndex] = None) -> None:
+        """Record a shard's count, size and formats (by default the current shard's) in the manifest."""
+        summary = (index or self.index).summary()
+        self.manifest["shards"][position].update(records=summary["total_records"], bytes=summary["json_size"],
+                                           format_counts=summary["format_counts"])
+        self.manifest["total_records"] = sum(shard["records"] for shard in self.manifest["shards"])
+        self.manifest["last_updated"] = max(self.manifest["last_updated"], summary["last_updated"])
+        write_manifest(self.manifest_path, self.manifest)
 
-    def write_metadata(self, metadata_str: str, pdf_path: str, original_format: str = None) -> None:
+    def _each_index(self) -> Iterator[Tuple[int, str, OutputIndex]]:
+        """Yield (position, path, index) for every shard (or the one file), with current indexes."""
+        paths = shard_paths(self.manifest_path, self.manifest) if self.manifest is not None else [self.json_file]
+        for position, path in enumerate(paths):
+            if path == self.json_file:
+                if not self.index.is_current():
+                    self._reindex()
+                yield position, path, self.index
+            elif os.path.exists(path):
+                index = OutputIndex(path)
+                try:
+                    if not index.is_current():
+                        envelope: Dict[str, Any] = {}
+                        _write_envelope(path, index, iter_records(path, envelope), envelope)
+                    yield position, path, index
+                finally:
+                    index.close()
+
+    def _known_asset(self, asset_id: str) -> bool:
+        """Return True if the output already has a record for the asset. Call with the lock held."""
+        if self._assets is None:
+            self._assets = set()
+            for _, _, index in self._each_index():
+                self._assets |= index.asset_ids()
+            self._assets.update(record.get("asset_id") for record in _journal_records(self.records_path))
+        return asset_id in self._assets
+
+    def _add_assets(self, asset_ids: Iterable[str]) -> None:
+        """Note assets that have been written."""
+        if self._assets is not None:
+            self._assets.update(asset_ids)
+
+    def _drop_assets(self, asset_ids: Set[str]) -> None:
+        """Remove the records of some assets from the JSON file (or shards). Call with the lock held."""
+        for position, path, index in self._each_index():
+            if index.count(asset_ids):
+                _copy_without(path, index, asset_ids)
+                if self.manifest is not None:
+                    self._update_manifest(position, index)
+
+    def write_records(self, records: List[Dict[str, Any]], fsync: bool = False) -> None:
         """
-        Write metadata to JSON file, appending a new record.
+        Append a batch of records with a single write (of the batch and the end of the envelope).
 
         Args:
-            metadata_str (str): The metadata JSON string from OpenAI
-            pdf_path (str): Path to the source PDF file
-            original_format (str): Original file format if the file was converted (e.g., 'docx', 'txt')
+            records (list): Records built by make_record
+            fsync (bool): Force the data to disk before returning
+        """
+        if not records:
+            return
+        with self._lock:
+            replaced: Set[str] = set()
+            if self.duplicates != "all":
+                records, replaced = self._resolve_duplicates(records)
+            if self._journal_file:
+                # One line per record, after a tombstone for a record it replaces; the JSON
+                # file is brought up to date by compact()
+                self._journal_file.write("".join(
+                    (tombstone_line(record["asset_id"]) if record["asset_id"] in replaced else "")
+                    + json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                self._journal_file.flush()
+                if fsync:
+                    os.fsync(self._journal_file.fileno())
+                self._count_journal(records, replaced)
+            else:
+                if replaced:
+                    self._drop_assets(replaced)
+                self._write_batch(records, fsync)
+
+    def _count_journal(self, records: List[Dict[str, Any]], replaced: Set[str]) -> None:
+        """Update the journal counts in the index after appending records and tombstones. Call with the lock held."""
+        summary = self.index.summary()
+        journal_records = summary.get("journal_records", 0) + len(records)
+        journal_replaced = summary.get("journal_replaced", 0)
+        if replaced:
+            # A second tombstone for an asset hides no more of the JSON output than the first
+            newly = replaced - self._tombstoned
+            if newly:
+                journal_replaced += sum(index.count(newly) for _, _, index in self._each_index())
+                self._tombstoned |= newly
+            for asset_id in replaced:
+                journal_records -= self._journal_counts.pop(asset_id, 0)
+        if self.duplicates != "all":
+            for record in records:
+                self._journal_counts[record["asset_id"]] = self._journal_counts.get(record["asset_id"], 0) + 1
+        self.index.set_journal_counts(journal_records, journal_replaced)
 
-        Raises:
-            ValueError: If the metadata cannot be parsed or is invalid
+    def _reset_journal_counts(self) -> None:
+        """Note that the journal is empty. Call with the lock held (or before the writer is shared)."""
+        self._journal_counts.clear()
+        self._tombstoned.clear()
+        summary = self.index.summary()
+        if summary.get("journal_records") or summary.get("journal_replaced"):
+            self.index.set_journal_counts(0, 0)
+
+    def compact(self) -> int:
         """
-        try:
-            # Parse the metadata
-            metadata_dict = self._parse_metadata(metadata_str)
+        Fold the records appended to the journal into the JSON file and empty the journal.
 
-            # Create a complete record with additional metadata
-            record = {
-                "asset_id": os.path.basename(pdf_path),
-                "file_path": pdf_path,
-                "original_format": original_format or "pdf",
-                "extracted_at": datetime.now().isoformat(),
-                "metadata": metadata_dict
-            }
+        The records are appended in place; a crash part way through is repaired from
+        the index the next time the file is opened.
 
-            # Read existing data
-            with open(self.json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        Returns:
+            int: Number of records folded in
+        """
+        with self._lock:
+            if self._journal_file:
+                self._journal_file.flush()
+            pending = list(_journal_records(self.records_path))
+            tombstones = read_tombstones(self.records_path) if os.path.exists(self.records_path) else {}
+            # Counted in the index from here on; a crash before the journal is emptied
+            # leaves it to be compacted again on the next open
+            self._reset_journal_counts()
+            if tombstones:
+                self._drop_assets(set(tombstones))
+            if pending:
+                self._write_batch(pending, fsync=True)
+            if self._journal_file:
+                self._journal_file.truncate(0)
+                self._journal_file.seek(0)
+            elif os.path.exists(self.records_path):
+                os.remove(self.records_path)
+        if pending:
+            print(f"Compacted {len(pending)} record(s) into {self.json_file}")
+        return len(pending)
 
-            # Add new record
-            data["metadata"].append(record)
-            data["last_updated"] = datetime.now().isoformat()
-            data["total_records"] = len(data["metadata"])
+    def close(self) -> None:
+        """Compact the journal (in journal mode) and close it and the index."""
+        if self._journal_file:
+            self.compact()
+            self._journal_file.close()
+            self._journal_file = None
+            os.remove(self.records_path)
+        self.index.close()
 
-            # Write back to file
-            with open(self.json_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+    def iter_records(self, **filters: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Stream all metadata records, including records not yet compacted, in constant memory.
 
-            print(f"Metadata written to JSON for: {pdf_path}")
+        Args:
+            **filters: Values of asset_id, file_path or original_format to match exactly
 
-        except Exception as e:
-            print(f"Error writing metadata for {pdf_path}: {str(e)}")
-            raise
+        Yields:
+            dict: Records in the order they were written
+        """
+        self._check_filters(filters)
+        tombstones = read_tombstones(self.records_path) if os.path.exists(self.records_path) else {}
+        for record in iter_records(self.manifest_path or self.json_file):
+            if record.get("asset_id") not in tombstones and _matches(record, filters):
+                yield record
+        for record in _journal_records(self.records_path):
+            if _matches(record, filters):
+                yield record
 
     def get_records(self) -> List[Dict[str, Any]]:
         """
-        Get all metadata records from the JSON file.
+        Get all metadata records from the JSON file, including records not yet compacted.
+        Prefer iter_records, which streams.
 
         Returns:
             List[Dict[str, Any]]: List of all metadata records
         """
         try:
-            with open(self.json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data.get("metadata", [])
+            return list(self.iter_records())
         except Exception as e:
             print(f"Error reading JSON file: {str(e)}")
             return []
 
-    def get_record_count(self) -> int:
+    def get_record(self, asset_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the most recently written record for an asset, reading only that record from the file.
+
+        Args:
+            asset_id (str): The asset ID (file name) of the record
+
+        Returns:
+            dict: The record, or None if there is none
+        """
+        latest = None
+        for record in _journal_records(self.records_path):
+            if record.get("asset_id") == asset_id:
+                latest = record
+        if latest is not None:
+            return latest
+        if os.path.exists(self.records_path) and asset_id in read_tombstones(self.records_path):
+            return None
+        with self._lock:
+            if not self.index.is_current():
+                self._reindex()
+            location = self.index.lookup(asset_id)
+            if location is not None:
+                return _read_record(self.json_file, *location)
+            # Earlier shards, newest first
+            for shard in reversed(shard_paths(self.manifest_path, self.manifest)[:-1] if self.manifest else []):
+                index = OutputIndex.open_current(shard)
+                if index is None:
+                    continue
+                location = index.lookup(asset_id)
+                index.close()
+                if location is not None:
+                    return _read_record(shard, *location)
+            return None
+
+    def get_record_count(self, original_format: Optional[str] = None) -> int:
         """
-        Get the total number of records in the JSON file.
+        Get the total number of records in the JSON file, including records not yet compacted.
+
+        In journal mode the records waiting in the journal, and the records their tombstones
+        replace, are counted in the index as they are written, so the journal is not read.
+
+        Args:
+            original_format (str, optional): Only count records of this format (reads the records)
 
         Returns:
             int: Number of records
         """
+        if original_format is not None:
+            return sum(1 for _ in self.iter_records(original_format=original_format))
         try:
-            with open(self.json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data.get("total_records", 0)
+            with self._lock:
+                if not self.index.is_current():
+                    self._reindex()
+                summary = self.index.summary()
+                total = self.manifest["total_records"] if self.manifest is not None else summary["total_records"]
+            return total - summary.get("journal_replaced", 0) + summary.get("journal_records", 0)
         except Exception as e:
             print(f"Error reading JSON file: {str(e)}")
             return 0
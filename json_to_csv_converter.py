@@ -3,9 +3,12 @@ Utility module for converting JSON metadata files to CSV format.
 """
 
 import csv
-import json
 import os
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional
+
+from output_index import OutputIndex
+from output_manifest import is_manifest, read_manifest, resolve_output, shard_paths
+from record_reader import iter_records
 
 
 class JSONToCSVConverter:
@@ -40,12 +43,15 @@ class JSONToCSVConverter:
         self.dynamic_fields: List[str] = []
         self.field_max_counts: Dict[str, int] = {}
 
-    def _analyze_json_data(self, records: List[Dict[str, Any]]) -> None:
+    def _analyze_json_data(self, records: Iterable[Dict[str, Any]]) -> int:
         """
         Analyze JSON records to determine the maximum number of values for each field.
         
         Args:
-            records: List of metadata records from JSON
+            records: Metadata records from JSON (streamed)
+
+        Returns:
+            int: Number of records analyzed
         """
         self.field_max_counts = {}
         
@@ -54,7 +60,9 @@ class JSONToCSVConverter:
             self.field_max_counts[field] = 1
         
         # Analyze each record to find maximum array sizes
+        count = 0
         for record in records:
+            count += 1
             metadata = record.get("metadata", {})
             
             # Map old field names to new dc: field names
@@ -98,6 +106,7 @@ class JSONToCSVConverter:
                 # Multiple columns with clean repetition (no numbers)
                 for i in range(max_count):
                     self.dynamic_fields.append(field)
+        return count
     
     def _get_field_value(self, metadata_dict: Dict[str, Any], field_name: str, index: int = 0) -> str:
         """
@@ -199,14 +208,14 @@ class JSONToCSVConverter:
 
         return result
 
-    def _write_csv_with_duplicate_headers(self, csv_file: str, records: List[Dict[str, Any]], 
+    def _write_csv_with_duplicate_headers(self, csv_file: str, records: Iterable[Dict[str, Any]], 
                                         original_format_override: Optional[str] = None) -> None:
         """
         Write CSV file with duplicate column headers (clean repetition without numbers).
         
         Args:
             csv_file: Path to the output CSV file
-            records: List of metadata records
+            records: Metadata records (streamed)
             original_format_override: Override format for all records
         """
         with open(csv_file, 'w', newline='', encoding='utf-8') as csvfile:
@@ -284,26 +293,20 @@ class JSONToCSVConverter:
             original_format_override (str, optional): Override format for all records
         """
         try:
-            # Read JSON data
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            records = data.get("metadata", [])
-            if not records:
+            # Two streaming passes over the file, so memory does not grow with its size:
+            # analyze the data to determine dynamic columns, then write the rows
+            print("Analyzing data to determine column structure...")
+            count = self._analyze_json_data(iter_records(json_file))
+            if not count:
                 print("No metadata records found in JSON file")
                 return
 
-            print(f"Converting {len(records)} records from JSON to CSV")
-
-            # Analyze the data to determine dynamic columns
-            print("Analyzing data to determine column structure...")
-            self._analyze_json_data(records)
-            
+            print(f"Converting {count} records from JSON to CSV")
             print(f"Dynamic columns created: {len(self.dynamic_fields)}")
             print(f"Field max counts: {self.field_max_counts}")
 
             # Use custom CSV writer to handle duplicate headers
-            self._write_csv_with_duplicate_headers(csv_file, records, original_format_override)
+            self._write_csv_with_duplicate_headers(csv_file, iter_records(json_file), original_format_override)
 
             print(f"Successfully converted JSON to CSV with dynamic columns: {csv_file}")
 
@@ -315,28 +318,46 @@ class JSONToCSVConverter:
         """
         Get a summary of the JSON metadata file.
 
+        Read from the sidecar index (or, for a sharded output, the manifest) when it is
+        up to date, without parsing the file.
+
         Args:
-            json_file (str): Path to the JSON metadata file
+            json_file (str): Path to the JSON metadata file, or the manifest of a sharded output
 
         Returns:
             Dict[str, Any]: Summary information
         """
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        json_file = resolve_output(json_file)
+        if is_manifest(json_file):
+            return self._get_manifest_summary(json_file)
+
+        index = OutputIndex.open_current(json_file)
+        if index is not None:
+            indexed = index.summary()
+            index.close()
+            return {
+                "total_records": indexed["total_records"],
+                "created_at": indexed["created_at"],
+                "last_updated": indexed["last_updated"],
+                "format_counts": indexed["format_counts"],
+                "file_size": os.path.getsize(json_file)
+            }
 
-            records = data.get("metadata", [])
+        try:
+            envelope: Dict[str, Any] = {}
             
             # Count formats
+            total_records = 0
             format_counts = {}
-            for record in records:
+            for record in iter_records(json_file, envelope):
+                total_records += 1
                 fmt = record.get("original_format", "unknown")
                 format_counts[fmt] = format_counts.get(fmt, 0) + 1
 
             summary = {
-                "total_records": len(records),
-                "created_at": data.get("created_at"),
-                "last_updated": data.get("last_updated"),
+                "total_records": total_records,
+                "created_at": envelope.get("created_at"),
+                "last_updated": envelope.get("last_updated"),
                 "format_counts": format_counts,
                 "file_size": os.path.getsize(json_file)
             }
@@ -347,6 +368,34 @@ class JSONToCSVConverter:
             print(f"Error reading JSON file: {str(e)}")
             return {}
 
+    def _get_manifest_summary(self, manifest_file: str) -> Dict[str, Any]:
+        """Summarise a sharded output from its manifest, summarising any shard that has changed since."""
+        try:
+            manifest = read_manifest(manifest_file)
+        except Exception as e:
+            print(f"Error reading manifest: {str(e)}")
+            return {}
+
+        summary = {
+            "total_records": 0,
+            "created_at": manifest.get("created_at"),
+            "last_updated": manifest.get("last_updated"),
+            "format_counts": {},
+            "file_size": 0,
+            "shards": len(manifest["shards"])
+        }
+        for shard, path in zip(manifest["shards"], shard_paths(manifest_file, manifest)):
+            if os.path.exists(path) and os.path.getsize(path) == shard.get("bytes"):
+                shard_summary = {"total_records": shard["records"], "format_counts": shard["format_counts"],
+                                 "file_size": shard["bytes"]}
+            else:
+                shard_summary = self.get_json_summary(path)
+            summary["total_records"] += shard_summary.get("total_records", 0)
+            summary["file_size"] += shard_summary.get("file_size", 0)
+            for fmt, count in shard_summary.get("format_counts", {}).items():
+                summary["format_counts"][fmt] = summary["format_counts"].get(fmt, 0) + count
+        return summary
+
 
 def main():
     """Command line interface for JSON to CSV conversion."""
@@ -368,7 +417,7 @@ Examples:
         '''
     )
 
-    parser.add_argument('json_file', help='Path to the JSON metadata file')
+    parser.add_argument('json_file', help='Path to the JSON metadata file (or the manifest of a sharded output)')
     parser.add_argument('csv_file', nargs='?', help='Path to the output CSV file')
     parser.add_argument('--format', help='Override format for all records')
     parser.add_argument('--summary', action='store_true', help='Show JSON file summary only')
@@ -384,6 +433,8 @@ Examples:
         print(f"  Created at: {summary.get('created_at', 'Unknown')}")
         print(f"  Last updated: {summary.get('last_updated', 'Unknown')}")
         print(f"  File size: {summary.get('file_size', 0)} bytes")
+        if 'shards' in summary:
+            print(f"  Shards: {summary['shards']}")
         
         format_counts = summary.get('format_counts', {})
         if format_counts:
@@ -6,9 +6,48 @@ Extracts metadata following conventions defined in a YAML profile (see profiles/
 import argparse
 import sys
 import os
+import json
+import time
+from concurrent.futures import Future
 from typing import List, Optional, Set, Tuple
 from metadata_extractor import MetadataExtractor
-from json_metadata_writer import JSONMetadataWriter
+from json_metadata_writer import DUPLICATE_POLICIES, JSONMetadataWriter
+from sqlite_metadata_store import SQLiteMetadataStore
+from metadata_sink import DEFAULT_FLUSH_MS, DEFAULT_FLUSH_RECORDS, FSYNC_POLICIES, MetadataSink
+from extraction_pool import ExtractionPool
+from rate_limiter import AdaptiveRateLimiter
+from batch_runner import BatchRunner
+from upload_cache import UploadCache
+from file_janitor import FileJanitor
+from result_cache import ResultCache
+from run_journal import RunJournal, journal_path_for, unfinished_files
+from near_duplicates import (DEFAULT_REUSE_THRESHOLD, DEFAULT_SOURCE_WAIT, DEFAULT_VERIFY_THRESHOLD, REUSED,
+                             VERIFY_CHAR_BUDGET, adapt_metadata, plan_near_duplicates, verification_prompt)
+from pdf_utils import extract_page_text
+from corpus_catalog import (STATUS_OK, CorpusCatalog, estimate_run_seconds, format_duration,
+                            order_largest_first)
+from page_renderer import PageRenderer
+from config import (CATALOG_PATH, IMAGE_INPUT_JPEG_QUALITY, IMAGE_INPUT_MAX_EDGE, INPUT_MODES, PARTIAL_PDF_SPILL_MB,
+                    RESULT_CACHE_MAX_MB, RESULT_CACHE_PATH, TEXT_INPUT_CHAR_BUDGET, UPLOAD_CACHE_PATH,
+                    get_upload_optimisation)
+
+
+def parse_pages_option(value: str) -> int:
+    """Parse --pages auto:N and return N."""
+    mode, _, count = value.partition(':')
+    if mode != 'auto' or not count.isdigit() or int(count) < 1:
+        raise argparse.ArgumentTypeError(f"expected auto:N with N >= 1, got {value!r}")
+    return int(count)
+
+
+def parse_store_option(value: str) -> Optional[str]:
+    """Parse --store json|sqlite:PATH and return the SQLite path (None for the JSON file)."""
+    if value == 'json':
+        return None
+    backend, _, path = value.partition(':')
+    if backend != 'sqlite' or not path:
+        raise argparse.ArgumentTypeError(f"expected json or sqlite:PATH, got {value!r}")
+    return path
 
 
 def create_parser() -> argparse.ArgumentParser:
@@ -38,9 +77,42 @@ Examples:
   # or
   python main.py -d path/to/pdf/directory -l 2 -j output.json
 
+  # Send the 6 most informative pages of each PDF instead of a fixed first/last window:
+  python main.py --folder path/to/pdf/directory --pages auto:6 -j output.json
+
   # With custom context for the extraction prompt:
   python main.py --folder path/to/pdf/directory -j output.json --context-prompt "What follows is a series of photos showing Chartered Accountant's Hall"
 
+  # Extract 8 documents at a time, keeping output records in input order:
+  python main.py --folder path/to/pdf/directory -j output.json --workers 8 --ordered
+
+  # Send the PDF text layer instead of uploading the file (born-digital documents):
+  python main.py --folder path/to/pdf/directory -j output.json --input-mode text
+
+  # Send photo and scan pages as downscaled JPEGs instead of uploading the PDF wrapper:
+  python main.py --folder path/to/pdf/directory -j output.json --input-mode image --image-max-edge 1280
+
+  # Write records to an SQLite store instead of the JSON file:
+  python main.py --folder path/to/pdf/directory -j run.json --store sqlite:metadata.db
+
+  # Large run: append records as JSON lines and build the JSON file once at the end:
+  python main.py --folder path/to/pdf/directory -j output.json --workers 8 --append-records
+
+  # Split the output into shards of 5,000 records (output.0001.json, ...) with output.manifest.json:
+  python main.py --folder path/to/pdf/directory -j output.json --rotate-records 5000
+
+  # Rerun on a folder, replacing the records of files already in the output:
+  python main.py --folder path/to/pdf/directory -j output.json --duplicates newest
+
+  # Resume an interrupted run, skipping files that were already written:
+  python main.py --folder path/to/pdf/directory -j output.json --resume
+
+  # Scan the inputs first: skip encrypted/corrupt files, process the largest first, estimate run time:
+  python main.py --folder path/to/pdf/directory -j output.json --workers 8 --scan
+
+  # Submit a large backlog through the Batch API (rerun the same command to resume):
+  python main.py --folder path/to/pdf/directory -j output.json --batch
+
   # Disable subject classification (Subject field will be empty):
   python main.py --folder path/to/pdf/directory -j output.json --no-subjects
 
@@ -64,9 +136,22 @@ Examples:
                         type=int,
                         default=0,
                         help='Number of pages to include from the end (default: 0, meaning no limit)')
+    parser.add_argument('--pages',
+                        type=parse_pages_option,
+                        default=0,
+                        metavar='auto:N',
+                        help='Send the N most informative pages (scored by text, title-like lines and image '
+                             'coverage) instead of the --first/--last window')
     parser.add_argument('--json-file', '-j',
                         required=True,
-                        help='JSON file to write metadata to')
+                        help='JSON file to write metadata to (with --store sqlite:PATH, only names the run journal '
+                             'and batch state files)')
+    parser.add_argument('--store',
+                        type=parse_store_option,
+                        default=None,
+                        metavar='json|sqlite:PATH',
+                        help='Where records are written: the --json-file (default) or an SQLite store with indexed '
+                             'columns (export it with: python sqlite_metadata_store.py export PATH output.json)')
 
     parser.add_argument('--context-prompt',
                         type=str,
@@ -83,6 +168,167 @@ Examples:
                         help='Path to a YAML profile file (default: profiles/icaew.yaml). '
                              'Can be a filename inside profiles/ (e.g., "default") or a full path.')
 
+    parser.add_argument('--input-mode',
+                        choices=INPUT_MODES,
+                        default='file',
+                        help='"file" uploads the PDF; "text" sends the locally extracted text layer instead and '
+                             'falls back to uploading for pages without one; "image" sends image-only pages (photos, '
+                             'scans) rendered to downscaled JPEGs and falls back to uploading for other pages '
+                             '(default: file; batch mode always uploads)')
+    parser.add_argument('--text-budget',
+                        type=int,
+                        default=TEXT_INPUT_CHAR_BUDGET,
+                        help=f'Maximum characters of page text sent with --input-mode text (default: {TEXT_INPUT_CHAR_BUDGET})')
+    parser.add_argument('--image-max-edge',
+                        type=int,
+                        default=IMAGE_INPUT_MAX_EDGE,
+                        help=f'Longest edge in pixels of pages rendered with --input-mode image (default: {IMAGE_INPUT_MAX_EDGE})')
+    parser.add_argument('--image-quality',
+                        type=int,
+                        default=IMAGE_INPUT_JPEG_QUALITY,
+                        help=f'JPEG quality (1-95) of pages rendered with --input-mode image (default: {IMAGE_INPUT_JPEG_QUALITY})')
+    parser.add_argument('--render-workers',
+                        type=int,
+                        default=None,
+                        help='Processes rendering pages with --input-mode image (default: number of CPUs)')
+    parser.add_argument('--optimise-uploads',
+                        action='store_true',
+                        help='Downsample images and drop embedded files, thumbnails and unused fonts before '
+                             'uploading, using the profile\'s upload_optimisation settings (on by default if the '
+                             'profile enables them)')
+    parser.add_argument('--spill-mb',
+                        type=float,
+                        default=PARTIAL_PDF_SPILL_MB,
+                        help=f'Partial PDFs are built in memory; larger ones spill to a temporary file '
+                             f'(default: {PARTIAL_PDF_SPILL_MB} MB)')
+
+    parser.add_argument('--workers', '-w',
+                        type=int,
+                        default=1,
+                        help='Number of documents to extract concurrently (default: 1)')
+    parser.add_argument('--ordered',
+                        action='store_true',
+                        help='With --workers, write records in input order rather than completion order')
+    parser.add_argument('--append-records',
+                        action='store_true',
+                        help='Append each record to a JSON-lines journal next to the JSON file instead of rewriting '
+                             'the whole file per record, and compact it into the JSON file at the end of the run '
+                             '(for large runs)')
+    parser.add_argument('--rotate-records',
+                        type=int,
+                        default=0,
+                        metavar='N',
+                        help='Split the output into shards of N records (output.0001.json, output.0002.json, ...) '
+                             'listed in output.manifest.json')
+    parser.add_argument('--rotate-mb',
+                        type=float,
+                        default=0,
+                        metavar='MB',
+                        help='Start a new output shard once the current one reaches this size')
+    parser.add_argument('--duplicates',
+                        choices=DUPLICATE_POLICIES,
+                        default='all',
+                        help='When a file already has a record in the output (e.g. a rerun on the same folder): '
+                             'keep all records, replace it with the newest, or keep the first (default: all)')
+    parser.add_argument('--flush-records',
+                        type=int,
+                        default=DEFAULT_FLUSH_RECORDS,
+                        help=f'Write output records in groups of up to this many (default: {DEFAULT_FLUSH_RECORDS})')
+    parser.add_argument('--flush-ms',
+                        type=float,
+                        default=DEFAULT_FLUSH_MS,
+                        help=f'Write a group of records at the latest this many milliseconds after its first '
+                             f'record (default: {DEFAULT_FLUSH_MS})')
+    parser.add_argument('--fsync',
+                        choices=FSYNC_POLICIES,
+                        default='batch',
+                        help='When written records are forced to disk: never ("none"), once per group ("batch") '
+                             'or after every record ("record") (default: batch)')
+    parser.add_argument('--rpm',
+                        type=int,
+                        default=None,
+                        help='Known requests-per-minute quota (otherwise learned from API response headers)')
+    parser.add_argument('--tpm',
+                        type=int,
+                        default=None,
+                        help='Known tokens-per-minute quota (otherwise learned from API response headers)')
+
+    parser.add_argument('--upload-cache',
+                        type=str,
+                        default=UPLOAD_CACHE_PATH,
+                        help='SQLite cache of previous uploads, keyed by content hash '
+                             f'(default: {UPLOAD_CACHE_PATH})')
+    parser.add_argument('--no-upload-cache',
+                        action='store_true',
+                        help='Always upload files, even if identical content was uploaded before')
+
+    parser.add_argument('--result-cache',
+                        type=str,
+                        default=RESULT_CACHE_PATH,
+                        help='SQLite cache of model outputs keyed by document, page window, prompt and model '
+                             f'(default: {RESULT_CACHE_PATH})')
+    parser.add_argument('--result-cache-mb',
+                        type=float,
+                        default=RESULT_CACHE_MAX_MB,
+                        help=f'Maximum size of the result cache in MB; least recently used entries are evicted '
+                             f'(default: {RESULT_CACHE_MAX_MB})')
+    parser.add_argument('--no-result-cache',
+                        action='store_true',
+                        help='Always call the model, even if the same extraction was done before')
+
+    parser.add_argument('--delete-uploads',
+                        action='store_true',
+                        help='Delete uploaded files from the OpenAI account in the background once '
+                             'their metadata has been extracted')
+
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='Resume an interrupted run from the journal next to the JSON file: skip written '
+                             'files and reuse earlier uploads and extractions')
+    parser.add_argument('--new-journal',
+                        action='store_true',
+                        help='Start a new run journal even though the existing one has unfinished files; the '
+                             'old journal is kept as <journal>.<timestamp>')
+
+    parser.add_argument('--scan',
+                        action='store_true',
+                        help='Scan the inputs into the corpus catalog first (size, hash, page count, text layer, '
+                             'encryption): skip encrypted or corrupt files, process the largest files first '
+                             '(unless --ordered) and print a run-time estimate')
+    parser.add_argument('--catalog',
+                        default=CATALOG_PATH,
+                        help=f'Path to the corpus catalog database used by --scan (default: {CATALOG_PATH})')
+
+    parser.add_argument('--near-duplicates',
+                        action='store_true',
+                        help='Find near-duplicate documents (reprints, re-scans, variants) by their text layer '
+                             'before the run and reuse or verify the metadata of the earlier document '
+                             'instead of a full extraction')
+    parser.add_argument('--reuse-threshold',
+                        type=float,
+                        default=DEFAULT_REUSE_THRESHOLD,
+                        help=f'Estimated similarity at or above which metadata is reused without a model call '
+                             f'(default: {DEFAULT_REUSE_THRESHOLD})')
+    parser.add_argument('--verify-threshold',
+                        type=float,
+                        default=DEFAULT_VERIFY_THRESHOLD,
+                        help=f'Estimated similarity at or above which metadata is checked with a cheap text-only '
+                             f'call instead of a full extraction (default: {DEFAULT_VERIFY_THRESHOLD})')
+    parser.add_argument('--near-duplicate-wait',
+                        type=float,
+                        default=DEFAULT_SOURCE_WAIT,
+                        help=f'Seconds a near-duplicate waits for the metadata of the earlier document before it '
+                             f'is extracted in full (default: {DEFAULT_SOURCE_WAIT})')
+
+    parser.add_argument('--batch',
+                        action='store_true',
+                        help='Submit requests through the OpenAI Batch API (half price, results within 24h). '
+                             'Progress is saved next to the JSON file, so rerunning the same command resumes.')
+    parser.add_argument('--poll-interval',
+                        type=float,
+                        default=60.0,
+                        help='Seconds between batch status checks with --batch (default: 60)')
+
     return parser
 
 
@@ -123,10 +369,53 @@ def get_pdf_files(file_path: Optional[str] = None, folder_path: Optional[str] =
     return []
 
 
+def detect_original_format(pdf_path: str) -> str:
+    """
+    Determine the original format of a PDF that may have been converted from another file type.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+
+    Returns:
+        str: Original file extension without the dot (e.g. 'docx'), or 'pdf' for native PDFs
+    """
+    # First, try to read from format mapping file (created by convert_documents.py)
+    mapping_file = os.path.join(os.path.dirname(pdf_path), "format_mapping.json")
+    if os.path.exists(mapping_file):
+        try:
+            with open(mapping_file, 'r') as f:
+                format_mapping = json.load(f)
+            if pdf_path in format_mapping:
+                print(f"Detected original format from mapping: {format_mapping[pdf_path]}")
+                return format_mapping[pdf_path]
+        except Exception as e:
+            print(f"Warning: Could not read format mapping: {e}")
+
+    # Fallback: Check for common original formats that might have been converted
+    base_name = os.path.splitext(pdf_path)[0]
+    supported_formats = ['.docx', '.doc', '.xlsx', '.pptx', '.ppt', '.txt', '.srt', '.vtt', '.jpg', '.jpeg', '.png', '.tiff', '.tif']
+    for ext in supported_formats:
+        original_file = base_name + ext
+        if os.path.exists(original_file):
+            original_format = ext[1:]  # Remove the dot
+            print(f"Detected original format: {original_format}")
+            return original_format
+
+    # If no original format found, assume it's a native PDF
+    return 'pdf'
+
+
 def main() -> None:
     """Main entry point for the metadata extraction tool."""
     parser = create_parser()
     args = parser.parse_args()
+    if args.resume and args.new_journal:
+        parser.error("--resume and --new-journal cannot be used together")
+    if not (args.batch or args.resume or args.new_journal):
+        unfinished = unfinished_files(journal_path_for(args.json_file))
+        if unfinished:
+            parser.error(f"{journal_path_for(args.json_file)} has {unfinished} unfinished file(s) from an earlier "
+                         f"run; pass --resume to continue it or --new-journal to start afresh")
 
     try:
         # Get list of PDF files to process
@@ -149,79 +438,240 @@ def main() -> None:
                     p = candidate
             profile_path = p
 
-        # Initialize metadata extractor and writer
-        extractor = MetadataExtractor(include_subjects=not args.no_subjects, profile_path=profile_path)
-        writer = JSONMetadataWriter(args.json_file, profile_path=profile_path)
+        # API calls go through an adaptive controller: concurrency backs off on 429s
+        # (which are retried) and grows back towards --workers as calls succeed
+        rate_limiter = AdaptiveRateLimiter(initial_concurrency=args.workers,
+                                           max_concurrency=args.workers,
+                                           requests_per_minute=args.rpm,
+                                           tokens_per_minute=args.tpm)
 
-        # Track processed and failed files
-        processed_files: Set[str] = set()
-        failed_files: List[Tuple[str, str]] = []  # List of (file_path, error_message) tuples
+        upload_cache = None if args.no_upload_cache else UploadCache(args.upload_cache)
+        result_cache = None if args.no_result_cache else ResultCache(args.result_cache, args.result_cache_mb)
 
-        # Process each PDF file
-        for index, pdf_path in enumerate(pdf_files, 1):
+        upload_optimisation = get_upload_optimisation(profile_path)
+        if not (args.optimise_uploads or upload_optimisation["enabled"]):
+            upload_optimisation = None
+
+        renderer = None
+        if args.input_mode == "image":
+            renderer = PageRenderer(args.image_max_edge, args.image_quality, workers=args.render_workers)
+
+        # Initialize metadata extractor and writer
+        extractor = MetadataExtractor(include_subjects=not args.no_subjects, profile_path=profile_path,
+                                      rate_limiter=rate_limiter, upload_cache=upload_cache,
+                                      result_cache=result_cache, input_mode=args.input_mode,
+                                      text_char_budget=args.text_budget, spill_threshold_mb=args.spill_mb,
+                                      page_sample=args.pages, upload_optimisation=upload_optimisation,
+                                      renderer=renderer)
+        if args.delete_uploads:
+            extractor.janitor = FileJanitor(extractor.client.client, upload_cache=upload_cache)
+        if args.store:
+            if args.rotate_records or args.rotate_mb:
+                print("--rotate-records/--rotate-mb apply to the JSON file only; ignored with --store")
+            writer = SQLiteMetadataStore(args.store, profile_path=profile_path, duplicates=args.duplicates)
+        else:
+            writer = JSONMetadataWriter(args.json_file, profile_path=profile_path, journal=args.append_records,
+                                        rotate_records=args.rotate_records, rotate_mb=args.rotate_mb,
+                                        duplicates=args.duplicates)
+
+        # Batch mode keeps its own state file; otherwise every state change is journalled
+        journal = None
+        if not args.batch:
+            journal = RunJournal(journal_path_for(args.json_file), resume=args.resume,
+                                 new_journal=args.new_journal)
+            extractor.journal = journal
+            if args.resume:
+                print(f"Resuming from journal: {journal.path}")
+            elif journal.rotated:
+                print(f"Previous journal kept as: {journal.rotated}")
+
+        # Pre-flight scan: drop files that cannot be processed and schedule the largest first
+        catalog = None
+        skipped_files: List[Tuple[str, str]] = []
+        if args.scan:
+            catalog = CorpusCatalog(args.catalog)
+            entries = catalog.scan(pdf_files, workers=os.cpu_count() or 1)
+            usable = []
+            for pdf_path in dict.fromkeys(pdf_files):
+                entry = entries[pdf_path]
+                if entry["status"] == STATUS_OK:
+                    usable.append(pdf_path)
+                else:
+                    print(f"Skipping {entry['status']} file: {pdf_path} ({entry['error']})")
+                    skipped_files.append((pdf_path, f"Skipped ({entry['status']}): {entry['error']}"))
+            if not args.ordered:
+                by_path = {entries[pdf_path]["path"]: pdf_path for pdf_path in usable}
+                usable = [by_path[entry["path"]]
+                          for entry in order_largest_first([entries[pdf_path] for pdf_path in usable])]
+            pdf_files = usable
+            estimate = estimate_run_seconds([entries[pdf_path] for pdf_path in usable], args.workers,
+                                            catalog.seconds_per_document())
+            print(f"{len(usable)} file(s) to process, "
+                  f"{sum(entries[pdf_path]['page_count'] for pdf_path in usable)} page(s); "
+                  f"estimated run time with {args.workers} worker(s): {format_duration(estimate)}")
+
+        # Skip duplicate paths (e.g. the same file passed twice) and, when resuming, written files
+        jobs: List[Tuple[str, str]] = []
+        seen: Set[str] = set()
+        already_written: List[str] = []
+        for pdf_path in pdf_files:
+            if pdf_path in seen:
+                print(f"Skipping already queued file: {pdf_path}")
+                continue
+            seen.add(pdf_path)
+            previous = journal.state_of(pdf_path) if journal else None
+            if previous and previous["state"] == "written":
+                already_written.append(pdf_path)
+                continue
+            jobs.append((pdf_path, detect_original_format(pdf_path)))
+            if journal:
+                journal.queue(pdf_path)
+        if already_written:
+            print(f"Skipping {len(already_written)} file(s) already written in a previous run")
+
+        near_duplicates = None
+        if args.near_duplicates and args.batch:
+            print("--near-duplicates is not supported with --batch; extracting every file")
+        elif args.near_duplicates:
+            # Signatures cover the pages sent to the model, including the --pages auto:N sample
+            near_duplicates = plan_near_duplicates([pdf_path for pdf_path, _ in jobs], args.first, args.last,
+                                                   args.reuse_threshold, args.verify_threshold,
+                                                   workers=os.cpu_count() or 1, sample_pages=args.pages,
+                                                   source_wait=args.near_duplicate_wait)
+            print(f"Found {len(near_duplicates.matches)} near-duplicate(s) of earlier documents")
+
+        def extract_near_duplicate(pdf_path: str) -> Optional[Tuple[str, Optional[dict], dict]]:
+            """Reuse or verify a source document's metadata; None means a full extraction is needed."""
+            source = near_duplicates.source_metadata(pdf_path)
+            if source is None:
+                return None
+            source_path, score, source_metadata = source
+            method = near_duplicates.method_for(score)
+            near_duplicate = {"source": source_path, "similarity": round(score, 3), "method": method}
+            if method == REUSED:
+                try:
+                    metadata = adapt_metadata(source_metadata, source_path, pdf_path, args.first, args.last,
+                                              sample_pages=args.pages)
+                except ValueError:
+                    return None
+                print(f"Reusing metadata of near-duplicate {source_path} (similarity {score:.2f})")
+                usage = None
+            else:
+                document_text = extract_page_text(pdf_path, args.first, args.last, VERIFY_CHAR_BUDGET,
+                                                  sample_pages=args.pages)
+                if document_text is None:
+                    return None
+                print(f"Verifying metadata of near-duplicate {source_path} (similarity {score:.2f})")
+                extractor.client.clear_last_usage()
+                try:
+                    metadata = extractor.client.extract_metadata_from_text(
+                        document_text, context_prompt=verification_prompt(source_metadata, args.context_prompt))
+                finally:
+                    # A failed verification call still counts against the saving
+                    near_duplicates.count_verification_call(extractor.client.last_usage)
+                usage = extractor.client.last_usage
+            if journal:
+                journal.record(pdf_path, "extracted", metadata=metadata, usage=usage,
+                               near_duplicate=near_duplicate)
+            near_duplicates.count(method)
+            return metadata, usage, near_duplicate
+
+        def extract(pdf_path: str, original_format: str) -> Tuple[str, str, str, Optional[dict], Optional[dict]]:
+            if near_duplicates and near_duplicates.is_source(pdf_path):
+                # Near-duplicates of this document wait for its metadata, even if extraction fails
+                metadata = None
+                try:
+                    outcome = extract_document(pdf_path, original_format)
+                    metadata = outcome[0]
+                    return outcome
+                finally:
+                    near_duplicates.publish(pdf_path, metadata)
+            return extract_document(pdf_path, original_format)
+
+        def extract_document(pdf_path: str, original_format: str) -> Tuple[str, str, str, Optional[dict],
+                                                                             Optional[dict]]:
+            previous = journal.state_of(pdf_path) if journal else None
+            if previous and previous["state"] == "extracted" and previous["metadata"]:
+                print(f"Using metadata extracted in a previous run: {pdf_path}")
+                return (previous["metadata"], pdf_path, original_format, previous["usage"],
+                        previous["near_duplicate"])
+            if near_duplicates and pdf_path in near_duplicates.matches:
+                reused = extract_near_duplicate(pdf_path)
+                if reused is not None:
+                    metadata, usage, near_duplicate = reused
+                    return metadata, pdf_path, original_format, usage, near_duplicate
+                near_duplicates.count("fallback")
+            file_id = previous["file_id"] if previous and previous["state"] == "uploaded" else None
+            started = time.monotonic()
+            metadata, original_path, detected_format = extractor.extract_metadata(
+                pdf_path, args.first, args.last, original_format, context_prompt=args.context_prompt,
+                file_id=file_id)
+            if catalog and extractor.client.last_usage is not None:
+                # Only real model calls are timed; cache hits would skew the estimate
+                catalog.record_duration(pdf_path, time.monotonic() - started)
+            # Usage is per thread, so this is the usage of the call just made (None on a cache hit)
+            return metadata, original_path, detected_format, extractor.client.last_usage, None
+
+        def write(metadata: str, original_path: str, detected_format: str, usage: Optional[dict],
+                  near_duplicate: Optional[dict]) -> Future:
+            return sink.submit(metadata, original_path, detected_format, usage=usage,
+                               near_duplicate=near_duplicate)
+
+        if args.batch:
+            # Upload, submit as batches and collect results; state survives restarts
+            state_file = args.json_file + ".batch.json"
+            runner = BatchRunner(extractor, writer, state_file,
+                                 poll_interval=args.poll_interval, workers=args.workers)
+            processed_files, failed_files = runner.run(
+                jobs, args.first, args.last, context_prompt=args.context_prompt)
+        else:
+            # Extract on a bounded pool; a single writer thread owns the JSON writer
+            if args.workers > 1:
+                print(f"Using {args.workers} concurrent workers"
+                      f"{' (writing in input order)' if args.ordered else ''}")
+            # Records are written in groups by the sink, durable per --fsync
+            sink = MetadataSink(writer, flush_records=args.flush_records, flush_ms=args.flush_ms,
+                                fsync=args.fsync)
+            pool = ExtractionPool(extract, write, workers=args.workers, ordered=args.ordered,
+                                  journal=journal)
             try:
-                # Skip if already processed
-                if pdf_path in processed_files:
-                    print(f"\n[{index}/{total_files}] Skipping already processed file: {pdf_path}")
-                    continue
-
-                print(f"\n[{index}/{total_files}] Processing: {pdf_path}")
-                
-                # Determine original format by checking if this was a converted file
-                original_format = None
-                
-                # First, try to read from format mapping file (created by convert_documents.py)
-                mapping_file = os.path.join(os.path.dirname(pdf_path), "format_mapping.json")
-                if os.path.exists(mapping_file):
-                    try:
-                        import json
-                        with open(mapping_file, 'r') as f:
-                            format_mapping = json.load(f)
-                        if pdf_path in format_mapping:
-                            original_format = format_mapping[pdf_path]
-                            print(f"Detected original format from mapping: {original_format}")
-                    except Exception as e:
-                        print(f"Warning: Could not read format mapping: {e}")
-                
-                # Fallback: Check for common original formats that might have been converted
-                if not original_format:
-                    base_name = os.path.splitext(pdf_path)[0]
-                    supported_formats = ['.docx', '.doc', '.xlsx', '.pptx', '.ppt', '.txt', '.srt', '.vtt', '.jpg', '.jpeg', '.png', '.tiff', '.tif']
-                    for ext in supported_formats:
-                        original_file = base_name + ext
-                        if os.path.exists(original_file):
-                            original_format = ext[1:]  # Remove the dot
-                            print(f"Detected original format: {original_format}")
-                            break
-                
-                # If no original format found, assume it's a native PDF
-                if not original_format:
-                    original_format = 'pdf'
-                
-                metadata, original_path, detected_format = extractor.extract_metadata(
-                    pdf_path, args.first, args.last, original_format, context_prompt=args.context_prompt)
-
-                # Print metadata to console
-                print(f"\n[{index}/{total_files}] Extracted Metadata:")
-                print(metadata)
-
-                # Write to JSON using the original path and format
-                writer.write_metadata(metadata, original_path, detected_format)
-                processed_files.add(pdf_path)
-                print(f"[{index}/{total_files}] Successfully processed and added to JSON: {original_path}")
-
-            except Exception as e:
-                error_msg = str(e)
-                print(f"[{index}/{total_files}] Error processing {pdf_path}: {error_msg}")
-                failed_files.append((pdf_path, error_msg))
-                continue  # Continue with next file even if one fails
+                processed_files, failed_files = pool.run(jobs)
+            finally:
+                # Flush what was queued even if the writer thread failed
+                sink.close()
+
+        if extractor.janitor:
+            extractor.janitor.close()
+        if renderer:
+            renderer.close()
+        writer.close()
+        if journal:
+            for pdf_path, error in skipped_files:
+                journal.record(pdf_path, "failed", error=error)
+            journal.close()
+        if catalog:
+            catalog.close()
+        failed_files = skipped_files + failed_files
 
         # Print detailed summary
         print(f"\nProcessing complete:")
         print(f"- Total files found: {total_files}")
         print(f"- Successfully processed: {len(processed_files)}")
+        if already_written:
+            print(f"- Already written in a previous run: {len(already_written)}")
         print(f"- Failed to process: {len(failed_files)}")
-        print(f"- Metadata written to: {args.json_file}")
+        print(f"- Metadata written to: {writer.output_path}")
+        if result_cache:
+            cache_stats = result_cache.stats()
+            print(f"- Result cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es)")
+        if extractor.client.usage.requests:
+            print(f"- Prompt cache: {extractor.client.usage.summary()}")
+        if near_duplicates:
+            print(f"- Near-duplicates: {near_duplicates.summary()}")
+        limiter_stats = rate_limiter.stats()
+        if limiter_stats["rate_limited"]:
+            print(f"- Rate-limited responses: {limiter_stats['rate_limited']} "
+                  f"(final concurrency limit: {limiter_stats['limit']})")
         
         if failed_files:
             print("\nFailed files:")
@@ -72,6 +72,8 @@ USE_ASSET_REF = True  # Set to True to use asset reference numbers in filenames
 ORIGINAL_ONLY = True
 FIRST_PAGES = 6  # Number of pages to include from the start (0 = no limit)
 LAST_PAGES = 4   # Number of pages to include from the end (0 = no limit)
+AUTO_PAGES = 0   # Send the N most informative pages instead of FIRST/LAST_PAGES (0 = off)
+WORKERS = 1  # Number of documents to extract concurrently
 # ===================================
 
 
@@ -168,6 +170,13 @@ Examples:
         help='Disable subject classification (Subject field will always be empty)'
     )
 
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of documents to extract concurrently (overrides hardcoded WORKERS)'
+    )
+
     parser.add_argument(
         '--profile',
         type=str,
@@ -226,6 +235,8 @@ def display_configuration():
     print(f"Original only: {ORIGINAL_ONLY}")
     print(f"First pages: {FIRST_PAGES}")
     print(f"Last pages: {LAST_PAGES}")
+    print(f"Auto pages: {AUTO_PAGES if AUTO_PAGES > 0 else 'off'}")
+    print(f"Workers: {WORKERS}")
     print("==================\n")
 
 
@@ -268,6 +279,7 @@ def main():
     no_subjects = args.no_subjects
     print(f"Subject classification: {'disabled' if no_subjects else 'enabled'}")
     profile = args.profile if args.profile else None
+    workers = args.workers if args.workers else WORKERS
     if profile:
         print(f"Profile: {profile}")
 
@@ -343,6 +355,8 @@ def main():
         extract_cmd.extend(['--first', str(FIRST_PAGES)])
     if LAST_PAGES > 0:
         extract_cmd.extend(['--last', str(LAST_PAGES)])
+    if AUTO_PAGES > 0:
+        extract_cmd.extend(['--pages', f'auto:{AUTO_PAGES}'])
 
     # Add optional context prompt
     if context_prompt:
@@ -354,6 +368,9 @@ def main():
     if profile:
         extract_cmd.extend(['--profile', profile])
 
+    if workers > 1:
+        extract_cmd.extend(['--workers', str(workers)])
+
     if not run_command(extract_cmd, "Metadata extraction"):
         print("Metadata extraction step failed.")
         sys.exit(1)
@@ -2,23 +2,102 @@
 Core metadata extraction functionality.
 """
 
+import asyncio
+import json
 import os
-from typing import Optional, Tuple
-from pdf_utils import create_partial_pdf, validate_pdf_path
-from openai_client import OpenAIClient
+from typing import Any, Dict, Optional, Tuple
+from pdf_utils import create_partial_pdf_buffer, extract_page_text, page_window_indices, validate_pdf_path
+from page_renderer import PageRenderer
+from openai_client import AsyncOpenAIClient, OpenAIClient, is_missing_file_error
+from rate_limiter import AdaptiveRateLimiter
+from upload_cache import UploadCache, sha256_file
+from file_janitor import FileJanitor
+from result_cache import ResultCache, make_result_key
+from run_journal import RunJournal
+from config import DEFAULT_MODEL, INPUT_MODES, PARTIAL_PDF_SPILL_MB, TEXT_INPUT_CHAR_BUDGET
+
+
+def _is_json(text: str) -> bool:
+    """Return True if text parses as JSON (only valid outputs are worth caching)."""
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
 
 
 class MetadataExtractor:
-    def __init__(self, include_subjects: bool = True, profile_path: str = None) -> None:
+    def __init__(self, include_subjects: bool = True, profile_path: str = None, max_concurrency: int = 16,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 upload_cache: Optional[UploadCache] = None,
+                 janitor: Optional[FileJanitor] = None,
+                 result_cache: Optional[ResultCache] = None,
+                 journal: Optional[RunJournal] = None,
+                 input_mode: str = "file",
+                 text_char_budget: int = TEXT_INPUT_CHAR_BUDGET,
+                 spill_threshold_mb: float = PARTIAL_PDF_SPILL_MB,
+                 page_sample: int = 0,
+                 upload_optimisation: Optional[Dict[str, Any]] = None,
+                 renderer: Optional[PageRenderer] = None) -> None:
         """Initialize the metadata extractor with an OpenAI client.
 
         Args:
             include_subjects: Whether to include subject classification. Defaults to True.
             profile_path: Path to a YAML profile file. Defaults to the ICAEW profile.
+            max_concurrency: Maximum in-flight API calls for extract_metadata_async. Defaults to 16.
+            rate_limiter: Optional adaptive controller for the synchronous client's API calls
+                (extract_metadata_async does not use it).
+            upload_cache: Optional content-addressed cache used to skip re-uploading identical files.
+            janitor: Optional background deleter; uploaded files are queued for deletion
+                once extraction has finished with them, whether or not it succeeded.
+            result_cache: Optional persistent cache of model outputs; a hit skips all network I/O.
+            journal: Optional run journal; uploads and extractions are recorded so an
+                interrupted run can resume.
+            input_mode: "file" uploads the PDF; "text" sends the locally extracted text layer
+                and falls back to uploading when the selected pages have no text layer; "image"
+                sends image-only pages rendered to JPEG and falls back to uploading otherwise.
+            text_char_budget: Maximum characters of page text sent in "text" mode.
+            spill_threshold_mb: Partial PDFs larger than this are spilled to a temporary
+                file instead of being kept in memory.
+            page_sample: If set, send this many auto-selected, most informative pages
+                instead of the first/last page window (--pages auto:N).
+            upload_optimisation: Optional settings (see config.get_upload_optimisation) for
+                shrinking PDFs before upload; None uploads the pages as they are.
+            renderer: Page renderer used in "image" mode. Defaults to a PageRenderer with
+                the config settings.
         """
-        self.client = OpenAIClient(include_subjects=include_subjects, profile_path=profile_path)
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"input_mode must be one of {', '.join(INPUT_MODES)}")
+        self.include_subjects = include_subjects
+        self.profile_path = profile_path
+        self.max_concurrency = max_concurrency
+        self.client = OpenAIClient(include_subjects=include_subjects, profile_path=profile_path,
+                                   rate_limiter=rate_limiter, upload_cache=upload_cache)
+        self._async_client: Optional[AsyncOpenAIClient] = None
+        self.janitor = janitor
+        self.result_cache = result_cache
+        self.journal = journal
+        self.input_mode = input_mode
+        self.text_char_budget = text_char_budget
+        self.spill_threshold_mb = spill_threshold_mb
+        self.page_sample = page_sample
+        self.upload_optimisation = upload_optimisation
+        self.renderer = renderer
+        if input_mode == "image" and renderer is None:
+            self.renderer = PageRenderer()
+
+    @property
+    def async_client(self) -> AsyncOpenAIClient:
+        """asyncio client, created on first use by extract_metadata_async."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAIClient(
+                include_subjects=self.include_subjects,
+                profile_path=self.profile_path,
+                max_concurrency=self.max_concurrency,
+                upload_cache=self.client.upload_cache)
+        return self._async_client
 
-    def extract_metadata(self, pdf_path: str, first_pages: int = 0, last_pages: int = 0, original_format: str = None, context_prompt: Optional[str] = None) -> Tuple[str, str, str]:
+    def extract_metadata(self, pdf_path: str, first_pages: int = 0, last_pages: int = 0, original_format: str = None, context_prompt: Optional[str] = None, file_id: Optional[str] = None) -> Tuple[str, str, str]:
         """
         Extract metadata from a PDF file using OpenAI's API.
 
@@ -28,35 +107,222 @@ class MetadataExtractor:
             last_pages (int): Number of pages to include from the end
             original_format (str): Original file format (e.g., 'docx', 'txt') if the file was converted
             context_prompt (str, optional): Custom context to include in the prompt (e.g. "What follows is a series of photos showing Chartered Accountant's Hall")
+            file_id (str, optional): ID of an earlier upload of this document to reuse instead of uploading
 
         Returns:
             Tuple[str, str, str]: A tuple containing (metadata, original_file_path, original_format)
         """
-        original_path = pdf_path  # Store the original path
         try:
-            # Validate the PDF path
-            validate_pdf_path(pdf_path)
+            self.client.clear_last_usage()
+            cache_key, cached = self._cached_result(pdf_path, first_pages, last_pages, context_prompt)
+            if cached is not None:
+                return cached, pdf_path, original_format
 
-            # Create partial PDF if page limits are specified
-            temp_pdf_path = None
-            try:
-                if first_pages > 0 or last_pages > 0:
-                    pdf_path = create_partial_pdf(
-                        pdf_path, first_pages, last_pages)
-                    temp_pdf_path = pdf_path  # Store the temp path for cleanup
+            # Send the text layer or page images instead of the file when the pages allow it
+            if self.input_mode != "file" and not file_id:
+                validate_pdf_path(pdf_path)
+                metadata = self._extract_locally(pdf_path, first_pages, last_pages, context_prompt)
+                if metadata is not None:
+                    self._record_result(pdf_path, metadata, self.client.last_usage, cache_key)
+                    return metadata, pdf_path, original_format
 
-                # Upload the file and extract metadata
-                file_id = self.client.upload_file(pdf_path)
+            # Upload the (possibly sliced) file and extract metadata
+            if file_id:
+                print(f"Reusing uploaded file. File ID: {file_id}")
+            else:
+                file_id = self._upload_and_record(pdf_path, first_pages, last_pages)
+            try:
+                metadata = self.client.extract_metadata(file_id, context_prompt=context_prompt)
+            except Exception as e:
+                # A reused or cached upload may have been deleted remotely; upload afresh
+                if not is_missing_file_error(e):
+                    raise
+                self._forget_upload(file_id)
+                file_id = None
+                file_id = self._upload_and_record(pdf_path, first_pages, last_pages)
                 metadata = self.client.extract_metadata(file_id, context_prompt=context_prompt)
+            self._record_result(pdf_path, metadata, self.client.last_usage, cache_key)
+            return metadata, pdf_path, original_format
+
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+            raise
+        finally:
+            # The upload is finished with whether or not the model call succeeded
+            if self.janitor and file_id:
+                self.janitor.enqueue(file_id)
+
+    def _cached_result(self, pdf_path: str, first_pages: int, last_pages: int,
+                       context_prompt: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """Return (result-cache key, cached metadata); both are None without a result cache."""
+        if not self.result_cache:
+            return None, None
+        validate_pdf_path(pdf_path)
+        cache_key = self.result_key(pdf_path, first_pages, last_pages, context_prompt)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            print("Using cached extraction result")
+        return cache_key, cached
+
+    def _record_result(self, pdf_path: str, metadata: str, usage: Optional[Dict[str, int]],
+                       cache_key: Optional[str]) -> None:
+        """Journal an extraction and keep it in the result cache."""
+        if self.journal:
+            self.journal.record(pdf_path, "extracted", metadata=metadata, usage=usage)
+        if cache_key and _is_json(metadata):
+            self.result_cache.put(cache_key, metadata)
 
-                return metadata, original_path, original_format
+    def _forget_upload(self, file_id: str) -> None:
+        """Drop an upload that no longer exists remotely from the upload cache."""
+        print(f"File {file_id} is no longer available; re-uploading")
+        if self.client.upload_cache:
+            self.client.upload_cache.invalidate_file_id(file_id)
 
-            finally:
-                # Clean up temporary file if it was created
-                if temp_pdf_path and os.path.exists(temp_pdf_path):
-                    os.unlink(temp_pdf_path)
-                    print("Cleaned up temporary PDF file")
+    def _extract_locally(self, pdf_path: str, first_pages: int, last_pages: int,
+                         context_prompt: Optional[str]) -> Optional[str]:
+        """Extract from the text layer ("text") or rendered pages ("image"); None means upload instead."""
+        if self.input_mode == "text":
+            document_text = extract_page_text(pdf_path, first_pages, last_pages, self.text_char_budget,
+                                              sample_pages=self.page_sample)
+            if document_text is None:
+                return None
+            return self.client.extract_metadata_from_text(document_text, context_prompt=context_prompt)
+        page_images = self.renderer.render(
+            pdf_path, page_window_indices(pdf_path, first_pages, last_pages, self.page_sample))
+        if page_images is None:
+            return None
+        return self.client.extract_metadata_from_images(page_images, context_prompt=context_prompt)
+
+    def _upload_and_record(self, pdf_path: str, first_pages: int, last_pages: int) -> str:
+        """Upload a document and note the file_id in the run journal."""
+        file_id = self.upload_document(pdf_path, first_pages, last_pages)
+        if self.journal:
+            self.journal.record(pdf_path, "uploaded", file_id=file_id)
+        return file_id
+
+    def result_key(self, pdf_path: str, first_pages: int = 0, last_pages: int = 0,
+                   context_prompt: Optional[str] = None, input_mode: Optional[str] = None) -> str:
+        """
+        Return the result-cache key for extracting a document with the current settings.
+
+        Args:
+            pdf_path (str): Path to the source PDF file
+            first_pages (int): Number of pages to include from the start
+            last_pages (int): Number of pages to include from the end
+            context_prompt (str, optional): Custom context included in the prompt
+            input_mode (str, optional): Overrides the extractor's input mode (batch mode always uploads)
+
+        Returns:
+            str: Cache key
+        """
+        input_mode = input_mode or self.input_mode
+        if input_mode == "image":
+            # Rendering settings change what the model sees
+            input_mode = f"image:{self.renderer.max_edge}:{self.renderer.quality}"
+        # Text and image modes fall back to uploading the (optimised) file when the pages don't allow them
+        return make_result_key(sha256_file(pdf_path), first_pages, last_pages, self.client.system_prompt,
+                               DEFAULT_MODEL, self.include_subjects, context_prompt, input_mode,
+                               self.page_sample, self.upload_optimisation)
+
+    def upload_document(self, pdf_path: str, first_pages: int = 0, last_pages: int = 0) -> str:
+        """
+        Upload a PDF, sliced to the requested page window (or page sample), and return its OpenAI file ID.
+
+        Args:
+            pdf_path (str): Path to the PDF file
+            first_pages (int): Number of pages to include from the start
+            last_pages (int): Number of pages to include from the end
+
+        Returns:
+            str: The file ID assigned by OpenAI
+        """
+        # Validate the PDF path
+        validate_pdf_path(pdf_path)
+
+        # Slice in memory if page limits are specified; None means the whole PDF is used
+        buffer = None
+        if first_pages > 0 or last_pages > 0 or self.page_sample > 0 or self.upload_optimisation:
+            buffer = create_partial_pdf_buffer(pdf_path, first_pages, last_pages, self.spill_threshold_mb,
+                                               self.page_sample, self.upload_optimisation)
+        if buffer is None:
+            return self.client.upload_file(pdf_path)
+        with buffer:
+            return self.client.upload_file(buffer, filename=os.path.basename(pdf_path))
+
+    async def extract_metadata_async(self, pdf_path: str, first_pages: int = 0, last_pages: int = 0, original_format: str = None, context_prompt: Optional[str] = None, file_id: Optional[str] = None) -> Tuple[str, str, str]:
+        """
+        Extract metadata from a PDF file using OpenAI's API without blocking the event loop.
+
+        Takes the same arguments and returns the same tuple as extract_metadata, and uses
+        the same result cache, upload cache, run journal, janitor and input mode. Uploads
+        and model calls on the uploaded file go through AsyncOpenAIClient, so many
+        documents can be in flight on one thread. Slicing, hashing, the text and image
+        input modes (which use the synchronous client and its rate limiter) and cache
+        and journal writes run in worker threads.
+
+        Returns:
+            Tuple[str, str, str]: A tuple containing (metadata, original_file_path, original_format)
+        """
+        try:
+            cache_key, cached = await asyncio.to_thread(
+                self._cached_result, pdf_path, first_pages, last_pages, context_prompt)
+            if cached is not None:
+                return cached, pdf_path, original_format
+
+            if self.input_mode != "file" and not file_id:
+                validate_pdf_path(pdf_path)
+                metadata, usage = await asyncio.to_thread(
+                    self._extract_locally_with_usage, pdf_path, first_pages, last_pages, context_prompt)
+                if metadata is not None:
+                    await asyncio.to_thread(self._record_result, pdf_path, metadata, usage, cache_key)
+                    return metadata, pdf_path, original_format
+
+            if file_id:
+                print(f"Reusing uploaded file. File ID: {file_id}")
+            else:
+                file_id = await self._upload_and_record_async(pdf_path, first_pages, last_pages)
+            try:
+                metadata = await self.async_client.extract_metadata(file_id, context_prompt=context_prompt)
+            except Exception as e:
+                if not is_missing_file_error(e):
+                    raise
+                self._forget_upload(file_id)
+                file_id = None
+                file_id = await self._upload_and_record_async(pdf_path, first_pages, last_pages)
+                metadata = await self.async_client.extract_metadata(file_id, context_prompt=context_prompt)
+            await asyncio.to_thread(self._record_result, pdf_path, metadata,
+                                    self.async_client.last_usage, cache_key)
+            return metadata, pdf_path, original_format
 
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             raise
+        finally:
+            if self.janitor and file_id:
+                self.janitor.enqueue(file_id)
+
+    def _extract_locally_with_usage(self, pdf_path: str, first_pages: int, last_pages: int,
+                                    context_prompt: Optional[str]) -> Tuple[Optional[str], Optional[Dict[str, int]]]:
+        """Run _extract_locally on a worker thread and return its metadata and usage."""
+        self.client.clear_last_usage()
+        metadata = self._extract_locally(pdf_path, first_pages, last_pages, context_prompt)
+        return metadata, self.client.last_usage
+
+    async def _upload_and_record_async(self, pdf_path: str, first_pages: int, last_pages: int) -> str:
+        """Slice (in a worker thread) and upload a document, and note the file_id in the run journal."""
+        validate_pdf_path(pdf_path)
+        # Slice in memory if page limits are specified; None means the whole PDF is used
+        buffer = None
+        try:
+            if first_pages > 0 or last_pages > 0 or self.page_sample > 0 or self.upload_optimisation:
+                buffer = await asyncio.to_thread(
+                    create_partial_pdf_buffer, pdf_path, first_pages, last_pages, self.spill_threshold_mb,
+                    self.page_sample, self.upload_optimisation)
+            file_id = await self.async_client.upload_file(
+                buffer if buffer is not None else pdf_path, filename=os.path.basename(pdf_path))
+        finally:
+            if buffer is not None:
+                buffer.close()
+        if self.journal:
+            await asyncio.to_thread(self.journal.record, pdf_path, "uploaded", file_id=file_id)
+        return file_id
@@ -0,0 +1,152 @@
+"""
+Group-commit sink in front of a metadata writer (JSONMetadataWriter or SQLiteMetadataStore).
+
+Any number of threads submit records; a single writer thread collects them and
+writes them in batches, every flush_records records or flush_ms milliseconds,
+whichever comes first. Each submit returns a Future that resolves (to the record)
+once the record is written with the configured fsync policy:
+
+    none    -> handed to the OS; survives a crash of the process but not of the machine
+    batch   -> one fsync per batch
+    record  -> one write and fsync per record (slowest; the batch only saves queueing)
+
+Submissions are turned into records when their batch is written, with the
+writer's make_records, so the text of the whole batch is cleaned in one pass.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from record_builder import MetadataRecordBuilder
+
+FSYNC_POLICIES = ("none", "batch", "record")
+DEFAULT_FLUSH_RECORDS = 50
+DEFAULT_FLUSH_MS = 500
+
+# Queue markers
+_CLOSE = object()
+_FLUSH = object()
+
+
+class MetadataSink:
+    def __init__(self, writer: MetadataRecordBuilder, flush_records: int = DEFAULT_FLUSH_RECORDS,
+                 flush_ms: float = DEFAULT_FLUSH_MS, fsync: str = "batch") -> None:
+        """
+        Start the writer thread.
+
+        Args:
+            writer (MetadataRecordBuilder): Writer that owns the output (the JSON file or SQLite store)
+            flush_records (int): Write a batch once this many records are waiting
+            flush_ms (float): Write a batch at the latest this many milliseconds after its first record
+            fsync (str): One of FSYNC_POLICIES
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}")
+        if flush_records < 1:
+            raise ValueError("flush_records must be at least 1")
+        self.writer = writer
+        self.flush_records = flush_records
+        self.flush_seconds = flush_ms / 1000
+        self.fsync = fsync
+        self.batches = 0
+        self.records = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="metadata-sink", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "MetadataSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def submit(self, metadata_str: str, pdf_path: str, original_format: str = None,
+               **fields: Any) -> "Future[Dict[str, Any]]":
+        """
+        Queue a record for writing. Safe to call from any thread.
+
+        Takes the same arguments as MetadataRecordBuilder.write_metadata.
+
+        Returns:
+            Future: Resolves to the record once it is written, or raises the parse or write error
+        """
+        if self._closed:
+            raise RuntimeError("MetadataSink is closed")
+        future: "Future[Dict[str, Any]]" = Future()
+        self._queue.put((future, (metadata_str, pdf_path, original_format), fields))
+        return future
+
+    def flush(self) -> None:
+        """Write everything submitted so far and wait until it is done."""
+        done: Future = Future()
+        self._queue.put((_FLUSH, done))
+        done.result()
+
+    def close(self) -> None:
+        """Write the remaining records and stop the writer thread."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+    def _run(self) -> None:
+        batch: List[Tuple[Future, tuple, Dict[str, Any]]] = []
+        deadline: Optional[float] = None
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()) if batch else None)
+            except queue.Empty:
+                self._commit(batch)
+                batch = []
+                continue
+            if item is _CLOSE:
+                self._commit(batch)
+                return
+            if item[0] is _FLUSH:
+                self._commit(batch)
+                batch = []
+                item[1].set_result(None)
+                continue
+            # Records are built when the batch is committed, so its text is cleaned in one pass
+            if not batch:
+                deadline = time.monotonic() + self.flush_seconds
+            batch.append(item)
+            if len(batch) >= self.flush_records:
+                self._commit(batch)
+                batch = []
+
+    def _commit(self, submissions: List[Tuple[Future, tuple, Dict[str, Any]]]) -> None:
+        """Build a batch of records, write them and resolve their futures."""
+        if not submissions:
+            return
+        try:
+            built = self.writer.make_records([(args, fields) for _, args, fields in submissions])
+        except Exception as e:
+            built = [e] * len(submissions)
+        batch: List[Tuple[Future, Dict[str, Any]]] = []
+        for (future, _, _), record in zip(submissions, built):
+            if isinstance(record, Exception):
+                future.set_exception(record)
+            else:
+                batch.append((future, record))
+        if not batch:
+            return
+        if self.fsync == "record":
+            groups = [[item] for item in batch]
+        else:
+            groups = [batch]
+        for group in groups:
+            try:
+                self.writer.write_records([record for _, record in group], fsync=self.fsync != "none")
+            except Exception as e:
+                for future, _ in group:
+                    future.set_exception(e)
+                continue
+            for future, record in group:
+                future.set_result(record)
+        self.batches += 1
+        self.records += len(batch)
@@ -8,6 +8,7 @@ import os
 from typing import Dict, List
 
 from config import get_subject_constraints, validate_subjects
+from text_normaliser import normalise_text
 
 
 class MetadataWriter:
@@ -54,41 +55,6 @@ class MetadataWriter:
                 writer = csv.DictWriter(csvfile, fieldnames=self.fields)
                 writer.writeheader()
 
-    def _clean_text(self, text: str) -> str:
-        """
-        Clean text to remove problematic characters and ensure consistent formatting.
-        
-        Args:
-            text (str): The text to clean
-            
-        Returns:
-            str: Cleaned text
-        """
-        if not text:
-            return ""
-        
-        # Replace problematic Unicode characters with ASCII equivalents
-        replacements = {
-            '—': ':',  # em-dash to colon
-            '–': ':',  # en-dash to colon
-            '"': '"',  # smart quotes to straight quotes
-            '"': '"',
-            ''': "'",  # smart apostrophes to straight apostrophes
-            ''': "'",
-            '…': '...',  # ellipsis to three dots
-            'â€"': ':',  # common encoding issue
-            'â€"': ':',  # common encoding issue
-        }
-        
-        cleaned = text
-        for old, new in replacements.items():
-            cleaned = cleaned.replace(old, new)
-        
-        # Remove any other non-ASCII characters that might cause issues
-        cleaned = ''.join(char for char in cleaned if ord(char) < 128 or char in ';:,.-()')
-        
-        return cleaned.strip()
-
     def _parse_metadata(self, metadata_str: str) -> Dict[str, str]:
         """
         Parse the metadata JSON string into a dictionary.
@@ -135,7 +101,7 @@ class MetadataWriter:
                         if len(validated) < len(value):
                             print(f"  Subject validation: reduced from {len(value)} to {len(validated)} item(s)")
                         value = validated
-                    result[mapped_field] = self._clean_text(str(value) if value is not None else '')
+                    result[mapped_field] = normalise_text(str(value) if value is not None else '')
             
             # Apply the mapping rules:
             # 1. entity.title should be a copy of dc:title (from Title)
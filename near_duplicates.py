@@ -0,0 +1,374 @@
+"""
+Near-duplicate detection, so reprints, re-scans and regional variants of a
+document don't each cost a full model call.
+
+Before a run, the text layer of every input is reduced to a MinHash signature
+of its word 5-grams, and the signatures are bucketed with locality-sensitive
+hashing (LSH) so that only likely pairs are compared. Each document whose
+estimated similarity to an earlier document in the run is at least the reuse
+threshold takes that document's metadata, adjusted for the file; documents
+between the verification and reuse thresholds get a cheap text-only call that
+checks the earlier metadata against their own text. Signatures cover the pages
+sent to the model (the first/last window, or the auto-selected pages of
+--pages auto:N). Documents without a text layer (scans) are never matched.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_REUSE_THRESHOLD = 0.95
+DEFAULT_VERIFY_THRESHOLD = 0.8
+SHINGLE_WORDS = 5
+NUM_PERMUTATIONS = 120
+# 20 bands of 6 rows: pairs at 0.8 similarity share a bucket with ~99.8% probability, pairs at 0.5 with ~27%
+LSH_BANDS = 20
+# Characters of text read per document for the signature, and sent in a verification call
+SIGNATURE_CHAR_BUDGET = 60000
+VERIFY_CHAR_BUDGET = 8000
+# Documents with fewer words than this are too short to compare reliably
+MIN_WORDS = 50
+# Seconds a near-duplicate waits for its source's metadata before it is extracted in full
+DEFAULT_SOURCE_WAIT = 600
+
+REUSED = "reused"
+VERIFIED = "verified"
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(20240601)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def document_words(pdf_path: str, first_pages: int = 0, last_pages: int = 0,
+                   char_budget: int = SIGNATURE_CHAR_BUDGET, sample_pages: int = 0) -> List[str]:
+    """
+    Return the lower-cased words of a PDF's text layer.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        first_pages (int): Number of pages to read from the start (0 with last_pages=0 reads from the start)
+        last_pages (int): Number of pages to read from the end
+        char_budget (int): Stop reading once this many characters have been collected
+        sample_pages (int): If set, read this many auto-selected pages instead (--pages auto:N)
+
+    Returns:
+        list: Words in document order (empty if the file has no text layer)
+    """
+    from page_window import PageWindowReader
+    from pdf_utils import select_informative_pages, select_page_indices
+
+    texts = []
+    collected = 0
+    with PageWindowReader(pdf_path) as window:
+        if sample_pages > 0:
+            indices = select_informative_pages(window, sample_pages, verbose=False)
+        elif first_pages > 0 or last_pages > 0:
+            indices = select_page_indices(window.page_count, first_pages, last_pages)
+        else:
+            indices = range(window.page_count)
+        for i in indices:
+            try:
+                text = window.page(i).extract_text() or ""
+            except Exception:
+                continue
+            texts.append(text)
+            collected += len(text)
+            if collected >= char_budget:
+                break
+    return re.findall(r"\w+", " ".join(texts)[:char_budget].lower())
+
+
+def minhash(words: List[str]) -> Optional[Tuple[int, ...]]:
+    """
+    Return the MinHash signature of a document's word shingles, or None if it is too short.
+
+    Args:
+        words (list): Words of the document
+
+    Returns:
+        tuple: NUM_PERMUTATIONS minimum hash values
+    """
+    if len(words) < MIN_WORDS:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+              for shingle in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def document_signature(pdf_path: str, first_pages: int = 0, last_pages: int = 0,
+                       sample_pages: int = 0) -> Optional[Tuple[int, ...]]:
+    """Signature of a PDF's text layer. Runs in a worker process; unreadable files return None."""
+    try:
+        return minhash(document_words(pdf_path, first_pages, last_pages, sample_pages=sample_pages))
+    except Exception:
+        return None
+
+
+def similarity(signature_a: Tuple[int, ...], signature_b: Tuple[int, ...]) -> float:
+    """Estimate the Jaccard similarity of two documents from their signatures."""
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = DEFAULT_VERIFY_THRESHOLD, bands: int = LSH_BANDS) -> None:
+        """
+        Initialize an empty LSH index.
+
+        Args:
+            threshold (float): Smallest estimated similarity reported as a match
+            bands (int): Number of LSH bands the signature is split into
+        """
+        if NUM_PERMUTATIONS % bands:
+            raise ValueError(f"bands must divide {NUM_PERMUTATIONS}")
+        self.threshold = threshold
+        self.bands = bands
+        self._rows = NUM_PERMUTATIONS // bands
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> Iterable[Tuple[int, Tuple[int, ...]]]:
+        for band in range(self.bands):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def add(self, key: str, signature: Tuple[int, ...]) -> None:
+        """Add a document to the index."""
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets[band_key].append(key)
+
+    def query(self, signature: Tuple[int, ...]) -> Optional[Tuple[str, float]]:
+        """
+        Find the most similar indexed document.
+
+        Returns:
+            tuple: (key, estimated similarity) of the best match at or above the threshold, or None
+        """
+        candidates = {key for band_key in self._band_keys(signature) for key in self._buckets.get(band_key, ())}
+        best = None
+        for key in candidates:
+            score = similarity(signature, self._signatures[key])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+
+class NearDuplicatePlan:
+    def __init__(self, matches: Dict[str, Tuple[str, float]], reuse_threshold: float,
+                 source_wait: float = DEFAULT_SOURCE_WAIT) -> None:
+        """
+        Which documents of a run are near-duplicates of which earlier document.
+
+        Use plan_near_duplicates to build one. Extraction threads publish the metadata
+        of every source document; a near-duplicate waits for its source's metadata.
+
+        Args:
+            matches (dict): Maps a near-duplicate's path to (source path, estimated similarity)
+            reuse_threshold (float): Matches at or above this are reused without a model call
+            source_wait (float): Seconds a near-duplicate waits for its source before giving up
+        """
+        self.matches = matches
+        self.reuse_threshold = reuse_threshold
+        self.source_wait = source_wait
+        self._sources = {source for source, _ in matches.values()}
+        self._metadata: Dict[str, Optional[str]] = {}
+        self._published = {source: threading.Event() for source in self._sources}
+        self._lock = threading.Lock()
+        self.counts = {REUSED: 0, VERIFIED: 0, "fallback": 0}
+        self.verification_calls = 0
+        self.verification_tokens = 0
+
+    def is_source(self, pdf_path: str) -> bool:
+        """Return True if other documents in the run wait for this document's metadata."""
+        return pdf_path in self._sources
+
+    def publish(self, pdf_path: str, metadata: Optional[str]) -> None:
+        """Hand a source document's metadata (None if its extraction failed) to its near-duplicates."""
+        if pdf_path in self._published:
+            self._metadata[pdf_path] = metadata
+            self._published[pdf_path].set()
+
+    def source_metadata(self, pdf_path: str) -> Optional[Tuple[str, float, str]]:
+        """
+        Wait for the metadata of the document this one duplicates.
+
+        Sources are always earlier in the run, so they were submitted to the pool first,
+        but a source held up by retries could stall the workers waiting for it, so the
+        wait is bounded by source_wait.
+
+        Returns:
+            tuple: (source path, similarity, source metadata), or None if this document is not
+                a near-duplicate, its source failed or the wait timed out
+        """
+        match = self.matches.get(pdf_path)
+        if match is None:
+            return None
+        source, score = match
+        if not self._published[source].wait(self.source_wait):
+            print(f"Timed out waiting for the metadata of {source}; extracting {pdf_path} in full")
+            return None
+        metadata = self._metadata[source]
+        return (source, score, metadata) if metadata is not None else None
+
+    def method_for(self, score: float) -> str:
+        """Return REUSED or VERIFIED for a match of the given similarity."""
+        return REUSED if score >= self.reuse_threshold else VERIFIED
+
+    def count(self, outcome: str) -> None:
+        """Count a near-duplicate outcome: REUSED, VERIFIED or "fallback" (fully extracted)."""
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def count_verification_call(self, usage: Optional[Dict[str, int]]) -> None:
+        """Count a text-only verification call and its tokens (usage as returned by usage_from_response)."""
+        with self._lock:
+            self.verification_calls += 1
+            if usage:
+                self.verification_tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+    def summary(self) -> str:
+        """
+        One-line report of the model calls saved.
+
+        Every reused or verified document avoids a full extraction, and every verification
+        call is a model call of its own, so the net saving is the difference.
+        """
+        avoided = self.counts[REUSED] + self.counts[VERIFIED]
+        return (f"{len(self.matches)} found, {self.counts[REUSED]} reused, "
+                f"{self.counts[VERIFIED]} checked with a text-only verification call, "
+                f"{self.counts['fallback']} fully extracted; {avoided} full extraction(s) avoided for "
+                f"{self.verification_calls} verification call(s) ({self.verification_tokens:,} tokens), "
+                f"{avoided - self.verification_calls} model call(s) saved net")
+
+
+def plan_near_duplicates(pdf_paths: List[str], first_pages: int = 0, last_pages: int = 0,
+                         reuse_threshold: float = DEFAULT_REUSE_THRESHOLD,
+                         verify_threshold: float = DEFAULT_VERIFY_THRESHOLD,
+                         workers: int = 4, sample_pages: int = 0,
+                         source_wait: float = DEFAULT_SOURCE_WAIT) -> NearDuplicatePlan:
+    """
+    Sign every document in parallel and match each one against the documents before it.
+
+    Args:
+        pdf_paths (list): Documents in the order they will be processed
+        first_pages (int): Number of pages read from the start (the window sent to the model)
+        last_pages (int): Number of pages read from the end
+        reuse_threshold (float): Similarity at or above which metadata is reused as is
+        verify_threshold (float): Similarity at or above which metadata is verified rather than extracted
+        workers (int): Number of worker processes
+        sample_pages (int): If set, sign the auto-selected pages instead (--pages auto:N)
+        source_wait (float): Seconds a near-duplicate waits for its source's metadata
+
+    Returns:
+        NearDuplicatePlan: The matches found
+    """
+    threshold = min(verify_threshold, reuse_threshold)
+    if workers > 1 and len(pdf_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            signatures = list(executor.map(document_signature, pdf_paths, [first_pages] * len(pdf_paths),
+                                           [last_pages] * len(pdf_paths), [sample_pages] * len(pdf_paths),
+                                           chunksize=max(1, len(pdf_paths) // (workers * 4))))
+    else:
+        signatures = [document_signature(path, first_pages, last_pages, sample_pages) for path in pdf_paths]
+
+    # Greedy: a document either matches an earlier source or becomes a source itself,
+    # so metadata never comes from another near-duplicate
+    index = NearDuplicateIndex(threshold)
+    matches: Dict[str, Tuple[str, float]] = {}
+    for path, signature in zip(pdf_paths, signatures):
+        if signature is None:
+            continue
+        match = index.query(signature)
+        if match:
+            matches[path] = match
+        else:
+            index.add(path, signature)
+    return NearDuplicatePlan(matches, reuse_threshold, source_wait)
+
+
+def _replace_strings(value: Any, old: str, new: str) -> Any:
+    """Replace old with new in every string of a JSON value."""
+    if isinstance(value, str):
+        return value.replace(old, new)
+    if isinstance(value, list):
+        return [_replace_strings(item, old, new) for item in value]
+    if isinstance(value, dict):
+        return {key: _replace_strings(item, old, new) for key, item in value.items()}
+    return value
+
+
+def adapt_metadata(metadata: str, source_path: str, pdf_path: str, first_pages: int = 0,
+                   last_pages: int = 0, sample_pages: int = 0) -> str:
+    """
+    Adjust a near-duplicate's reused metadata for its own file.
+
+    References to the source's file name are rewritten to this file's name, and
+    identifiers (ISBNs, report numbers) that don't occur in this file's text are dropped.
+
+    Args:
+        metadata (str): Metadata JSON of the source document
+        source_path (str): Path of the source document
+        pdf_path (str): Path of the near-duplicate
+        first_pages (int): Number of pages read from the start
+        last_pages (int): Number of pages read from the end
+        sample_pages (int): If set, read the auto-selected pages instead (--pages auto:N)
+
+    Returns:
+        str: Metadata JSON for the near-duplicate
+
+    Raises:
+        ValueError: If the source metadata is not a JSON object
+    """
+    data = json.loads(metadata)
+    if not isinstance(data, dict):
+        raise ValueError("Source metadata is not a JSON object")
+    source_stem = os.path.splitext(os.path.basename(source_path))[0]
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    if source_stem and source_stem != stem:
+        data = _replace_strings(data, source_stem, stem)
+    if isinstance(data.get("Identifier"), list) and data["Identifier"]:
+        text = " ".join(document_words(pdf_path, first_pages, last_pages, sample_pages=sample_pages))
+        data["Identifier"] = [identifier for identifier in data["Identifier"]
+                              if not isinstance(identifier, str)
+                              or " ".join(re.findall(r"\w+", identifier.lower())) in text]
+    return json.dumps(data, ensure_ascii=False)
+
+
+def verification_prompt(source_metadata: str, context_prompt: Optional[str] = None) -> str:
+    """Context for a verification call: the source's metadata, to be checked against this document."""
+    prompt = ("This document is a near-duplicate (e.g. a reprint, re-scan or regional variant) of a "
+              "document that was described with the metadata below. Check every field against this "
+              "document's text and return the metadata with any differences corrected (e.g. title, "
+              "date, edition, coverage, identifiers).\n\n" + source_metadata)
+    return f"{context_prompt}\n\n{prompt}" if context_prompt else prompt
+
+
+def main():
+    """Command line interface for listing the near-duplicates in a folder."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List near-duplicate PDFs in a folder (as used by main.py --near-duplicates)')
+    parser.add_argument('folder', help='Folder containing PDF files')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_VERIFY_THRESHOLD,
+                        help=f'Smallest estimated similarity listed (default: {DEFAULT_VERIFY_THRESHOLD})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    pdf_paths = sorted(os.path.join(args.folder, name) for name in os.listdir(args.folder)
+                       if name.lower().endswith('.pdf'))
+    plan = plan_near_duplicates(pdf_paths, reuse_threshold=args.threshold, verify_threshold=args.threshold,
+                                workers=args.workers)
+    for path, (source, score) in plan.matches.items():
+        print(f"{score:.2f}  {path}  ~  {source}")
+    print(f"{len(plan.matches)} near-duplicate(s) among {len(pdf_paths)} file(s)")
+
+
+if __name__ == '__main__':
+    main()
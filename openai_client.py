@@ -2,15 +2,57 @@
 OpenAI API client for metadata extraction.
 """
 
+import asyncio
+import base64
+import contextvars
+import hashlib
 import os
-from typing import Optional
-from openai import OpenAI
+import threading
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 from config import get_system_prompt, DEFAULT_MODEL, FILE_PURPOSE
+from rate_limiter import AdaptiveRateLimiter
+from upload_cache import UploadCache, sha256_file, sha256_stream
+
+# Rough token cost of a document's file content, used to reserve token-bucket
+# quota before the call; the limiter corrects it from the reported usage
+ESTIMATED_DOCUMENT_TOKENS = 3000
+# Rough token cost of one rendered page image
+ESTIMATED_IMAGE_TOKENS = 1100
+
+
+class UsageTotals:
+    """Thread-safe running totals of token usage, including prompt-cache hits."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage: Optional[Dict[str, int]]) -> None:
+        """Add one response's usage (as returned by usage_from_response)."""
+        if not usage:
+            return
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.cached_tokens += usage.get("cached_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+
+    def summary(self) -> str:
+        """One-line description of the prompt-cache hit rate."""
+        share = (100.0 * self.cached_tokens / self.input_tokens) if self.input_tokens else 0.0
+        return (f"{self.cached_tokens:,} of {self.input_tokens:,} input tokens served from the prompt cache "
+                f"({share:.1f}%) over {self.requests} request(s)")
 
 
 class OpenAIClient:
-    def __init__(self, include_subjects: bool = True, profile_path: str = None) -> None:
+    def __init__(self, include_subjects: bool = True, profile_path: str = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 upload_cache: Optional[UploadCache] = None) -> None:
         """Initialize the OpenAI client with API key from environment variables.
 
         Args:
@@ -18,30 +60,88 @@ class OpenAIClient:
                 When False, the Subject field is treated as reserved and the topic
                 list is omitted. Defaults to True.
             profile_path: Path to a YAML profile file. Defaults to the ICAEW profile.
+            rate_limiter: Optional adaptive controller that uploads and model calls go
+                through; 429s are then retried instead of failing the file.
+            upload_cache: Optional content-addressed cache; files whose bytes were
+                uploaded before are not uploaded again.
         """
         load_dotenv()
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        if rate_limiter:
+            # The SDK would retry 429s itself (twice, by default) and hide them from the
+            # controller; the controller retries rate-limited and transient failures instead
+            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+        else:
+            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
         if not os.getenv('OPENAI_API_KEY'):
             raise ValueError("OPENAI_API_KEY environment variable not set")
         self.system_prompt = get_system_prompt(include_subjects, profile_path)
+        self.rate_limiter = rate_limiter
+        self.upload_cache = upload_cache
+        self.prompt_cache_key = make_prompt_cache_key(self.system_prompt)
+        self.usage = UsageTotals()
+        self._local = threading.local()
+
+    @property
+    def last_usage(self) -> Optional[Dict[str, int]]:
+        """Token usage of the most recent model call made on the current thread."""
+        return getattr(self._local, 'usage', None)
 
-    def upload_file(self, file_path: str) -> str:
+    def clear_last_usage(self) -> None:
+        """Forget the current thread's last usage (e.g. before a cache hit that makes no call)."""
+        self._local.usage = None
+
+    def upload_file(self, file: Union[str, BinaryIO], filename: Optional[str] = None) -> str:
         """
         Upload a file to OpenAI.
 
         Args:
-            file_path (str): Path to the file to upload
+            file: Path to the file to upload, or a seekable binary buffer
+                (e.g. an in-memory partial PDF from create_partial_pdf_buffer)
+            filename (str, optional): Name sent with a buffer; defaults to the path's basename
 
         Returns:
             str: The file ID assigned by OpenAI
         """
-        print(f"Uploading file: {file_path}")
-        with open(file_path, "rb") as file:
+        is_path = isinstance(file, str)
+        filename = filename or (os.path.basename(file) if is_path else "document.pdf")
+        digest = None
+        if self.upload_cache:
+            digest = sha256_file(file) if is_path else sha256_stream(file)
+            cached_id = self.upload_cache.get(digest)
+            if cached_id:
+                print(f"Reusing previous upload of identical content. File ID: {cached_id}")
+                return cached_id
+
+        print(f"Uploading file: {file if is_path else filename + ' (in memory)'}")
+        if self.rate_limiter:
+            def create():
+                if is_path:
+                    with open(file, "rb") as f:
+                        return self.client.files.with_raw_response.create(file=f, purpose=FILE_PURPOSE)
+                # Rewind so a retried attempt sends the whole buffer again
+                file.seek(0)
+                return self.client.files.with_raw_response.create(file=(filename, file), purpose=FILE_PURPOSE)
+            uploaded_file = self.rate_limiter.call(create, counts_against_quota=False)
+        elif is_path:
+            with open(file, "rb") as f:
+                uploaded_file = self.client.files.create(
+                    file=f,
+                    purpose=FILE_PURPOSE
+                )
+        else:
+            file.seek(0)
             uploaded_file = self.client.files.create(
-                file=file,
+                file=(filename, file),
                 purpose=FILE_PURPOSE
             )
         print(f"File uploaded successfully. File ID: {uploaded_file.id}")
+        if self.upload_cache:
+            if is_path:
+                size = os.path.getsize(file)
+            else:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(0)
+            self.upload_cache.put(digest, uploaded_file.id, size)
         return uploaded_file.id
 
     def extract_metadata(self, file_id: str, context_prompt: Optional[str] = None) -> str:
@@ -57,45 +157,309 @@ class OpenAIClient:
             str: The extracted metadata
         """
         print("Extracting metadata...")
-        user_text = "Please analyse this document and extract metadata according to the conventions specified. Return the metadata in the specified JSON format."
-        if context_prompt:
-            user_text = (
-                "The following is background context that identifies the subject, place, or event. "
-                "Use it to name what is shown in the document: e.g. if the context says these are photos of Chartered Accountant's Hall, "
-                "your description must identify the building as 'Chartered Accountant's Hall' (or similar), not as a generic 'building'. "
-                "Describe what is shown in the image/page using the names and identifications from the context below.\n\n"
-                f"Context: {context_prompt.strip()}\n\n"
-                "---\n\n"
-                f"{user_text}"
+        request_input = build_request_input(self.system_prompt, file_id, context_prompt)
+        return self._create_response(request_input, ESTIMATED_DOCUMENT_TOKENS)
+
+    def extract_metadata_from_text(self, document_text: str, context_prompt: Optional[str] = None) -> str:
+        """
+        Extract metadata from document text extracted locally, without uploading a file.
+
+        Args:
+            document_text (str): Text of the selected pages
+            context_prompt (str, optional): Custom context to prepend to the user message
+
+        Returns:
+            str: The extracted metadata
+        """
+        print("Extracting metadata from text layer...")
+        request_input = build_request_input(self.system_prompt, context_prompt=context_prompt,
+                                            document_text=document_text)
+        return self._create_response(request_input, len(document_text) // 4)
+
+    def extract_metadata_from_images(self, page_images: List[bytes], context_prompt: Optional[str] = None) -> str:
+        """
+        Extract metadata from locally rendered page images, without uploading a file.
+
+        Args:
+            page_images (list): JPEG data of the selected pages, in page order
+            context_prompt (str, optional): Custom context to prepend to the user message
+
+        Returns:
+            str: The extracted metadata
+        """
+        print(f"Extracting metadata from {len(page_images)} page image(s)...")
+        request_input = build_request_input(self.system_prompt, context_prompt=context_prompt,
+                                            page_images=page_images)
+        return self._create_response(request_input, len(page_images) * ESTIMATED_IMAGE_TOKENS)
+
+    def _create_response(self, request_input: List[Dict[str, Any]], document_tokens: int) -> str:
+        """Send a responses.create call (through the rate limiter if set) and return the JSON text."""
+        # prompt_cache_key routes requests sharing the static prefix to the same cache
+        extra_body = {"prompt_cache_key": self.prompt_cache_key}
+        if self.rate_limiter:
+            response = self.rate_limiter.call(
+                lambda: self.client.responses.with_raw_response.create(
+                    model=DEFAULT_MODEL, input=request_input, extra_body=extra_body),
+                estimated_tokens=len(self.system_prompt) // 4 + document_tokens)
+        else:
+            response = self.client.responses.create(
+                model=DEFAULT_MODEL,
+                input=request_input,
+                extra_body=extra_body
             )
-        response = self.client.responses.create(
-            model=DEFAULT_MODEL,
-            input=[
+        usage = usage_from_response(response)
+        self._local.usage = usage
+        self.usage.add(usage)
+        if usage:
+            print(f"Tokens: {usage['input_tokens']} input ({usage['cached_tokens']} cached), "
+                  f"{usage['output_tokens']} output")
+        return clean_response_text(response.output_text)
+
+
+class AsyncOpenAIClient:
+    def __init__(self, include_subjects: bool = True, profile_path: str = None, max_concurrency: int = 16,
+                 upload_cache: Optional[UploadCache] = None) -> None:
+        """Initialize the asyncio OpenAI client with API key from environment variables.
+
+        This client does not go through AdaptiveRateLimiter, which blocks threads while
+        it waits for a slot. Calls are bounded by max_concurrency only, and 429s and
+        transient errors are retried by the SDK's own backoff (max_retries=2).
+
+        Args:
+            include_subjects: Whether to include subject classification in the prompt.
+                Defaults to True.
+            profile_path: Path to a YAML profile file. Defaults to the ICAEW profile.
+            max_concurrency: Maximum number of API calls (uploads and model calls
+                combined) in flight at once. Defaults to 16.
+            upload_cache: Optional content-addressed cache; files whose bytes were
+                uploaded before are not uploaded again.
+        """
+        load_dotenv()
+        if not os.getenv('OPENAI_API_KEY'):
+            raise ValueError("OPENAI_API_KEY environment variable not set")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.system_prompt = get_system_prompt(include_subjects, profile_path)
+        self.max_concurrency = max_concurrency
+        self.upload_cache = upload_cache
+        self.prompt_cache_key = make_prompt_cache_key(self.system_prompt)
+        self.usage = UsageTotals()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Per asyncio task, as the synchronous client's last usage is per thread
+        self._last_usage: contextvars.ContextVar = contextvars.ContextVar("last_usage", default=None)
+
+    @property
+    def last_usage(self) -> Optional[Dict[str, int]]:
+        """Token usage of the most recent model call made by the current asyncio task."""
+        return self._last_usage.get()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limiter, created lazily so it binds to the running event loop."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def upload_file(self, file: Union[str, BinaryIO], filename: Optional[str] = None) -> str:
+        """
+        Upload a file to OpenAI.
+
+        Args:
+            file: Path to the file to upload, or a seekable binary buffer
+            filename (str, optional): Name sent with a buffer; defaults to the path's basename
+
+        Returns:
+            str: The file ID assigned by OpenAI
+        """
+        is_path = isinstance(file, str)
+        filename = filename or (os.path.basename(file) if is_path else "document.pdf")
+        # Read off the event loop so a large (or spilled-over) file doesn't stall other requests
+        data = await asyncio.to_thread(_read_file_bytes, file)
+        digest = None
+        if self.upload_cache:
+            digest = hashlib.sha256(data).hexdigest()
+            cached_id = self.upload_cache.get(digest)
+            if cached_id:
+                print(f"Reusing previous upload of identical content. File ID: {cached_id}")
+                return cached_id
+
+        print(f"Uploading file: {file if is_path else filename + ' (in memory)'}")
+        async with self.semaphore:
+            uploaded_file = await self.client.files.create(
+                file=(filename, data),
+                purpose=FILE_PURPOSE
+            )
+        print(f"File uploaded successfully. File ID: {uploaded_file.id}")
+        if self.upload_cache:
+            self.upload_cache.put(digest, uploaded_file.id, len(data))
+        return uploaded_file.id
+
+    async def extract_metadata(self, file_id: str, context_prompt: Optional[str] = None) -> str:
+        """
+        Extract metadata from an uploaded file using OpenAI's API.
+
+        Args:
+            file_id (str): The ID of the uploaded file
+            context_prompt (str, optional): Custom context to prepend to the user message
+
+        Returns:
+            str: The extracted metadata
+        """
+        print("Extracting metadata...")
+        async with self.semaphore:
+            response = await self.client.responses.create(
+                model=DEFAULT_MODEL,
+                input=build_request_input(self.system_prompt, file_id, context_prompt),
+                extra_body={"prompt_cache_key": self.prompt_cache_key}
+            )
+        usage = usage_from_response(response)
+        self._last_usage.set(usage)
+        self.usage.add(usage)
+        return clean_response_text(response.output_text)
+
+
+def make_prompt_cache_key(system_prompt: str) -> str:
+    """Return a short, stable identifier for a compiled system prompt."""
+    return "metadata-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:24]
+
+
+def usage_from_response(response: Any) -> Optional[Dict[str, int]]:
+    """
+    Read token usage from a Responses API result (SDK object or raw dict from a batch).
+
+    Returns:
+        dict: {"input_tokens", "cached_tokens", "output_tokens"}, or None if not reported
+    """
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if not usage:
+        return None
+
+    def field(obj: Any, name: str) -> Any:
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+    details = field(usage, "input_tokens_details")
+    return {
+        "input_tokens": field(usage, "input_tokens") or 0,
+        "cached_tokens": (field(details, "cached_tokens") if details else 0) or 0,
+        "output_tokens": field(usage, "output_tokens") or 0,
+    }
+
+
+def is_missing_file_error(error: Exception) -> bool:
+    """Return True if an API error indicates that a referenced file no longer exists."""
+    status = getattr(error, 'status_code', None)
+    return status in (400, 404) and 'file' in str(error).lower()
+
+
+def _read_file_bytes(file: Union[str, BinaryIO]) -> bytes:
+    """Return the contents of a file path or a seekable binary buffer."""
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return f.read()
+    file.seek(0)
+    return file.read()
+
+
+def build_user_text(context_prompt: Optional[str] = None) -> str:
+    """
+    Build the user message text, prefixed with the optional background context.
+
+    Args:
+        context_prompt (str, optional): Custom context to prepend to the user message
+
+    Returns:
+        str: The user message text
+    """
+    user_text = "Please analyse this document and extract metadata according to the conventions specified. Return the metadata in the specified JSON format."
+    if context_prompt:
+        user_text = (
+            "The following is background context that identifies the subject, place, or event. "
+            "Use it to name what is shown in the document: e.g. if the context says these are photos of Chartered Accountant's Hall, "
+            "your description must identify the building as 'Chartered Accountant's Hall' (or similar), not as a generic 'building'. "
+            "Describe what is shown in the image/page using the names and identifications from the context below.\n\n"
+            f"Context: {context_prompt.strip()}\n\n"
+            "---\n\n"
+            f"{user_text}"
+        )
+    return user_text
+
+
+def build_request_input(system_prompt: str, file_id: Optional[str] = None, context_prompt: Optional[str] = None,
+                        document_text: Optional[str] = None,
+                        page_images: Optional[List[bytes]] = None) -> List[Dict[str, Any]]:
+    """
+    Build the `input` list for a responses.create call.
+
+    Everything that is the same for every document in a run (the system prompt, then
+    the instruction text with any context prompt) comes first, and the per-document
+    part comes last. That keeps a byte-stable prefix for provider-side prompt caching.
+
+    Args:
+        system_prompt (str): The compiled system prompt
+        file_id (str, optional): The ID of the uploaded file
+        context_prompt (str, optional): Custom context to prepend to the user message
+        document_text (str, optional): Locally extracted document text, sent instead of a file
+        page_images (list, optional): JPEG data of rendered pages, sent instead of a file
+
+    Returns:
+        list: Message list for the Responses API
+    """
+    if page_images is not None:
+        document_parts = [
+            {
+                "type": "input_image",
+                "image_url": f"data:image/jpeg;base64,{base64.b64encode(image).decode('ascii')}",
+                "detail": "auto",
+            }
+            for image in page_images
+        ]
+    elif document_text is not None:
+        document_parts = [{
+            "type": "input_text",
+            "text": f"Document text (extracted from the PDF text layer):\n\n{document_text}",
+        }]
+    else:
+        document_parts = [{
+            "type": "input_file",
+            "file_id": file_id,
+        }]
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": [
                 {
-                    "role": "system",
-                    "content": self.system_prompt
+                    "type": "input_text",
+                    "text": build_user_text(context_prompt),
                 },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "file_id": file_id,
-                        },
-                        {
-                            "type": "input_text",
-                            "text": user_text,
-                        },
-                    ]
-                }
+                *document_parts,
             ]
-        )
-        text = response.output_text
-        if not text:
-            raise ValueError("Empty response from model — no output text returned.")
-        # Strip markdown code fences the model may wrap the JSON in
-        text = text.strip()
-        if text.startswith("```"):
-            lines = text.splitlines()
-            text = "\n".join(lines[1:-1]).strip()
-        return text
+        }
+    ]
+
+
+def clean_response_text(text: Optional[str]) -> str:
+    """
+    Validate the model output and strip any markdown code fences around the JSON.
+
+    Args:
+        text (str): Raw output text from the model
+
+    Returns:
+        str: The JSON text
+
+    Raises:
+        ValueError: If the model returned no output text
+    """
+    if not text:
+        raise ValueError("Empty response from model — no output text returned.")
+    # Strip markdown code fences the model may wrap the JSON in
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.splitlines()
+        text = "\n".join(lines[1:-1]).strip()
+    return text
@@ -0,0 +1,182 @@
+"""
+Sidecar index of a JSON output file.
+
+JSONMetadataWriter keeps `<json_file>.index.sqlite` next to the output. It holds
+the record count, per-format counts, created/last-updated timestamps, the byte
+offset where the records array ends, and the byte offset and length of every
+record by asset_id. Counts, summaries and single-record lookups read the index
+instead of parsing the whole file.
+
+The index stores the size and modification time of the JSON file it describes;
+if the file has been changed by anything else, is_current() is False and the
+writer rebuilds it. In journal mode the summary also counts the records waiting
+in the journal and the indexed records that journal tombstones replace, so the
+writer's record count never reads the journal.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# (asset_id, original_format, offset, length)
+IndexEntry = Tuple[str, str, int, int]
+
+
+def index_path_for(json_file: str) -> str:
+    """Return the sidecar index path for an output JSON file."""
+    return json_file + ".index.sqlite"
+
+
+class OutputIndex:
+    def __init__(self, json_file: str, read_only: bool = False) -> None:
+        """
+        Open (creating if needed) the index of a JSON output file.
+
+        Args:
+            json_file (str): Path to the JSON output file
+            read_only (bool): Open an existing index without creating or changing it
+                (raises sqlite3.OperationalError if there is none)
+        """
+        self.json_file = json_file
+        self.path = index_path_for(json_file)
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30,
+                                         check_same_thread=False)
+            return
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS summary (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " asset_id TEXT NOT NULL,"
+            " original_format TEXT NOT NULL,"
+            " offset INTEGER NOT NULL,"
+            " length INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_asset_id ON records (asset_id)")
+        self._conn.commit()
+
+    @classmethod
+    def open_current(cls, json_file: str) -> Optional["OutputIndex"]:
+        """Open an existing index read-only if it describes the file as it is now, else return None."""
+        if not os.path.exists(index_path_for(json_file)):
+            return None
+        try:
+            index = cls(json_file, read_only=True)
+            if index.is_current():
+                return index
+            index.close()
+        except sqlite3.Error:
+            pass
+        return None
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the indexed summary, or None if the index is empty.
+
+        Returns:
+            dict: total_records, format_counts, created_at, last_updated, records_end, json_size,
+                json_mtime_ns, journal_records and journal_replaced
+        """
+        with self._lock:
+            try:
+                values = dict(self._conn.execute("SELECT key, value FROM summary").fetchall())
+            except sqlite3.Error:
+                return None
+        return json.loads(values["summary"]) if "summary" in values else None
+
+    def is_current(self) -> bool:
+        """Return True if the index describes the JSON file at its current size and modification time."""
+        summary = self.summary()
+        if summary is None:
+            return False
+        try:
+            stat = os.stat(self.json_file)
+        except FileNotFoundError:
+            return False
+        return summary["json_size"] == stat.st_size and summary.get("json_mtime_ns") == stat.st_mtime_ns
+
+    def _store(self, summary: Dict[str, Any], entries: List[IndexEntry], replace: bool) -> None:
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM records")
+            self._conn.executemany("INSERT INTO records (asset_id, original_format, offset, length) "
+                                   "VALUES (?, ?, ?, ?)", entries)
+            self._conn.execute("INSERT OR REPLACE INTO summary (key, value) VALUES ('summary', ?)",
+                               (json.dumps(summary),))
+
+    def rebuild(self, entries: List[IndexEntry], created_at: str, last_updated: str, records_end: int,
+                json_size: int) -> None:
+        """Replace the index with the given records (after the JSON file was written in full)."""
+        format_counts: Dict[str, int] = {}
+        for _, original_format, _, _ in entries:
+            format_counts[original_format] = format_counts.get(original_format, 0) + 1
+        # The journal is not part of the file; its counts carry over until it is compacted
+        previous = self.summary() or {}
+        summary = {"total_records": len(entries), "format_counts": format_counts, "created_at": created_at,
+                   "last_updated": last_updated, "records_end": records_end, "json_size": json_size,
+                   "json_mtime_ns": os.stat(self.json_file).st_mtime_ns,
+                   "journal_records": previous.get("journal_records", 0),
+                   "journal_replaced": previous.get("journal_replaced", 0)}
+        self._store(summary, entries, replace=True)
+
+    def append(self, entries: List[IndexEntry], last_updated: str, records_end: int, json_size: int) -> None:
+        """Add records appended to the JSON file."""
+        summary = self.summary()
+        for _, original_format, _, _ in entries:
+            summary["format_counts"][original_format] = summary["format_counts"].get(original_format, 0) + 1
+        summary.update(total_records=summary["total_records"] + len(entries), last_updated=last_updated,
+                       records_end=records_end, json_size=json_size,
+                       json_mtime_ns=os.stat(self.json_file).st_mtime_ns)
+        self._store(summary, entries, replace=False)
+
+    def set_journal_counts(self, journal_records: int, journal_replaced: int) -> None:
+        """
+        Record the state of the writer's journal.
+
+        Args:
+            journal_records (int): Records in the journal that are still current
+            journal_replaced (int): Records in the JSON output replaced by journal tombstones
+        """
+        summary = self.summary()
+        summary.update(journal_records=journal_records, journal_replaced=journal_replaced)
+        self._store(summary, [], replace=False)
+
+    def lookup(self, asset_id: str) -> Optional[Tuple[int, int]]:
+        """Return (offset, length) of the most recent record for an asset, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT offset, length FROM records WHERE asset_id = ? "
+                                     "ORDER BY id DESC LIMIT 1", (asset_id,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def asset_ids(self) -> Set[str]:
+        """Return the asset IDs of all indexed records."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT DISTINCT asset_id FROM records")}
+
+    def count(self, asset_ids: Iterable[str]) -> int:
+        """Return the number of records for the given assets."""
+        asset_ids = list(asset_ids)
+        total = 0
+        with self._lock:
+            # In chunks, within SQLite's limit on query parameters
+            for start in range(0, len(asset_ids), 500):
+                chunk = asset_ids[start:start + 500]
+                total += self._conn.execute(
+                    f"SELECT COUNT(*) FROM records WHERE asset_id IN ({', '.join('?' * len(chunk))})",
+                    chunk).fetchone()[0]
+        return total
+
+    def entries(self) -> List[IndexEntry]:
+        """Return every record's (asset_id, original_format, offset, length) in file order."""
+        with self._lock:
+            return self._conn.execute("SELECT asset_id, original_format, offset, length FROM records "
+                                      "ORDER BY offset").fetchall()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,73 @@
+"""
+Manifest of a sharded JSON output.
+
+With rotation (main.py --rotate-records / --rotate-mb), JSONMetadataWriter writes
+output.0001.json, output.0002.json, ... instead of output.json. Each shard is a
+complete JSON envelope, and output.manifest.json lists them in order:
+
+    {"shards": [{"file": "output.0001.json", "records": 1000, "bytes": 812345,
+                 "format_counts": {"pdf": 990, "docx": 10}}, ...],
+     "total_records": 2400, "created_at": ..., "last_updated": ...}
+
+Shard file names are relative to the manifest. record_reader.iter_records and the
+CSV converter accept the manifest, or the output.json path it stands in for, and
+read the shards in order.
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def manifest_path_for(json_file: str) -> str:
+    """Return the manifest path for a sharded output JSON file (output.json -> output.manifest.json)."""
+    return os.path.splitext(json_file)[0] + MANIFEST_SUFFIX
+
+
+def shard_path_for(json_file: str, number: int) -> str:
+    """Return the path of a numbered shard (output.json, 2 -> output.0002.json)."""
+    base, extension = os.path.splitext(json_file)
+    return f"{base}.{number:04d}{extension or '.json'}"
+
+
+def is_manifest(path: str) -> bool:
+    """Return True if the path names a manifest."""
+    return path.endswith(MANIFEST_SUFFIX)
+
+
+def resolve_output(path: str) -> str:
+    """Return the manifest for an output path that was sharded (and so does not exist), else the path."""
+    if not os.path.exists(path) and not is_manifest(path) and os.path.exists(manifest_path_for(path)):
+        return manifest_path_for(path)
+    return path
+
+
+def new_manifest() -> Dict[str, Any]:
+    """Return an empty manifest."""
+    now = datetime.now().isoformat()
+    return {"shards": [], "total_records": 0, "created_at": now, "last_updated": now}
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    """Load a manifest."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    """Write a manifest, replacing the old one atomically."""
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+def shard_paths(path: str, manifest: Dict[str, Any]) -> List[str]:
+    """Return the paths of a manifest's shards, in order."""
+    directory = os.path.dirname(path)
+    return [os.path.join(directory, shard["file"]) for shard in manifest["shards"]]
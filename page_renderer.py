@@ -0,0 +1,242 @@
+"""
+Render image-only PDF pages to downscaled JPEGs for --input-mode image.
+
+Photo series converted by convert_documents and scanned PDFs are a wrapper around
+one or more images per page. Instead of uploading the whole PDF, the images drawn
+on each selected page are composed onto a white canvas at their position, scaled
+so the longest edge is at most max_edge pixels, and sent as `input_image` parts.
+
+There is no general PDF rasteriser among the dependencies, so only pages that
+consist of images (and invisible OCR text) are rendered. A page with visible text,
+vector drawing or an image format Pillow cannot decode makes render return None,
+and the document is uploaded as a PDF instead.
+"""
+
+import io
+import math
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+from PyPDF2.generic import ArrayObject, ContentStream
+
+from config import IMAGE_INPUT_JPEG_QUALITY, IMAGE_INPUT_MAX_EDGE, IMAGE_INPUT_MAX_PAGES
+from page_window import PageWindowReader
+from upload_optimiser import IDENTITY_MATRIX, MAX_FORM_DEPTH, decode_image, get_resource, multiply_matrices
+
+# Operators that show text, and text rendering mode 3 (invisible, e.g. an OCR layer)
+_TEXT_OPERATORS = {b"Tj", b"TJ", b"'", b'"'}
+_INVISIBLE_TEXT = 3
+# Operators that paint paths or shadings, which cannot be rendered here
+_PAINT_OPERATORS = {b"S", b"s", b"f", b"F", b"f*", b"B", b"B*", b"b", b"b*", b"sh", b"INLINE IMAGE"}
+
+
+class _NotRenderable(Exception):
+    """The page draws something other than images."""
+
+
+def _collect_images(contents: Any, resources: Any, ctm: Tuple[float, ...], pdf: Any,
+                    draws: List[Tuple[Any, Tuple[float, ...]]], depth: int = 0) -> None:
+    """Collect (image, transformation matrix) for every image a content stream draws, following forms."""
+    xobjects = get_resource(resources, "/XObject")
+    stack: List[Tuple[Tuple[float, ...], int]] = []
+    text_mode = 0
+    for operands, operator in ContentStream(contents, pdf).operations:
+        if operator == b"q":
+            stack.append((ctm, text_mode))
+        elif operator == b"Q":
+            ctm, text_mode = stack.pop() if stack else (ctm, text_mode)
+        elif operator == b"cm" and len(operands) == 6:
+            ctm = multiply_matrices(tuple(float(x) for x in operands), ctm)
+        elif operator == b"Tr" and operands:
+            text_mode = int(operands[0])
+        elif operator in _TEXT_OPERATORS and text_mode != _INVISIBLE_TEXT:
+            raise _NotRenderable("page has visible text")
+        elif operator in _PAINT_OPERATORS:
+            raise _NotRenderable("page has vector drawing")
+        elif operator == b"Do" and operands and operands[0] in xobjects:
+            xobject = xobjects[operands[0]]
+            subtype = xobject.get("/Subtype")
+            if subtype == "/Image":
+                draws.append((xobject, ctm))
+            elif subtype == "/Form" and depth < MAX_FORM_DEPTH:
+                matrix = tuple(float(x) for x in xobject["/Matrix"]) if "/Matrix" in xobject else IDENTITY_MATRIX
+                _collect_images(xobject, xobject.get("/Resources", resources), multiply_matrices(matrix, ctm),
+                                pdf, draws, depth + 1)
+
+
+def _decode(image: Any) -> Any:
+    """Decode an image XObject for compositing (RGB), including the 1-bit and fax formats scanners write."""
+    from PIL import Image, ImageOps
+
+    if image.get("/ImageMask"):
+        raise _NotRenderable("stencil mask")
+    decoded = decode_image(image)
+    if decoded is None:
+        size = (int(image["/Width"]), int(image["/Height"]))
+        filters = image.get("/Filter")
+        filters = [filters] if isinstance(filters, str) else list(filters or [])
+        try:
+            if filters and filters[-1] in ("/DCTDecode", "/JPXDecode", "/CCITTFaxDecode"):
+                # get_data undoes any earlier filters (e.g. ASCII85) and leaves the JPEG or JPEG 2000
+                # data; PyPDF2 wraps fax data in a TIFF header
+                decoded = Image.open(io.BytesIO(image.get_data()))
+            elif image.get("/BitsPerComponent") == 1 and "/JBIG2Decode" not in filters:
+                decoded = Image.frombytes("1", size, image.get_data())
+            else:
+                raise _NotRenderable("unsupported image format")
+            decoded.load()
+        except _NotRenderable:
+            raise
+        except Exception as e:
+            raise _NotRenderable(f"cannot decode image: {e}")
+        decode = image.get("/Decode")
+        if isinstance(decode, ArrayObject) and len(decode) == 2 and float(decode[0]) > float(decode[1]):
+            decoded = ImageOps.invert(decoded.convert("L"))
+    return decoded.convert("RGB")
+
+
+def _soft_mask(image: Any, size: Tuple[int, int]) -> Optional[Any]:
+    """Return the image's 8-bit soft mask as an "L" image of the given size, if it has one."""
+    from PIL import Image
+
+    smask = image.get("/SMask")
+    if smask is None:
+        return None
+    smask = smask.get_object()
+    try:
+        mask = Image.frombytes("L", (int(smask["/Width"]), int(smask["/Height"])), smask.get_data())
+    except Exception:
+        return None
+    return mask.resize(size) if mask.size != size else mask
+
+
+def render_page(pdf_path: str, index: int, max_edge: int = IMAGE_INPUT_MAX_EDGE,
+                quality: int = IMAGE_INPUT_JPEG_QUALITY) -> Optional[bytes]:
+    """
+    Render one image-only page as a JPEG. Runs in a worker process.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        index (int): Zero-based page index
+        max_edge (int): Longest edge of the output in pixels
+        quality (int): JPEG quality (1-95)
+
+    Returns:
+        bytes: JPEG data, or None if the page is not image-only or cannot be decoded
+    """
+    from PIL import Image
+
+    try:
+        with PageWindowReader(pdf_path) as window:
+            page = window.page(index)
+            box = page.cropbox
+            left, bottom = float(box.left), float(box.bottom)
+            width_pt, height_pt = float(box.width), float(box.height)
+            draws: List[Tuple[Any, Tuple[float, ...]]] = []
+            contents = page.get_contents()
+            if contents is not None:
+                _collect_images(contents, page.get("/Resources"), IDENTITY_MATRIX, window.reader, draws)
+            if not draws or width_pt <= 0 or height_pt <= 0:
+                return None
+            images = [(_decode(image), image, ctm) for image, ctm in draws]
+
+            # Pixels per point: enough for the sharpest image, but within max_edge
+            density = max(decoded.width / max(1e-6, math.hypot(ctm[0], ctm[1])) for decoded, _, ctm in images)
+            scale = min(density, max_edge / max(width_pt, height_pt))
+            canvas_size = (max(1, round(width_pt * scale)), max(1, round(height_pt * scale)))
+            canvas = Image.new("RGB", canvas_size, "white")
+
+            for decoded, image, ctm in images:
+                a, b, c, d, e, f = ctm
+                determinant = a * d - b * c
+                if abs(determinant) < 1e-9:
+                    continue
+                # Shrink before the affine transform, which samples too few pixels to downscale well
+                target = (max(1, round(math.hypot(a, b) * scale)), max(1, round(math.hypot(c, d) * scale)))
+                if decoded.width > target[0] * 2 or decoded.height > target[1] * 2:
+                    decoded = decoded.resize((min(decoded.width, target[0]), min(decoded.height, target[1])),
+                                             Image.LANCZOS)
+                mask = _soft_mask(image, decoded.size)
+                # Canvas pixel (X, Y) -> page point (x, y) -> unit square (u, v) -> image pixel (u * w, (1 - v) * h)
+                w, h = decoded.size
+                ia, ib = d / determinant, -b / determinant
+                ic, id_ = -c / determinant, a / determinant
+                ie, if_ = (c * f - d * e) / determinant, (b * e - a * f) / determinant
+                x_per_pixel, y_per_pixel = 1 / scale, -1 / scale
+                x0, y0 = left, bottom + height_pt
+                u = (ia * x_per_pixel, ic * y_per_pixel, ia * x0 + ic * y0 + ie)
+                v = (ib * x_per_pixel, id_ * y_per_pixel, ib * x0 + id_ * y0 + if_)
+                affine = (u[0] * w, u[1] * w, u[2] * w, -v[0] * h, -v[1] * h, (1 - v[2]) * h)
+                placed = decoded.transform(canvas_size, Image.AFFINE, affine, Image.BILINEAR)
+                coverage = (mask or Image.new("L", decoded.size, 255)).transform(
+                    canvas_size, Image.AFFINE, affine, Image.BILINEAR, fillcolor=0)
+                canvas.paste(placed, (0, 0), coverage)
+
+            rotate = int(page.get("/Rotate", 0) or 0) % 360
+            if rotate:
+                # /Rotate turns the page clockwise for display
+                canvas = canvas.rotate(-rotate, expand=True)
+        output = io.BytesIO()
+        canvas.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+    except _NotRenderable:
+        return None
+
+
+class PageRenderer:
+    def __init__(self, max_edge: int = IMAGE_INPUT_MAX_EDGE, quality: int = IMAGE_INPUT_JPEG_QUALITY,
+                 workers: Optional[int] = None, max_pages: int = IMAGE_INPUT_MAX_PAGES) -> None:
+        """
+        Initialize a renderer. Pages are rendered on a process pool shared by all documents.
+
+        Args:
+            max_edge (int): Longest edge of each rendered page in pixels
+            quality (int): JPEG quality (1-95)
+            workers (int, optional): Worker processes (default: number of CPUs)
+            max_pages (int): Documents with more selected pages than this are uploaded as PDFs
+        """
+        self.max_edge = max_edge
+        self.quality = quality
+        self.workers = workers
+        self.max_pages = max_pages
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def render(self, pdf_path: str, indices: List[int]) -> Optional[List[bytes]]:
+        """
+        Render the given pages of a document.
+
+        Args:
+            pdf_path (str): Path to the PDF file
+            indices (list): Zero-based page indices
+
+        Returns:
+            list: JPEG data per page, or None if any page cannot be rendered (upload the PDF instead)
+        """
+        if not indices:
+            return None
+        if len(indices) > self.max_pages:
+            print(f"{len(indices)} pages selected (more than {self.max_pages}); uploading PDF instead")
+            return None
+        executor = self._pool()
+        futures = [executor.submit(render_page, pdf_path, i, self.max_edge, self.quality) for i in indices]
+        images = [future.result() for future in futures]
+        if any(image is None for image in images):
+            print("Selected pages are not image-only; uploading PDF instead")
+            return None
+        print(f"Rendered {len(images)} page(s) ({sum(len(image) for image in images) / 1024:.0f} KB)")
+        return images
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
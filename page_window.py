@@ -0,0 +1,319 @@
+"""
+Fast page counting and page-window access for very large PDFs.
+
+`PdfReader.pages` flattens the whole page tree, resolving every page object, and
+`PdfReader(path)` first reads the entire file into memory. For 800-2,000 page
+compilations that dominates the cost of slicing out a few first/last pages.
+
+PageWindowReader instead opens the file through a read-only memory map (so only
+the parts that are touched are paged in), takes the page count from the /Count
+of the page tree root, and reaches a page by descending the tree using each
+node's /Count, resolving only the nodes on the way. Copying a page into a
+PdfWriter then pulls in just that page and the objects it references. A tree
+whose counts don't add up falls back to the full PyPDF2 flatten.
+
+Compare against the PyPDF2 path on synthetic PDFs with:
+    python page_window.py --benchmark [--pages 800 2000] [--page-kb 50]
+"""
+
+import mmap
+import os
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from PyPDF2 import PageObject, PdfReader
+from PyPDF2.generic import IndirectObject, NameObject
+
+# Attributes a page inherits from its ancestors in the page tree (PDF 32000-1, 7.7.3.4)
+INHERITABLE_PAGE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+class PageWindowReader:
+    def __init__(self, pdf_path: str) -> None:
+        """
+        Open a PDF through a read-only memory map.
+
+        Args:
+            pdf_path (str): Path to the PDF file
+        """
+        self.pdf_path = pdf_path
+        self._file: BinaryIO = open(pdf_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.reader = PdfReader(self._map)
+        except Exception:
+            self.close()
+            raise
+        self._page_count: Optional[int] = None
+        self._flattened = False
+        self.encrypted = False
+        if self.reader.is_encrypted:
+            # Files with only an owner password open with the empty user password
+            try:
+                self.encrypted = not self.reader.decrypt("")
+            except Exception:
+                self.encrypted = True
+
+    def __enter__(self) -> "PageWindowReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages, read from the page tree root without visiting the pages."""
+        if self._page_count is None:
+            count = self._root_pages().get("/Count")
+            if isinstance(count, int) and count >= 0:
+                self._page_count = int(count)
+            else:
+                self._page_count = self._flatten()
+        return self._page_count
+
+    def page(self, index: int) -> PageObject:
+        """
+        Return one page, resolving only the page tree nodes above it.
+
+        Args:
+            index (int): Zero-based page index
+
+        Returns:
+            PageObject: The page, with inherited attributes applied
+        """
+        if not 0 <= index < self.page_count:
+            raise IndexError(f"Page index {index} out of range ({self.page_count} pages)")
+        if not self._flattened:
+            try:
+                return self._descend(index)
+            except (KeyError, TypeError, ValueError, IndexError):
+                # Inconsistent /Count or a malformed node: let PyPDF2 walk the whole tree
+                self._page_count = self._flatten()
+        return self.reader.pages[index]
+
+    def pages(self, indices: List[int]) -> List[PageObject]:
+        """Return the pages at the given indices."""
+        return [self.page(i) for i in indices]
+
+    def close(self) -> None:
+        """Release the memory map and the file. Pages must be copied out before closing."""
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _root_pages(self) -> Any:
+        """Return the root node of the page tree."""
+        return self.reader.trailer["/Root"].get_object()["/Pages"].get_object()
+
+    def _flatten(self) -> int:
+        """Fall back to PyPDF2's full page tree walk and return the page count."""
+        self._flattened = True
+        return len(self.reader.pages)
+
+    def _descend(self, index: int) -> PageObject:
+        """Walk from the root to the page at index, skipping subtrees by their /Count."""
+        node = self._root_pages()
+        inherited: Dict[str, Any] = {}
+        remaining = index
+        while True:
+            for attr in INHERITABLE_PAGE_ATTRIBUTES:
+                if attr in node:
+                    inherited[attr] = node[attr]
+            for kid_ref in node["/Kids"]:
+                kid = kid_ref.get_object()
+                if kid.get("/Type") == "/Pages" or "/Kids" in kid:
+                    count = int(kid["/Count"])
+                    if remaining < count:
+                        node = kid
+                        break
+                    remaining -= count
+                else:
+                    if remaining == 0:
+                        return self._page_object(kid, kid_ref, inherited)
+                    remaining -= 1
+            else:
+                raise IndexError(f"Page tree counts do not cover page index {index}")
+
+    def _page_object(self, page: Any, reference: Any, inherited: Dict[str, Any]) -> PageObject:
+        """Wrap a page dictionary like PdfReader does, applying inherited attributes."""
+        for attr, value in inherited.items():
+            # A page's own value overrides the inherited one
+            if attr not in page:
+                page[NameObject(attr)] = value
+        page_obj = PageObject(self.reader, reference if isinstance(reference, IndirectObject) else None)
+        page_obj.update(page)
+        return page_obj
+
+
+def count_pages(pdf_path: str) -> int:
+    """Return the number of pages in a PDF without walking its page tree."""
+    with PageWindowReader(pdf_path) as window:
+        return window.page_count
+
+
+def _write_synthetic_pdf(path: str, pages: int, page_kb: int = 0, fanout: int = 10) -> None:
+    """
+    Write a benchmark PDF: a text content stream per page, an optional incompressible
+    image-like stream of page_kb per page, and a balanced page tree like real producers emit.
+    """
+    import zlib
+
+    objects: Dict[int, bytes] = {}
+    next_id = [0]
+
+    def new_id() -> int:
+        next_id[0] += 1
+        return next_id[0]
+
+    catalog, font = new_id(), new_id()
+    objects[font] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    leaves = []
+    for i in range(pages):
+        text = b"BT /F1 11 Tf 50 800 Td 14 TL " + b" ".join(
+            b"(Page %d line %d of a long annual report compilation) '" % (i + 1, j) for j in range(45)) + b" ET"
+        data = zlib.compress(text)
+        content = new_id()
+        objects[content] = (b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data)) + data + b"\nendstream"
+        resources = b""
+        if page_kb:
+            blob = os.urandom(page_kb * 1024)
+            image = new_id()
+            objects[image] = (b"<< /Type /XObject /Subtype /Image /Width %d /Height 1 /ColorSpace /DeviceGray "
+                              b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (len(blob), len(blob))) + blob + b"\nendstream"
+            resources = b" /Resources << /Font << /F1 %d 0 R >> /XObject << /Im0 %d 0 R >> >>" % (font, image)
+        leaves.append((new_id(), content, resources))
+
+    parents: Dict[int, int] = {}
+    nodes: Dict[int, List[int]] = {}
+    counts: Dict[int, int] = {leaf: 1 for leaf, _, _ in leaves}
+    level = [leaf for leaf, _, _ in leaves]
+    while len(level) > 1 or not nodes:
+        parent_level = []
+        for start in range(0, len(level), fanout):
+            group = level[start:start + fanout]
+            node = new_id()
+            nodes[node] = group
+            counts[node] = sum(counts[kid] for kid in group)
+            for kid in group:
+                parents[kid] = node
+            parent_level.append(node)
+        level = parent_level
+    root = level[0]
+
+    for leaf, content, resources in leaves:
+        objects[leaf] = b"<< /Type /Page /Parent %d 0 R /Contents %d 0 R%s >>" % (parents[leaf], content, resources)
+    for node, kids in nodes.items():
+        refs = b" ".join(b"%d 0 R" % kid for kid in kids)
+        extra = b" /Resources << /Font << /F1 %d 0 R >> >> /MediaBox [0 0 595 842]" % font if node == root else b""
+        parent = b" /Parent %d 0 R" % parents[node] if node in parents else b""
+        objects[node] = b"<< /Type /Pages /Kids [%s] /Count %d%s%s >>" % (refs, counts[node], parent, extra)
+    objects[catalog] = b"<< /Type /Catalog /Pages %d 0 R >>" % root
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for obj_id in range(1, next_id[0] + 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % obj_id + objects[obj_id] + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (next_id[0] + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_id[0] + 1, catalog, xref))
+
+
+def benchmark(page_counts: List[int], page_kb: int = 50, first_pages: int = 6, last_pages: int = 4,
+              repeat: int = 3) -> None:
+    """
+    Time page counting and first/last slicing: PyPDF2's full reader against PageWindowReader.
+
+    Args:
+        page_counts (list): Sizes of the synthetic PDFs to generate
+        page_kb (int): Size of the incompressible image stream on each page
+        first_pages (int): Pages taken from the start
+        last_pages (int): Pages taken from the end
+        repeat (int): Runs per measurement; the best is reported
+    """
+    import io
+    import tempfile
+    import time
+    from PyPDF2 import PdfWriter
+    from pdf_utils import select_page_indices
+
+    def best_of(fn) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def pypdf2_slice(path: str) -> int:
+        reader = PdfReader(path)
+        writer = PdfWriter()
+        for i in select_page_indices(len(reader.pages), first_pages, last_pages):
+            writer.add_page(reader.pages[i])
+        out = io.BytesIO()
+        writer.write(out)
+        return len(out.getvalue())
+
+    def window_slice(path: str) -> int:
+        with PageWindowReader(path) as window:
+            writer = PdfWriter()
+            for page in window.pages(select_page_indices(window.page_count, first_pages, last_pages)):
+                writer.add_page(page)
+            out = io.BytesIO()
+            writer.write(out)
+        return len(out.getvalue())
+
+    print(f"Slicing first {first_pages} + last {last_pages} pages; best of {repeat} runs")
+    print(f"{'pages':>6} {'file MB':>8} {'count PyPDF2':>13} {'count mmap':>11} "
+          f"{'slice PyPDF2':>13} {'slice mmap':>11} {'speed-up':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in page_counts:
+            path = os.path.join(directory, f"synthetic-{pages}.pdf")
+            _write_synthetic_pdf(path, pages, page_kb)
+            if pypdf2_slice(path) <= 0 or window_slice(path) <= 0:
+                raise RuntimeError("Slicing produced an empty PDF")
+            count_full = best_of(lambda: len(PdfReader(path).pages))
+            count_fast = best_of(lambda: count_pages(path))
+            slice_full = best_of(lambda: pypdf2_slice(path))
+            slice_fast = best_of(lambda: window_slice(path))
+            print(f"{pages:>6} {os.path.getsize(path) / 1048576:>8.1f} {count_full * 1000:>11.1f}ms "
+                  f"{count_fast * 1000:>9.1f}ms {slice_full * 1000:>11.1f}ms {slice_fast * 1000:>9.1f}ms "
+                  f"{slice_full / slice_fast:>8.1f}x")
+
+
+def main():
+    """Command line interface for counting pages and running the benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Fast page counting for large PDFs, and a benchmark against the PyPDF2 path',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  # Count pages:
+  python page_window.py report.pdf
+
+  # Benchmark slicing on synthetic 800- and 2,000-page PDFs:
+  python page_window.py --benchmark --pages 800 2000
+        '''
+    )
+    parser.add_argument('pdf_files', nargs='*', help='PDF files to count pages of')
+    parser.add_argument('--benchmark', action='store_true', help='Run the benchmark on synthetic PDFs')
+    parser.add_argument('--pages', type=int, nargs='+', default=[800, 2000],
+                        help='Page counts of the synthetic PDFs (default: 800 2000)')
+    parser.add_argument('--page-kb', type=int, default=50,
+                        help='Image data per synthetic page in KB (default: 50)')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.pages, args.page_kb)
+    for pdf_file in args.pdf_files:
+        print(f"{pdf_file}: {count_pages(pdf_file)} pages")
+    if not args.benchmark and not args.pdf_files:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
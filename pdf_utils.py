@@ -3,44 +3,218 @@ PDF utility functions for handling PDF files.
 """
 
 import os
+import re
 import tempfile
-from typing import Optional
-from PyPDF2 import PdfReader, PdfWriter
+from collections import Counter
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from PyPDF2 import PdfWriter
 
+from config import AUTO_PAGES_SCAN_LIMIT, PARTIAL_PDF_SPILL_MB
+from page_window import PageWindowReader
+from upload_optimiser import format_report, optimise_writer
 
-def create_partial_pdf(pdf_path: str, first_pages: int = 0, last_pages: int = 0) -> str:
+# A page with fewer extracted characters than this is treated as having no text layer
+MIN_PAGE_TEXT_CHARS = 20
+
+# Page scoring for --pages auto:N: text beyond this many characters adds nothing more,
+# so dense tables and notes don't outrank title and summary pages
+TEXT_SATURATION_CHARS = 800
+TITLE_LINE_MAX_CHARS = 80
+
+
+def select_page_indices(total_pages: int, first_pages: int = 0, last_pages: int = 0) -> List[int]:
     """
-    Create a new PDF containing only the specified number of pages from the start and end.
+    Return the zero-based page indices covered by a first/last page window.
 
     Args:
-        pdf_path (str): Path to the original PDF file
+        total_pages (int): Number of pages in the document
         first_pages (int): Number of pages to include from the start
         last_pages (int): Number of pages to include from the end
 
     Returns:
-        str: Path to the temporary PDF file containing selected pages
+        list: Sorted page indices; every page when no window is set or the window covers the document
     """
+    if (first_pages <= 0 and last_pages <= 0) or first_pages + last_pages >= total_pages:
+        return list(range(total_pages))
+    indices = list(range(min(first_pages, total_pages)))
+    if last_pages > 0:
+        indices.extend(range(max(first_pages, total_pages - last_pages), total_pages))
+    return indices
+
+
+def _is_title_line(line: str) -> bool:
+    """Return True for short, capitalised lines that look like titles or headings."""
+    words = line.split()
+    if not 1 <= len(words) <= 12 or len(line) > TITLE_LINE_MAX_CHARS or line.endswith(('.', ',', ';', ':')):
+        return False
+    letters = sum(1 for c in line if c.isalpha())
+    if letters < 4 or letters < 0.6 * len(line.replace(' ', '')):
+        return False
+    capitalised = sum(1 for word in words if word[0].isupper())
+    return line.isupper() or capitalised >= 0.6 * len(words)
+
+
+def _page_features(page: Any) -> Tuple[str, float]:
+    """
+    Extract a page's text and the share of the page covered by images, in one content stream pass.
+
+    Returns:
+        tuple: (text, image_coverage) with image_coverage between 0 and 1
+    """
+    try:
+        xobjects = page["/Resources"]["/XObject"]
+        images = {name for name, ref in xobjects.items() if ref.get_object().get("/Subtype") == "/Image"}
+    except (KeyError, TypeError, AttributeError):
+        images = set()
+    box = page.mediabox
+    page_area = abs(float(box.width) * float(box.height)) or 1.0
+    coverage = 0.0
+
+    def visit(operator, operands, cm_matrix, tm_matrix):
+        nonlocal coverage
+        # An image fills the unit square mapped through the current transformation matrix
+        if operator == b"Do" and operands and operands[0] in images:
+            a, b, c, d = (float(x) for x in cm_matrix[:4])
+            coverage += abs(a * d - b * c) / page_area
+
     try:
-        # Read the original PDF
-        reader = PdfReader(pdf_path)
-        total_pages = len(reader.pages)
+        text = (page.extract_text(visitor_operand_before=visit) or "").strip()
+    except Exception:
+        text = ""
+    return text, min(coverage, 1.0)
+
+
+def select_informative_pages(window: PageWindowReader, count: int,
+                             scan_limit: int = AUTO_PAGES_SCAN_LIMIT, verbose: bool = True) -> List[int]:
+    """
+    Pick the pages most likely to carry a document's metadata.
+
+    Each scanned page is scored from its text length, its title-like lines and how
+    much of it is covered by images (image-only covers and blank pages score low).
+    Lines repeated on many pages, such as running headers and footers, are ignored.
+    Long documents are only scanned up to scan_limit pages.
+
+    Args:
+        window (PageWindowReader): Open PDF
+        count (int): Number of pages to pick
+        scan_limit (int): Maximum number of pages to score
+        verbose (bool): Print the pages picked
 
-        if first_pages + last_pages >= total_pages:
+    Returns:
+        list: Sorted zero-based page indices
+    """
+    total_pages = window.page_count
+    if count >= total_pages:
+        return list(range(total_pages))
+    head = scan_limit * 3 // 4
+    candidates = select_page_indices(total_pages, head, scan_limit - head)
+
+    features = [(i, *_page_features(window.page(i))) for i in candidates]
+    page_lines = {}
+    line_pages: Counter = Counter()
+    for i, text, _ in features:
+        # Digits are masked so "Page 12" footers count as the same line on every page
+        lines = {re.sub(r'\d+', '#', line.strip().lower()): line.strip() for line in text.splitlines() if line.strip()}
+        page_lines[i] = lines
+        line_pages.update(lines.keys())
+    boilerplate = {key for key, pages in line_pages.items() if pages >= max(3, 0.3 * len(features))}
+
+    scores = []
+    for i, text, image_coverage in features:
+        body = [line for key, line in page_lines[i].items() if key not in boilerplate]
+        text_score = min(sum(len(line) for line in body), TEXT_SATURATION_CHARS) / TEXT_SATURATION_CHARS
+        title_score = min(sum(1 for line in body if _is_title_line(line)), 2) / 2
+        score = (0.35 * text_score + 0.45 * title_score
+                 - 0.25 * image_coverage * (1 - text_score)
+                 + 0.1 * (1 - i / total_pages))  # earlier pages win ties
+        scores.append((score, i))
+
+    chosen = sorted(i for _, i in sorted(scores, key=lambda item: (-item[0], item[1]))[:count])
+    if verbose:
+        print(f"Auto-selected pages {', '.join(str(i + 1) for i in chosen)} "
+              f"(scored {len(features)} of {total_pages} pages)")
+    return chosen
+
+
+def _window_indices(window: PageWindowReader, first_pages: int, last_pages: int, sample_pages: int) -> List[int]:
+    """Return the pages to use: the auto-selected sample if sample_pages is set, else the first/last window."""
+    if sample_pages > 0:
+        return select_informative_pages(window, sample_pages)
+    return select_page_indices(window.page_count, first_pages, last_pages)
+
+
+def page_window_indices(pdf_path: str, first_pages: int = 0, last_pages: int = 0, sample_pages: int = 0) -> List[int]:
+    """
+    Return the zero-based indices of the pages selected for extraction.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        first_pages (int): Number of pages to include from the start (0 with last_pages=0 means all pages)
+        last_pages (int): Number of pages to include from the end
+        sample_pages (int): If set, use this many auto-selected pages instead (--pages auto:N)
+
+    Returns:
+        list: Page indices in document order
+    """
+    with PageWindowReader(pdf_path) as window:
+        return _window_indices(window, first_pages, last_pages, sample_pages)
+
+
+def _partial_pdf_writer(pdf_path: str, first_pages: int, last_pages: int,
+                        sample_pages: int = 0) -> Optional[PdfWriter]:
+    """Return a writer holding the selected pages, or None when they cover the whole PDF."""
+    # Only the requested pages are resolved; add_page copies them (and what they
+    # reference) into the writer, so the source can be closed before writing
+    with PageWindowReader(pdf_path) as window:
+        total_pages = window.page_count
+
+        if sample_pages <= 0 and first_pages + last_pages >= total_pages:
             print(f"Warning: Requested {first_pages} first pages and {last_pages} last pages, "
                   f"but PDF only has {total_pages} pages. Using full PDF.")
-            return pdf_path
+            return None
+        indices = _window_indices(window, first_pages, last_pages, sample_pages)
+        if len(indices) >= total_pages:
+            return None
+
+        # Create a new PDF writer with the selected pages
+        writer = PdfWriter()
+        for page in window.pages(indices):
+            writer.add_page(page)
+
+    if sample_pages > 0:
+        print(f"Created partial PDF with {len(indices)} auto-selected pages from original {total_pages} pages")
+    else:
+        print(f"Created partial PDF with {first_pages} first pages and {last_pages} last pages "
+              f"(total {first_pages + last_pages} pages from original {total_pages} pages)")
+    return writer
 
-        # Create a new PDF writer
+
+def _full_pdf_writer(pdf_path: str) -> PdfWriter:
+    """Return a writer holding every page of a PDF."""
+    with PageWindowReader(pdf_path) as window:
         writer = PdfWriter()
+        for page in window.pages(list(range(window.page_count))):
+            writer.add_page(page)
+    return writer
 
-        # Add first pages
-        for i in range(min(first_pages, total_pages)):
-            writer.add_page(reader.pages[i])
 
-        # Add last pages (if any)
-        if last_pages > 0:
-            for i in range(max(first_pages, total_pages - last_pages), total_pages):
-                writer.add_page(reader.pages[i])
+def create_partial_pdf(pdf_path: str, first_pages: int = 0, last_pages: int = 0, sample_pages: int = 0) -> str:
+    """
+    Create a new PDF containing only the specified number of pages from the start and end.
+
+    Args:
+        pdf_path (str): Path to the original PDF file
+        first_pages (int): Number of pages to include from the start
+        last_pages (int): Number of pages to include from the end
+        sample_pages (int): If set, include this many auto-selected pages instead (--pages auto:N)
+
+    Returns:
+        str: Path to the temporary PDF file containing selected pages
+    """
+    try:
+        writer = _partial_pdf_writer(pdf_path, first_pages, last_pages, sample_pages)
+        if writer is None:
+            return pdf_path
 
         # Create a temporary file
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
@@ -50,9 +224,6 @@ def create_partial_pdf(pdf_path: str, first_pages: int = 0, last_pages: int = 0)
         # Write the selected pages to the temporary file
         with open(temp_path, 'wb') as output_file:
             writer.write(output_file)
-
-        print(f"Created partial PDF with {first_pages} first pages and {last_pages} last pages "
-              f"(total {first_pages + last_pages} pages from original {total_pages} pages)")
         return temp_path
 
     except Exception as e:
@@ -60,6 +231,108 @@ def create_partial_pdf(pdf_path: str, first_pages: int = 0, last_pages: int = 0)
         raise
 
 
+def create_partial_pdf_buffer(pdf_path: str, first_pages: int = 0, last_pages: int = 0,
+                              spill_threshold_mb: float = PARTIAL_PDF_SPILL_MB,
+                              sample_pages: int = 0,
+                              optimise: Optional[Dict[str, Any]] = None) -> Optional[BinaryIO]:
+    """
+    Like create_partial_pdf, but keep the sliced PDF in memory.
+
+    The slice is held in memory up to spill_threshold_mb and only then rolls over
+    to an anonymous temporary file, which is removed when the buffer is closed.
+    With optimise settings, the slice (or the whole PDF, if no pages are dropped)
+    is shrunk by upload_optimiser.optimise_writer before it is written.
+
+    Args:
+        pdf_path (str): Path to the original PDF file
+        first_pages (int): Number of pages to include from the start
+        last_pages (int): Number of pages to include from the end
+        spill_threshold_mb (float): Size above which the slice is spilled to disk
+        sample_pages (int): If set, include this many auto-selected pages instead (--pages auto:N)
+        optimise (dict, optional): Upload optimisation settings (max_dpi, jpeg_quality,
+            target_mb) as returned by config.get_upload_optimisation
+
+    Returns:
+        BinaryIO: Buffer positioned at the start of the sliced PDF (the caller closes it),
+            or None when the window covers the whole PDF and the original should be used
+    """
+    try:
+        writer = _partial_pdf_writer(pdf_path, first_pages, last_pages, sample_pages)
+        if writer is None and optimise:
+            writer = _full_pdf_writer(pdf_path)
+        if writer is None:
+            return None
+        if optimise:
+            report = optimise_writer(writer, optimise["max_dpi"], optimise["jpeg_quality"], optimise.get("target_mb"))
+            print(f"Optimised {os.path.basename(pdf_path)} for upload: {format_report(report)}")
+
+        buffer = tempfile.SpooledTemporaryFile(max_size=int(spill_threshold_mb * 1024 * 1024),
+                                               mode='w+b', suffix='.pdf')
+        try:
+            writer.write(buffer)
+            buffer.seek(0)
+        except Exception:
+            buffer.close()
+            raise
+        return buffer
+
+    except Exception as e:
+        print(f"Error creating partial PDF: {str(e)}")
+        raise
+
+
+def extract_page_text(pdf_path: str, first_pages: int = 0, last_pages: int = 0,
+                      char_budget: int = 60000, max_textless_ratio: float = 0.5,
+                      sample_pages: int = 0) -> Optional[str]:
+    """
+    Extract the text layer of the selected pages, within a character budget.
+
+    The budget is shared between pages so that later pages (e.g. the last pages of
+    a first/last window) are not crowded out by a long first page.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        first_pages (int): Number of pages to include from the start (0 with last_pages=0 means all pages)
+        last_pages (int): Number of pages to include from the end
+        char_budget (int): Maximum number of characters of page text to return
+        max_textless_ratio (float): Largest share of selected pages allowed to lack a text layer
+        sample_pages (int): If set, use this many auto-selected pages instead (--pages auto:N)
+
+    Returns:
+        str: Page text with page markers, or None when too many pages have no text
+            layer (e.g. scans), in which case the caller should upload the PDF instead
+    """
+    with PageWindowReader(pdf_path) as window:
+        indices = _window_indices(window, first_pages, last_pages, sample_pages)
+        if not indices:
+            return None
+
+        page_texts = []
+        for i in indices:
+            try:
+                text = (window.page(i).extract_text() or "").strip()
+            except Exception:
+                text = ""
+            page_texts.append((i, text))
+
+    textless = sum(1 for _, text in page_texts if len(text) < MIN_PAGE_TEXT_CHARS)
+    if textless / len(page_texts) > max_textless_ratio:
+        print(f"{textless} of {len(page_texts)} selected pages have no text layer; uploading PDF instead")
+        return None
+
+    parts = []
+    remaining = char_budget
+    for position, (i, text) in enumerate(page_texts):
+        allowance = remaining // (len(page_texts) - position)
+        if len(text) < MIN_PAGE_TEXT_CHARS:
+            text = "[No text layer on this page]"
+        text = text[:allowance]
+        remaining -= len(text)
+        parts.append(f"--- Page {i + 1} ---\n{text}")
+    print(f"Extracted text from {len(page_texts)} page(s) ({char_budget - remaining} characters)")
+    return "\n\n".join(parts)
+
+
 def validate_pdf_path(pdf_path: str) -> None:
     """
     Validate that the PDF file exists and is accessible.
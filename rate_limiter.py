@@ -0,0 +1,319 @@
+"""
+Adaptive, rate-limit-aware concurrency control for OpenAI API calls.
+
+The controller sits in front of `files.create` and `responses.create`. It keeps
+token buckets for requests/min and tokens/min (seeded from the optional limits
+passed in and then synchronised from the `x-ratelimit-*` response headers) and
+adjusts the number of concurrent calls with additive-increase /
+multiplicative-decrease: each success grows the limit by roughly one per window
+of calls, each 429 halves it and pauses new calls until the reset time.
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+# Statuses retried with backoff, as the SDK's own retries would (its clients are built with
+# max_retries=0 when a controller is in use, so that 429s reach it)
+_TRANSIENT_STATUSES = {408, 409, 500, 502, 503, 504}
+_BACKOFF_INITIAL = 0.5
+_BACKOFF_MAX = 8.0
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse an OpenAI reset header value such as "1s", "6m0s" or "120ms" into seconds.
+
+    Args:
+        value (str): Header value
+
+    Returns:
+        float: Number of seconds, or None if the value cannot be parsed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Return True for a server error, timeout or dropped connection that is worth retrying."""
+    if getattr(error, 'status_code', None) in _TRANSIENT_STATUSES:
+        return True
+    # openai.APIConnectionError and its subclass APITimeoutError carry no status
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    """Return an integer header value, or None if missing or malformed."""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: Optional[float] = None) -> None:
+        """
+        Initialize a token bucket that refills continuously.
+
+        Args:
+            per_minute (float, optional): Capacity per minute. None means unlimited
+                until a limit is learned from response headers.
+        """
+        self.capacity = per_minute
+        self.tokens = per_minute or 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity:
+            elapsed = now - self._updated
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / 60.0)
+        self._updated = now
+
+    def set_capacity(self, per_minute: float) -> None:
+        """Update the per-minute capacity, keeping the current fill level."""
+        self._refill(time.monotonic())
+        if self.capacity is None:
+            self.tokens = per_minute
+        self.capacity = per_minute
+        self.tokens = min(self.tokens, per_minute)
+
+    def set_remaining(self, remaining: float) -> None:
+        """Clamp the local fill level to what the server reports as remaining."""
+        self._refill(time.monotonic())
+        if self.capacity:
+            self.tokens = min(self.tokens, remaining)
+
+    def wait_time(self, amount: float) -> float:
+        """Return seconds until `amount` tokens are available (0 if available now)."""
+        now = time.monotonic()
+        self._refill(now)
+        if not self.capacity or amount <= 0:
+            return 0.0
+        # A single request larger than the bucket is allowed once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        """Take `amount` tokens; the level may go negative when correcting estimates."""
+        self._refill(time.monotonic())
+        if self.capacity:
+            self.tokens -= amount
+
+
+class AdaptiveRateLimiter:
+    def __init__(self,
+                 initial_concurrency: int = 4,
+                 min_concurrency: int = 1,
+                 max_concurrency: int = 64,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 decrease_factor: float = 0.5,
+                 max_retries: int = 5) -> None:
+        """
+        Initialize the rate limiter.
+
+        Args:
+            initial_concurrency (int): Starting number of concurrent calls
+            min_concurrency (int): Lower bound for the concurrency limit
+            max_concurrency (int): Upper bound for the concurrency limit
+            requests_per_minute (float, optional): Known request quota; learned from headers otherwise
+            tokens_per_minute (float, optional): Known token quota; learned from headers otherwise
+            decrease_factor (float): Multiplier applied to the limit on a 429
+            max_retries (int): Number of times a rate-limited or transiently failing call is retried
+        """
+        if min_concurrency < 1 or max_concurrency < min_concurrency:
+            raise ValueError("Concurrency bounds must satisfy 1 <= min_concurrency <= max_concurrency")
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.queued = 0
+        self.rate_limited = 0
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        """The whole number of calls currently allowed in flight."""
+        return int(self.limit)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of callers waiting for a slot."""
+        return self.queued
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the controller state for progress reporting."""
+        with self._cond:
+            return {
+                "limit": self.current_limit,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "rate_limited": self.rate_limited,
+                "requests_per_minute": self.requests.capacity,
+                "tokens_per_minute": self.tokens.capacity,
+            }
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0, counts_against_quota: bool = True) -> Iterator[None]:
+        """
+        Block until a concurrency slot and enough quota are available, then hold the slot.
+
+        Args:
+            estimated_tokens (int): Tokens the call is expected to use
+            counts_against_quota (bool): Whether the call draws from the request/token buckets
+                (uploads only take a concurrency slot)
+        """
+        with self._cond:
+            self.queued += 1
+            try:
+                while True:
+                    wait = self._paused_until - time.monotonic()
+                    if self.in_flight < self.current_limit and wait <= 0:
+                        if counts_against_quota:
+                            wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+                        if wait <= 0:
+                            break
+                    self._cond.wait(timeout=wait if wait > 0 else None)
+            finally:
+                self.queued -= 1
+            if counts_against_quota:
+                self.requests.consume(1)
+                self.tokens.consume(estimated_tokens)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, headers: Optional[Mapping[str, str]] = None,
+                   estimated_tokens: int = 0, tokens_used: Optional[int] = None) -> None:
+        """
+        Record a successful call: grow the limit additively and sync quotas from headers.
+
+        Args:
+            headers: Response headers (may contain x-ratelimit-*)
+            estimated_tokens (int): Tokens reserved for the call in slot()
+            tokens_used (int, optional): Actual tokens reported by the API
+        """
+        with self._cond:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            if tokens_used is not None:
+                self.tokens.consume(tokens_used - estimated_tokens)
+            if headers:
+                self._sync_from_headers(headers)
+            self._cond.notify_all()
+
+    def on_rate_limited(self, headers: Optional[Mapping[str, str]] = None) -> float:
+        """
+        Record a 429: cut the limit multiplicatively and pause until the quota resets.
+
+        Args:
+            headers: Response headers from the 429 response
+
+        Returns:
+            float: Seconds new calls are paused for
+        """
+        now = time.monotonic()
+        headers = headers or {}
+        pause = parse_reset_duration(headers.get('retry-after-ms'))
+        if pause is not None:
+            pause /= 1000.0
+        else:
+            pause = parse_reset_duration(headers.get('retry-after'))
+        if pause is None:
+            resets = [parse_reset_duration(headers.get('x-ratelimit-reset-requests')),
+                      parse_reset_duration(headers.get('x-ratelimit-reset-tokens'))]
+            resets = [r for r in resets if r is not None]
+            pause = max(resets) if resets else 1.0
+        with self._cond:
+            self.rate_limited += 1
+            # Several in-flight calls usually hit the same 429 window; decrease once per window
+            if now - self._last_decrease >= pause:
+                self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+                self._last_decrease = now
+            self._paused_until = max(self._paused_until, now + pause)
+            self._sync_from_headers(headers)
+            self._cond.notify_all()
+        print(f"Rate limited: concurrency limit now {self.current_limit}, pausing {pause:.1f}s")
+        return pause
+
+    def _sync_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Update bucket capacities and fill levels from x-ratelimit-* headers."""
+        limit_requests = _header_int(headers, 'x-ratelimit-limit-requests')
+        limit_tokens = _header_int(headers, 'x-ratelimit-limit-tokens')
+        remaining_requests = _header_int(headers, 'x-ratelimit-remaining-requests')
+        remaining_tokens = _header_int(headers, 'x-ratelimit-remaining-tokens')
+        if limit_requests:
+            self.requests.set_capacity(limit_requests)
+        if limit_tokens:
+            self.tokens.set_capacity(limit_tokens)
+        if remaining_requests is not None:
+            self.requests.set_remaining(remaining_requests)
+        if remaining_tokens is not None:
+            self.tokens.set_remaining(remaining_tokens)
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0, counts_against_quota: bool = True) -> Any:
+        """
+        Run an API call under the controller, retrying on 429 and, with exponential
+        backoff, on transient errors (see is_transient_error).
+
+        `fn` must return a raw response as produced by the SDK's `with_raw_response`
+        accessors (exposing `.headers` and `.parse()`); the parsed result is returned.
+
+        Args:
+            fn: Zero-argument callable performing the request
+            estimated_tokens (int): Tokens the call is expected to use
+            counts_against_quota (bool): Whether the call draws from the request/token buckets
+
+        Returns:
+            The parsed API response
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.slot(estimated_tokens, counts_against_quota):
+                    raw = fn()
+            except Exception as e:
+                rate_limited = getattr(e, 'status_code', None) == 429
+                if not (rate_limited or is_transient_error(e)) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                if rate_limited:
+                    response = getattr(e, 'response', None)
+                    self.on_rate_limited(getattr(response, 'headers', None))
+                else:
+                    # Not a quota problem: back off without cutting the concurrency limit
+                    time.sleep(min(_BACKOFF_MAX, _BACKOFF_INITIAL * 2 ** (attempt - 1)))
+                continue
+            parsed = raw.parse()
+            usage = getattr(parsed, 'usage', None)
+            tokens_used = getattr(usage, 'total_tokens', None) if counts_against_quota else None
+            self.on_success(raw.headers, estimated_tokens if counts_against_quota else 0, tokens_used)
+            return parsed
@@ -0,0 +1,263 @@
+"""
+Record building and validation shared by the metadata writers.
+
+MetadataRecordBuilder turns the model's JSON into an output record (cleaned text,
+validated subjects, asset ID, source path, format and timestamp) and applies the
+duplicates policy to a batch. JSONMetadataWriter and SQLiteMetadataStore inherit
+it and supply the storage: write_records, the record readers and the asset
+lookups the duplicates policy needs.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from config import get_subject_constraints, validate_subjects
+from text_normaliser import normalise_records
+
+# (metadata_str, pdf_path, original_format) and the keyword fields of make_record
+Submission = Tuple[Tuple[Any, ...], Dict[str, Any]]
+
+# What to do when a record is written for an asset that already has one
+DUPLICATE_POLICIES = ("all", "newest", "first")
+
+# Record fields iter_records can filter on
+FILTER_FIELDS = ("asset_id", "file_path", "original_format")
+
+
+class MetadataRecordBuilder:
+    def __init__(self, profile_path: str = None, duplicates: str = "all") -> None:
+        """
+        Load the subject constraints and check the duplicates policy.
+
+        Args:
+            profile_path (str): Path to a YAML profile file (used for subject validation)
+            duplicates (str): One of DUPLICATE_POLICIES: keep all records of an asset, only the
+                newest or only the first
+        """
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"duplicates must be one of {', '.join(DUPLICATE_POLICIES)}")
+        self.duplicates = duplicates
+        self._valid_topics, self._subject_max = get_subject_constraints(profile_path)
+        # Writes may come from several threads
+        self._lock = threading.Lock()
+
+    @property
+    def output_path(self) -> str:
+        """The file records are written to, as reported to the user."""
+        raise NotImplementedError
+
+    def _load_metadata(self, metadata_str: str) -> Dict[str, Any]:
+        """
+        Parse the metadata JSON string into a dictionary, without cleaning it.
+
+        Raises:
+            ValueError: If the JSON is invalid or is not an object
+        """
+        try:
+            metadata_dict = json.loads(metadata_str)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format: {str(e)}")
+        except Exception as e:
+            raise ValueError(f"Error parsing metadata: {str(e)}")
+        if not isinstance(metadata_dict, dict):
+            raise ValueError("Error parsing metadata: expected a JSON object")
+        return metadata_dict
+
+    def _validate_subjects(self, metadata_dict: Dict[str, Any], cleaned_dict: Dict[str, Any]) -> None:
+        """Replace the cleaned Subject list with the subjects that are valid for the profile."""
+        subjects = metadata_dict.get('Subject')
+        if isinstance(subjects, list):
+            validated = validate_subjects(subjects, self._valid_topics, self._subject_max)
+            if len(validated) < len(subjects):
+                print(f"  Subject validation: reduced from {len(subjects)} to {len(validated)} item(s)")
+            cleaned_dict['Subject'] = validated
+
+    def make_records(self, submissions: List[Submission]) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Build the output records for a batch of documents, cleaning the text of the whole batch in one pass.
+
+        Args:
+            submissions (list): (args, fields) pairs, called as make_record(*args, **fields) would be
+
+        Returns:
+            list: For each submission, its record, or the ValueError that stopped it being built
+        """
+        results: List[Union[Dict[str, Any], Exception]] = []
+        parsed: List[Dict[str, Any]] = []
+        for (metadata_str, *_), _ in submissions:
+            try:
+                parsed.append(self._load_metadata(metadata_str))
+                results.append(None)
+            except ValueError as e:
+                results.append(e)
+        cleaned = iter(normalise_records(parsed))
+        metadata = iter(parsed)
+        for position, (args, fields) in enumerate(submissions):
+            if results[position] is not None:
+                continue
+            metadata_dict, cleaned_dict = next(metadata), next(cleaned)
+            try:
+                self._validate_subjects(metadata_dict, cleaned_dict)
+                results[position] = self._build_record(cleaned_dict, *args[1:], **fields)
+            except Exception as e:
+                results[position] = ValueError(f"Error parsing metadata: {str(e)}")
+        return results
+
+    def make_record(self, metadata_str: str, pdf_path: str, original_format: str = None,
+                    usage: Optional[Dict[str, int]] = None,
+                    near_duplicate: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Build the output record for a document, without writing it.
+
+        Args:
+            metadata_str (str): The metadata JSON string from OpenAI
+            pdf_path (str): Path to the source PDF file
+            original_format (str): Original file format if the file was converted (e.g., 'docx', 'txt')
+            usage (dict, optional): Token usage of the model call (input, cached and output tokens)
+            near_duplicate (dict, optional): Source, similarity and method when the metadata was
+                taken from a near-duplicate document
+
+        Returns:
+            Dict[str, Any]: The record
+
+        Raises:
+            ValueError: If the metadata cannot be parsed or is invalid
+        """
+        record = self.make_records([((metadata_str, pdf_path, original_format),
+                                     {"usage": usage, "near_duplicate": near_duplicate})])[0]
+        if isinstance(record, Exception):
+            raise record
+        return record
+
+    def _build_record(self, metadata_dict: Dict[str, Any], pdf_path: str, original_format: str = None,
+                      usage: Optional[Dict[str, int]] = None,
+                      near_duplicate: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Wrap cleaned metadata in a record with the asset ID, source path, format and timestamp."""
+        record = {
+            "asset_id": os.path.basename(pdf_path),
+            "file_path": pdf_path,
+            "original_format": original_format or "pdf",
+            "extracted_at": datetime.now().isoformat(),
+            "metadata": metadata_dict
+        }
+        if usage:
+            record["usage"] = usage
+        if near_duplicate:
+            record["near_duplicate"] = near_duplicate
+        return record
+
+    def write_metadata(self, metadata_str: str, pdf_path: str, original_format: str = None,
+                       usage: Optional[Dict[str, int]] = None,
+                       near_duplicate: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Build a record and write it.
+
+        Args:
+            metadata_str (str): The metadata JSON string from OpenAI
+            pdf_path (str): Path to the source PDF file
+            original_format (str): Original file format if the file was converted (e.g., 'docx', 'txt')
+            usage (dict, optional): Token usage of the model call (input, cached and output tokens)
+            near_duplicate (dict, optional): Source, similarity and method when the metadata was
+                taken from a near-duplicate document
+
+        Raises:
+            ValueError: If the metadata cannot be parsed or is invalid
+        """
+        try:
+            record = self.make_record(metadata_str, pdf_path, original_format, usage=usage,
+                                      near_duplicate=near_duplicate)
+            self.write_records([record])
+            print(f"Metadata written to {os.path.basename(self.output_path)} for: {pdf_path}")
+
+        except Exception as e:
+            print(f"Error writing metadata for {pdf_path}: {str(e)}")
+            raise
+
+    def write_records(self, records: List[Dict[str, Any]], fsync: bool = False) -> None:
+        """
+        Write a batch of records built by make_record.
+
+        Args:
+            records (list): Records built by make_record
+            fsync (bool): Force the data to disk before returning
+        """
+        raise NotImplementedError
+
+    def _known_asset(self, asset_id: str) -> bool:
+        """Return True if the output already has a record for the asset. Call with the lock held."""
+        raise NotImplementedError
+
+    def _add_assets(self, asset_ids: Iterable[str]) -> None:
+        """Note assets that have been written. Call with the lock held."""
+
+    def _resolve_duplicates(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Set[str]]:
+        """
+        Apply the duplicates policy to a batch. Call with the lock held.
+
+        Returns:
+            tuple: (records to write, assets whose existing records they replace)
+        """
+        kept: List[Optional[Dict[str, Any]]] = []
+        positions: Dict[str, int] = {}
+        replaced: Set[str] = set()
+        for record in records:
+            asset_id = record["asset_id"]
+            if asset_id in positions or self._known_asset(asset_id):
+                if self.duplicates == "first":
+                    print(f"Keeping the existing record for {asset_id}")
+                    continue
+                print(f"Replacing the existing record for {asset_id}")
+                if asset_id in positions:
+                    kept[positions[asset_id]] = None
+                else:
+                    replaced.add(asset_id)
+            positions[asset_id] = len(kept)
+            kept.append(record)
+        self._add_assets(positions)
+        return [record for record in kept if record is not None], replaced
+
+    @staticmethod
+    def _check_filters(filters: Dict[str, Any]) -> None:
+        """Raise ValueError for a filter on a field other than FILTER_FIELDS."""
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot filter on: {', '.join(sorted(unknown))}")
+
+    def iter_records(self, **filters: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Stream records in the order they were written, optionally filtered.
+
+        Args:
+            **filters: Values of asset_id, file_path or original_format to match exactly
+
+        Yields:
+            dict: Records
+        """
+        raise NotImplementedError
+
+    def get_records(self) -> List[Dict[str, Any]]:
+        """
+        Get all metadata records. Prefer iter_records, which streams.
+
+        Returns:
+            List[Dict[str, Any]]: List of all metadata records
+        """
+        return list(self.iter_records())
+
+    def get_record(self, asset_id: str) -> Optional[Dict[str, Any]]:
+        """Return the most recently written record for an asset, or None."""
+        raise NotImplementedError
+
+    def get_record_count(self, original_format: Optional[str] = None) -> int:
+        """Return the number of records, optionally only those of one original format."""
+        raise NotImplementedError
+
+    def compact(self) -> int:
+        """Bring the output up to date with any records held back; returns how many were folded in."""
+        return 0
+
+    def close(self) -> None:
+        """Finish writing and release the output."""
@@ -0,0 +1,231 @@
+"""
+Streaming reader for metadata output files.
+
+iter_records(path) yields the records of a JSON output file one at a time, in
+constant memory however large the file is. It reads both formats the writer
+produces:
+
+    envelope  -> {"metadata": [...], "created_at": ..., "last_updated": ..., "total_records": ...}
+    JSONL     -> one record per line (the --append-records journal); a tombstone line
+                 {"tombstone": asset_id} deletes the asset's earlier records
+    manifest  -> the shards of a rotated output, read in order (see output_manifest.py)
+
+The envelope is parsed incrementally with json.JSONDecoder.raw_decode over a
+sliding buffer, so only the record being decoded is held in memory.
+
+    python record_reader.py output.json     # count the records without loading the file
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+from output_manifest import is_manifest, read_manifest, resolve_output, shard_paths
+
+# Characters read per refill of the parse buffer
+READ_CHUNK = 1 << 20
+
+# Key of a JSON-lines tombstone, written by JSONMetadataWriter when a record replaces an earlier one
+TOMBSTONE_KEY = "tombstone"
+_TOMBSTONE_PREFIX = '{"' + TOMBSTONE_KEY + '"'
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    """A sliding window over a text file for incremental raw_decode."""
+
+    def __init__(self, f: TextIO) -> None:
+        self._f = f
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read another chunk, dropping what has been consumed. Returns False at end of file."""
+        if self.eof:
+            return False
+        chunk = self._f.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ("" at end of file)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self.fill():
+                return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char: str) -> None:
+        """Consume the next non-whitespace character, which must be char."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next JSON value, reading more of the file until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Most likely cut off by the end of the buffer; a real error persists at end of file
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.text) and not self.eof and isinstance(value, (int, float)):
+                # A number at the end of the buffer may continue in the next chunk
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def _is_envelope(path: str) -> bool:
+    """Return True if the file is a JSON envelope, False if it is JSON lines."""
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = _Buffer(f)
+        if buffer.peek() != "{":
+            # Not JSON lines either; parsing it as an envelope reports the error
+            return True
+        buffer.pos += 1
+        if buffer.peek() != '"':
+            return True
+        if buffer.value() == "metadata" and buffer.peek() == ":":
+            # Records have a "metadata" object; the envelope has the array of records
+            buffer.pos += 1
+            return buffer.peek() == "["
+        # A record on the first line, or an envelope whose first key is not "metadata"
+        f.seek(0)
+        line = f.readline(READ_CHUNK)
+    try:
+        first = json.loads(line)
+    except json.JSONDecodeError:
+        return True
+    return not isinstance(first, dict) or isinstance(first.get("metadata"), list)
+
+
+def _iter_envelope(path: str, envelope: Optional[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = _Buffer(f)
+        buffer.expect("{")
+        if buffer.peek() == "}":
+            return
+        while True:
+            key = buffer.value()
+            buffer.expect(":")
+            if key == "metadata":
+                buffer.expect("[")
+                if buffer.peek() == "]":
+                    buffer.pos += 1
+                else:
+                    while True:
+                        yield buffer.value()
+                        if buffer.peek() == "]":
+                            buffer.pos += 1
+                            break
+                        buffer.expect(",")
+            else:
+                value = buffer.value()
+                if envelope is not None:
+                    envelope[key] = value
+            if buffer.peek() == "}":
+                return
+            buffer.expect(",")
+
+
+def tombstone_line(asset_id: str) -> str:
+    """Return the JSON line that deletes an asset's earlier records."""
+    return json.dumps({TOMBSTONE_KEY: asset_id}, ensure_ascii=False) + "\n"
+
+
+def read_tombstones(path: str) -> Dict[str, int]:
+    """
+    Read the tombstones in a JSON-lines file.
+
+    Returns:
+        dict: asset_id -> line number of its last tombstone
+    """
+    tombstones: Dict[str, int] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f):
+            if line.startswith(_TOMBSTONE_PREFIX):
+                try:
+                    tombstones[json.loads(line)[TOMBSTONE_KEY]] = number
+                except (json.JSONDecodeError, KeyError):
+                    continue
+    return tombstones
+
+
+def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    # A first pass finds the tombstones, so records stream in the second
+    tombstones = read_tombstones(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f):
+            if not line.strip() or line.startswith(_TOMBSTONE_PREFIX):
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line truncated by a crash
+                continue
+            if tombstones.get(record.get("asset_id"), -1) < number:
+                yield record
+
+
+def _iter_manifest(path: str, envelope: Optional[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    manifest = read_manifest(path)
+    if envelope is not None:
+        envelope.update({key: manifest[key] for key in ("created_at", "last_updated", "total_records")
+                         if key in manifest})
+    for shard in shard_paths(path, manifest):
+        yield from _iter_envelope(shard, None)
+
+
+def iter_records(path: str, envelope: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the records of a metadata output file one at a time.
+
+    Args:
+        path (str): JSON envelope, JSON-lines file or manifest of shards (a sharded
+            output.json resolves to output.manifest.json)
+        envelope (dict, optional): Filled with the envelope's other fields (created_at,
+            last_updated, total_records) as they are read; complete once the iterator is exhausted
+
+    Yields:
+        dict: Records in file order
+
+    Raises:
+        ValueError: If the file is not valid JSON (json.JSONDecodeError is a ValueError)
+    """
+    path = resolve_output(path)
+    if is_manifest(path):
+        return _iter_manifest(path, envelope)
+    if path.endswith(".jsonl") or not _is_envelope(path):
+        return _iter_jsonl(path)
+    return _iter_envelope(path, envelope)
+
+
+def main():
+    """Command line interface: count the records in an output file."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Count the records in a metadata output file (JSON, JSONL or shard manifest)')
+    parser.add_argument('path', help='Output file')
+    args = parser.parse_args()
+
+    envelope: Dict[str, Any] = {}
+    count = sum(1 for _ in iter_records(args.path, envelope))
+    print(f"{count} record(s)")
+    for key, value in envelope.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Persistent cache of extraction results.
+
+Keys combine everything that determines the model's answer: the source PDF hash,
+the page window, a hash of the compiled system prompt, the model, the subject
+setting and the context prompt. A hit returns the raw model JSON without any
+network I/O. The cache is bounded by total size and evicts least recently used
+entries first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import RESULT_CACHE_MAX_MB, RESULT_CACHE_PATH
+
+
+def make_result_key(pdf_sha256: str, first_pages: int, last_pages: int, system_prompt: str,
+                    model: str, include_subjects: bool, context_prompt: Optional[str],
+                    input_mode: str = "file", sample_pages: int = 0,
+                    upload_optimisation: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build the cache key for one extraction.
+
+    Args:
+        pdf_sha256 (str): Hex SHA-256 of the source PDF
+        first_pages (int): Number of pages included from the start
+        last_pages (int): Number of pages included from the end
+        system_prompt (str): The compiled system prompt
+        model (str): Model name
+        include_subjects (bool): Whether subject classification is enabled
+        context_prompt (str, optional): Custom context included in the prompt
+        input_mode (str): How the document was sent ("file" or "text")
+        sample_pages (int): Number of auto-selected pages (--pages auto:N), 0 for the first/last window
+        upload_optimisation (dict, optional): Image downsampling and recompression settings applied
+            to uploaded files, None if uploads are not optimised
+
+    Returns:
+        str: Hex digest identifying the extraction
+    """
+    fields = {
+        "pdf": pdf_sha256,
+        "first": first_pages,
+        "last": last_pages,
+        "prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        "model": model,
+        "subjects": include_subjects,
+        "context": context_prompt or "",
+    }
+    # Only non-default settings are added, so keys from before they existed stay valid
+    if input_mode != "file":
+        fields["input_mode"] = input_mode
+    if sample_pages:
+        fields["sample_pages"] = sample_pages
+    if upload_optimisation:
+        # max_dpi, jpeg_quality, target_mb, ... change the file the model reads; "enabled" only
+        # says whether the profile turns optimisation on, which --optimise-uploads can override
+        settings = {key: value for key, value in upload_optimisation.items() if key != "enabled"}
+        fields["upload_optimisation"] = hashlib.sha256(
+            json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+    fingerprint = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, db_path: str = RESULT_CACHE_PATH, max_mb: float = RESULT_CACHE_MAX_MB) -> None:
+        """
+        Open (creating if needed) the result cache database.
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            max_mb (float): Maximum total size of cached results in megabytes
+        """
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " metadata TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+        # Running total so puts don't re-scan the table; recomputed before evicting
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the cached model output for a key, or None on a miss.
+
+        Args:
+            key (str): Key from make_result_key
+
+        Returns:
+            str: Raw model JSON, or None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, metadata: str) -> None:
+        """Store a model output and evict least recently used entries above the size limit."""
+        size = len(metadata.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, metadata, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (key, metadata, size, now, now))
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the total size fits. Caller holds the lock."""
+        # Another process may share the database, so start from the real total
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+        self._total = total
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
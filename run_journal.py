@@ -0,0 +1,159 @@
+"""
+Durable, append-only journal of a main.py run.
+
+Each line records one state change for one file:
+
+    queued     -> the file is part of the run
+    uploaded   -> the (sliced) file is on OpenAI; carries "file_id"
+    extracted  -> the model answered; carries "metadata" (the raw model JSON) and "usage",
+                  plus "near_duplicate" when the metadata came from a near-duplicate
+    written    -> the record is in the output file
+    failed     -> processing stopped; carries "error"
+
+The journal lives next to the --json-file. `main.py --resume` replays it so that
+written files are skipped, extracted files are written without another model
+call, and uploaded files reuse their stored file_id. A journal with unfinished
+files is never overwritten: a new run without --resume refuses to start unless
+--new-journal is given, which moves the old journal aside. "extracted" and
+"written" entries are fsynced, so a resumed run never repeats a model call or a
+write that was reported as done.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+JOURNAL_STATES = ("queued", "uploaded", "extracted", "written", "failed")
+
+# States a file is left in when its run stopped part way through
+UNFINISHED_STATES = ("queued", "uploaded", "extracted")
+
+# States forced to disk as they are recorded: each stands for a paid model call or a written record
+DURABLE_STATES = ("extracted", "written")
+
+# States whose file_id or metadata a resumed run picks up; a later "queued" entry does not undo them
+RESUMABLE_STATES = ("uploaded", "extracted")
+
+
+def journal_path_for(json_file: str) -> str:
+    """Return the journal path used for an output JSON file."""
+    return json_file + ".journal"
+
+
+def load_journal(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Replay a journal into the latest known state of each file.
+
+    Args:
+        path (str): Path to the journal file
+
+    Returns:
+        dict: Maps file path to {"state", "file_id", "metadata", "usage", "near_duplicate", "error"}
+    """
+    files: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return files
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; everything before it is valid
+                continue
+            current = files.setdefault(entry["path"], {"state": None, "file_id": None,
+                                                       "metadata": None, "usage": None,
+                                                       "near_duplicate": None, "error": None})
+            if entry["state"] == "queued" and current["state"] in RESUMABLE_STATES:
+                # Re-queued by a resumed run that stopped before getting any further
+                continue
+            current["state"] = entry["state"]
+            for key in ("file_id", "metadata", "usage", "near_duplicate", "error"):
+                if key in entry:
+                    current[key] = entry[key]
+    return files
+
+
+def unfinished_files(path: str) -> int:
+    """Return the number of files a journal's run did not finish (0 if there is no journal)."""
+    return sum(1 for entry in load_journal(path).values() if entry["state"] in UNFINISHED_STATES)
+
+
+def rotate_journal(path: str) -> Optional[str]:
+    """Move a journal aside to <path>.<timestamp>, returning the new path (None if there was none)."""
+    if not os.path.exists(path):
+        return None
+    rotated = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    os.replace(path, rotated)
+    return rotated
+
+
+class RunJournal:
+    def __init__(self, path: str, resume: bool = False, new_journal: bool = False) -> None:
+        """
+        Open the journal for appending.
+
+        Args:
+            path (str): Path to the journal file
+            resume (bool): Keep existing entries; otherwise the journal starts empty
+            new_journal (bool): Start an empty journal even if the existing one has unfinished
+                files; the existing one is moved aside (see rotate_journal)
+
+        Raises:
+            ValueError: If the journal has unfinished files and neither resume nor new_journal is set
+        """
+        self.path = path
+        self.rotated = None
+        if not resume:
+            if new_journal:
+                self.rotated = rotate_journal(path)
+            else:
+                unfinished = unfinished_files(path)
+                if unfinished:
+                    raise ValueError(f"{path} has {unfinished} unfinished file(s); resume the run with "
+                                     f"--resume or start afresh with --new-journal")
+        self.previous = load_journal(path) if resume else {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self._file.tell() > 0:
+            # Terminate a line truncated by a crash so the next entry starts cleanly
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def record(self, pdf_path: str, state: str, **fields: Any) -> None:
+        """
+        Append a state change for a file.
+
+        Args:
+            pdf_path (str): Path of the source file
+            state (str): One of JOURNAL_STATES
+            **fields: Extra data for the state (file_id, metadata, usage, near_duplicate, error)
+        """
+        if state not in JOURNAL_STATES:
+            raise ValueError(f"Unknown journal state: {state}")
+        entry = {"path": pdf_path, "state": state, "at": datetime.now().isoformat()}
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if state in DURABLE_STATES:
+                os.fsync(self._file.fileno())
+
+    def queue(self, pdf_path: str) -> None:
+        """Record a file as part of the run, unless the run being resumed already got further with it."""
+        previous = self.previous.get(pdf_path)
+        if previous is None or previous["state"] not in RESUMABLE_STATES:
+            self.record(pdf_path, "queued")
+
+    def state_of(self, pdf_path: str) -> Optional[Dict[str, Any]]:
+        """Return the state a file reached in the journal being resumed, if any."""
+        return self.previous.get(pdf_path)
+
+    def close(self) -> None:
+        """Close the journal file."""
+        with self._lock:
+            self._file.close()
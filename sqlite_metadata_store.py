@@ -0,0 +1,233 @@
+"""
+SQLite metadata store, an alternative to the JSON output file for large archives.
+
+`main.py --store sqlite:path.db` writes records here instead of to the JSON file.
+Each record is a row with indexed asset_id, file_path, original_format and
+extracted_at columns; the metadata (and the usage / near-duplicate details, if any)
+are stored as JSON. The record count is kept in a metadata table, so counts and
+lookups don't read the records, and reads stream rows in batches.
+
+`python sqlite_metadata_store.py export path.db output.json` writes the same
+{metadata, created_at, last_updated, total_records} envelope as JSONMetadataWriter,
+for the CSV converter and other downstream tools.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from json_metadata_writer import ENVELOPE_HEAD, envelope_tail, serialise_record
+from record_builder import FILTER_FIELDS, MetadataRecordBuilder
+
+# Rows fetched per round trip when streaming records
+FETCH_BATCH = 500
+
+_RECORD_COLUMNS = FILTER_FIELDS + ("extracted_at",)
+
+
+class SQLiteMetadataStore(MetadataRecordBuilder):
+    def __init__(self, db_path: str, profile_path: str = None, duplicates: str = "all") -> None:
+        """
+        Open (creating if needed) a metadata store.
+
+        Records are built and validated by MetadataRecordBuilder, as for JSONMetadataWriter,
+        so the store can be used wherever the writer is, including behind a MetadataSink.
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            profile_path (str): Path to a YAML profile file (used for subject validation)
+            duplicates (str): One of DUPLICATE_POLICIES: keep all records of an asset, only the
+                newest or only the first
+        """
+        super().__init__(profile_path, duplicates)
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " asset_id TEXT NOT NULL,"
+            " file_path TEXT NOT NULL,"
+            " original_format TEXT NOT NULL,"
+            " extracted_at TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " extra TEXT)")
+        for column in _RECORD_COLUMNS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS records_{column} ON records ({column})")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        now = datetime.now().isoformat()
+        self._conn.executemany("INSERT OR IGNORE INTO store_info (key, value) VALUES (?, ?)",
+                               [("created_at", now), ("last_updated", now), ("total_records", "0")])
+        self._conn.commit()
+
+    @property
+    def output_path(self) -> str:
+        """The database file."""
+        return self.db_path
+
+    def write_records(self, records: List[Dict[str, Any]], fsync: bool = False) -> None:
+        """
+        Insert a batch of records in one transaction.
+
+        Args:
+            records (list): Records built by make_record
+            fsync (bool): Commit with synchronous=FULL, so the batch survives a power cut
+        """
+        if not records:
+            return
+        with self._lock:
+            replaced = set()
+            if self.duplicates != "all":
+                records, replaced = self._resolve_duplicates(records)
+            if records:
+                self._insert(records, replaced, fsync)
+
+    def _insert(self, records: List[Dict[str, Any]], replaced: Iterable[str], fsync: bool) -> None:
+        """Insert records, deleting the existing records of the assets they replace. Call with the lock held."""
+        rows = []
+        for record in records:
+            extra = {key: value for key, value in record.items() if key not in _RECORD_COLUMNS + ("metadata",)}
+            rows.append((record["asset_id"], record["file_path"], record["original_format"],
+                         record["extracted_at"], json.dumps(record["metadata"], ensure_ascii=False),
+                         json.dumps(extra, ensure_ascii=False) if extra else None))
+        self._conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        with self._conn:
+            deleted = 0
+            for asset_id in replaced:
+                deleted += self._conn.execute("DELETE FROM records WHERE asset_id = ?", (asset_id,)).rowcount
+            self._conn.executemany(
+                "INSERT INTO records (asset_id, file_path, original_format, extracted_at, metadata, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("UPDATE store_info SET value = CAST(value AS INTEGER) + ? "
+                               "WHERE key = 'total_records'", (len(rows) - deleted,))
+            self._conn.execute("UPDATE store_info SET value = ? WHERE key = 'last_updated'",
+                               (datetime.now().isoformat(),))
+
+    def _known_asset(self, asset_id: str) -> bool:
+        """Return True if the store already has a record for the asset (uses the asset_id index)."""
+        return self._conn.execute("SELECT 1 FROM records WHERE asset_id = ? LIMIT 1",
+                                  (asset_id,)).fetchone() is not None
+
+    def compact(self) -> int:
+        """Nothing to compact; every batch is committed as it is written."""
+        return 0
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def info(self) -> Dict[str, Any]:
+        """Return created_at, last_updated and total_records."""
+        with self._lock:
+            info = dict(self._conn.execute("SELECT key, value FROM store_info").fetchall())
+        info["total_records"] = int(info["total_records"])
+        return info
+
+    def _row_to_record(self, row: tuple) -> Dict[str, Any]:
+        asset_id, file_path, original_format, extracted_at, metadata, extra = row
+        record = {"asset_id": asset_id, "file_path": file_path, "original_format": original_format,
+                  "extracted_at": extracted_at, "metadata": json.loads(metadata)}
+        if extra:
+            record.update(json.loads(extra))
+        return record
+
+    def iter_records(self, **filters: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Stream records in insertion order, optionally filtered on asset_id, file_path or original_format.
+
+        Args:
+            **filters: Column values to match exactly (uses the column indexes)
+
+        Yields:
+            dict: Records in the same shape as the JSON output
+        """
+        self._check_filters(filters)
+        where = " AND ".join(f"{column} = ?" for column in filters)
+        query = ("SELECT asset_id, file_path, original_format, extracted_at, metadata, extra FROM records"
+                 + (f" WHERE {where}" if where else "") + " ORDER BY id")
+        # A separate cursor, so writes can go on while a reader streams
+        with self._lock:
+            cursor = self._conn.execute(query, tuple(filters.values()))
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(FETCH_BATCH)
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_record(row)
+
+    def get_record(self, asset_id: str) -> Optional[Dict[str, Any]]:
+        """Return the most recently written record for an asset, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT asset_id, file_path, original_format, extracted_at, metadata, extra FROM records "
+                "WHERE asset_id = ? ORDER BY id DESC LIMIT 1", (asset_id,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def get_record_count(self, original_format: Optional[str] = None) -> int:
+        """
+        Get the number of records, optionally only those of one original format.
+
+        Returns:
+            int: Number of records
+        """
+        if original_format is None:
+            return self.info()["total_records"]
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records WHERE original_format = ?",
+                                      (original_format,)).fetchone()[0]
+
+    def export_json(self, json_file: str) -> int:
+        """
+        Write the records to a JSON file in the JSONMetadataWriter envelope, streaming.
+
+        Args:
+            json_file (str): Output path (replaced atomically)
+
+        Returns:
+            int: Number of records exported
+        """
+        info = self.info()
+        count = 0
+        temp_file = json_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(ENVELOPE_HEAD)
+            for record in self.iter_records():
+                f.write((",\n" if count else "\n") + serialise_record(record))
+                count += 1
+            f.write(envelope_tail(count, info["created_at"], info["last_updated"]))
+        os.replace(temp_file, json_file)
+        return count
+
+
+def main():
+    """Command line interface for exporting a store to the JSON envelope."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SQLite metadata store written by main.py --store sqlite:path.db')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='Export the store as a JSON output file')
+    export_parser.add_argument('db_path', help='Path to the SQLite store')
+    export_parser.add_argument('json_file', help='JSON file to write')
+    count_parser = subparsers.add_parser('count', help='Print the number of records')
+    count_parser.add_argument('db_path', help='Path to the SQLite store')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        parser.error(f"store not found: {args.db_path}")
+    store = SQLiteMetadataStore(args.db_path)
+    if args.command == 'export':
+        count = store.export_json(args.json_file)
+        print(f"Exported {count} record(s) to {args.json_file}")
+    else:
+        print(store.get_record_count())
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
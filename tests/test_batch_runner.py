@@ -0,0 +1,155 @@
+"""
+Tests for batch_runner.BatchRunner against an in-memory stand-in for the OpenAI Files and Batches APIs.
+
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_runner import BatchRunner, make_custom_id  # noqa: E402
+from openai_client import UsageTotals  # noqa: E402
+
+SYSTEM_PROMPT = "Describe the document as JSON. " * 2000  # ~60 KB, like the real prompt
+
+
+class FakeOpenAI:
+    """Just enough of the OpenAI client for BatchRunner: files.create/content and batches.create/retrieve."""
+
+    def __init__(self, polls_before_complete=1):
+        self.files_content = {}
+        self.batches_created = []
+        self.polls_before_complete = polls_before_complete
+        self._polls = {}
+        self._next_id = 0
+        self.files = SimpleNamespace(create=self._create_file,
+                                     with_streaming_response=SimpleNamespace(content=self._content))
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _id(self, prefix):
+        self._next_id += 1
+        return f"{prefix}-{self._next_id}"
+
+    def _create_file(self, file, purpose):
+        file_id = self._id("file")
+        self.files_content[file_id] = file.read()
+        return SimpleNamespace(id=file_id)
+
+    @contextmanager
+    def _content(self, file_id):
+        lines = self.files_content[file_id].decode("utf-8").splitlines()
+        yield SimpleNamespace(iter_lines=lambda: iter(lines))
+
+    def _create_batch(self, input_file_id, endpoint, completion_window):
+        requests = [json.loads(line) for line in self.files_content[input_file_id].splitlines()]
+        batch_id = self._id("batch")
+        self.batches_created.append({"id": batch_id, "input_bytes": len(self.files_content[input_file_id]),
+                                     "requests": requests})
+        self._polls[batch_id] = 0
+        return SimpleNamespace(id=batch_id, status="validating")
+
+    def _retrieve_batch(self, batch_id):
+        self._polls[batch_id] += 1
+        batch = next(b for b in self.batches_created if b["id"] == batch_id)
+        counts = SimpleNamespace(total=len(batch["requests"]), completed=0, failed=0)
+        if self._polls[batch_id] < self.polls_before_complete:
+            return SimpleNamespace(id=batch_id, status="in_progress", output_file_id=None,
+                                   error_file_id=None, request_counts=counts)
+        output = []
+        for request in batch["requests"]:
+            text = json.dumps({"Title": f"Document {request['custom_id']}"})
+            output.append(json.dumps({"custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200,
+                "body": {"output_text": text, "usage": {"input_tokens": 100, "output_tokens": 10}},
+            }}))
+        output_file_id = self._id("file")
+        self.files_content[output_file_id] = "\n".join(output).encode("utf-8")
+        counts.completed = len(batch["requests"])
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id=output_file_id,
+                               error_file_id=None, request_counts=counts)
+
+
+class FakeExtractor:
+    def __init__(self, openai):
+        self.client = SimpleNamespace(client=openai, system_prompt=SYSTEM_PROMPT,
+                                      prompt_cache_key="test", usage=UsageTotals())
+        self.result_cache = None
+        self.janitor = None
+        self.uploaded = []
+
+    def upload_document(self, pdf_path, first_pages=0, last_pages=0):
+        file_id = self.client.client._create_file(SimpleNamespace(read=lambda: b"%PDF"), "user_data").id
+        self.uploaded.append(pdf_path)
+        return file_id
+
+
+class FakeWriter:
+    def __init__(self):
+        self.records = []
+
+    def write_metadata(self, metadata, pdf_path, original_format, usage=None):
+        self.records.append((pdf_path, json.loads(metadata), original_format))
+
+
+class BatchRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, "output.json.batch.json")
+        self.jobs = [(os.path.join(self.directory.name, f"doc{i}.pdf"), "pdf") for i in range(10)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_runner(self, openai, writer, **options):
+        return BatchRunner(FakeExtractor(openai), writer, self.state_file, poll_interval=0, **options)
+
+    def test_submit_poll_collect(self):
+        openai = FakeOpenAI(polls_before_complete=2)
+        writer = FakeWriter()
+        processed, failed = self.make_runner(openai, writer).run(self.jobs)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted(processed), sorted(path for path, _ in self.jobs))
+        self.assertEqual(len(openai.batches_created), 1)
+        self.assertEqual(sorted(path for path, _, _ in writer.records), sorted(processed))
+        with open(self.state_file, encoding="utf-8") as f:
+            state = json.load(f)
+        self.assertTrue(all(batch["collected"] for batch in state["batches"]))
+
+    def test_batches_are_split_by_input_file_size(self):
+        openai = FakeOpenAI()
+        writer = FakeWriter()
+        # Room for three ~60 KB request lines per input file
+        limit = 200 * 1024
+        processed, failed = self.make_runner(openai, writer, max_batch_bytes=limit).run(self.jobs)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(processed), len(self.jobs))
+        self.assertEqual([len(b["requests"]) for b in openai.batches_created], [3, 3, 3, 1])
+        self.assertTrue(all(b["input_bytes"] <= limit for b in openai.batches_created))
+        submitted = [r["custom_id"] for b in openai.batches_created for r in b["requests"]]
+        self.assertEqual(sorted(submitted), sorted(make_custom_id(path) for path, _ in self.jobs))
+
+    def test_rerun_does_not_resubmit_or_rewrite(self):
+        openai = FakeOpenAI()
+        writer = FakeWriter()
+        self.make_runner(openai, writer).run(self.jobs)
+        rerun = self.make_runner(openai, writer)
+        processed, failed = rerun.run(self.jobs)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(processed), len(self.jobs))
+        self.assertEqual(len(openai.batches_created), 1)
+        self.assertEqual(rerun.extractor.uploaded, [])
+        self.assertEqual(len(writer.records), len(self.jobs))
+
+
+if __name__ == "__main__":
+    unittest.main()
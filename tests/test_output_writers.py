@@ -0,0 +1,206 @@
+"""
+Tests for the JSON output path: tail appends, the sidecar index, duplicate policies,
+shard rotation and the group-commit sink.
+
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_metadata_writer import JSONMetadataWriter, records_path_for  # noqa: E402
+from metadata_sink import MetadataSink  # noqa: E402
+from output_index import OutputIndex  # noqa: E402
+from output_manifest import manifest_path_for, read_manifest, shard_paths  # noqa: E402
+from record_reader import iter_records, read_tombstones  # noqa: E402
+
+
+class OutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.json_file = os.path.join(self._tmp.name, "output.json")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def record(self, writer, name, title, original_format=None):
+        return writer.make_record(json.dumps({"Title": title}), f"/docs/{name}", original_format)
+
+    def titles(self, records):
+        return [(record["asset_id"], record["metadata"]["Title"]) for record in records]
+
+
+class TailAppendTest(OutputTestCase):
+    def test_appended_batches_read_back_in_order(self):
+        writer = JSONMetadataWriter(self.json_file)
+        written = []
+        for batch in (["a.pdf", "b.pdf"], ["c.pdf"], ["d.pdf", "e.pdf", "f.pdf"]):
+            records = [self.record(writer, name, f"Title of {name}", "docx" if name == "c.pdf" else None)
+                       for name in batch]
+            writer.write_records(records)
+            written.extend(records)
+
+        self.assertEqual(list(writer.iter_records()), written)
+        self.assertEqual(list(writer.iter_records(original_format="docx")), [written[2]])
+        self.assertEqual(writer.get_record("e.pdf"), written[4])
+        self.assertEqual(writer.get_record_count(), 6)
+        writer.close()
+
+        # The file stays a complete envelope, laid out as json.dump(..., indent=2) would write it
+        with open(self.json_file, encoding="utf-8") as f:
+            text = f.read()
+        envelope = json.loads(text)
+        self.assertEqual(envelope["metadata"], written)
+        self.assertEqual(envelope["total_records"], 6)
+        self.assertEqual(text, json.dumps(envelope, indent=2, ensure_ascii=False))
+        self.assertEqual(list(iter_records(self.json_file)), written)
+
+        # A reopened writer carries on from the index without losing anything
+        writer = JSONMetadataWriter(self.json_file)
+        extra = self.record(writer, "g.pdf", "Title of g.pdf")
+        writer.write_records([extra])
+        self.assertEqual(list(writer.iter_records()), written + [extra])
+        writer.close()
+
+    def test_journal_records_are_read_before_compaction(self):
+        writer = JSONMetadataWriter(self.json_file, journal=True)
+        records = [self.record(writer, name, name) for name in ("a.pdf", "b.pdf")]
+        writer.write_records(records)
+        self.assertEqual(list(writer.iter_records()), records)
+        self.assertEqual(writer.get_record_count(), 2)
+        writer.close()
+        self.assertFalse(os.path.exists(records_path_for(self.json_file)))
+        self.assertEqual(list(iter_records(self.json_file)), records)
+
+
+class DuplicatePolicyTest(OutputTestCase):
+    def _rerun(self, duplicates):
+        """Write a and b, then (in journal mode, as a rerun would) a again and c."""
+        writer = JSONMetadataWriter(self.json_file, duplicates=duplicates)
+        writer.write_records([self.record(writer, "a.pdf", "old a"), self.record(writer, "b.pdf", "b")])
+        writer.close()
+        writer = JSONMetadataWriter(self.json_file, journal=True, duplicates=duplicates)
+        writer.write_records([self.record(writer, "a.pdf", "new a"), self.record(writer, "c.pdf", "c")])
+        return writer
+
+    def test_newest_tombstones_the_earlier_record(self):
+        writer = self._rerun("newest")
+        self.assertEqual(set(read_tombstones(records_path_for(self.json_file))), {"a.pdf"})
+        self.assertEqual(self.titles(writer.iter_records()), [("b.pdf", "b"), ("a.pdf", "new a"), ("c.pdf", "c")])
+        self.assertEqual(writer.get_record("a.pdf")["metadata"]["Title"], "new a")
+        self.assertEqual(writer.get_record_count(), 3)
+
+        # A second replacement in the same run hides nothing more of the JSON file
+        writer.write_records([self.record(writer, "a.pdf", "newer a")])
+        self.assertEqual(writer.get_record_count(), 3)
+        writer.close()
+        self.assertEqual(self.titles(iter_records(self.json_file)),
+                         [("b.pdf", "b"), ("c.pdf", "c"), ("a.pdf", "newer a")])
+
+    def test_first_keeps_the_earlier_record(self):
+        writer = self._rerun("first")
+        self.assertEqual(read_tombstones(records_path_for(self.json_file)), {})
+        self.assertEqual(self.titles(writer.iter_records()), [("a.pdf", "old a"), ("b.pdf", "b"), ("c.pdf", "c")])
+        self.assertEqual(writer.get_record_count(), 3)
+        writer.close()
+        self.assertEqual(self.titles(iter_records(self.json_file)), [("a.pdf", "old a"), ("b.pdf", "b"), ("c.pdf", "c")])
+
+    def test_all_keeps_both_records(self):
+        writer = self._rerun("all")
+        self.assertEqual(writer.get_record_count(), 4)
+        writer.close()
+        self.assertEqual([asset_id for asset_id, _ in self.titles(iter_records(self.json_file))],
+                         ["a.pdf", "b.pdf", "a.pdf", "c.pdf"])
+
+
+class RotationTest(OutputTestCase):
+    def test_manifest_agrees_with_the_shards(self):
+        writer = JSONMetadataWriter(self.json_file, rotate_records=2)
+        names = [f"{i}.pdf" for i in range(7)]
+        # Batches that straddle shard boundaries
+        for batch in (names[:3], names[3:4], names[4:]):
+            writer.write_records([self.record(writer, name, name, "docx" if name == "5.pdf" else None)
+                                  for name in batch])
+        self.assertEqual(writer.get_record_count(), 7)
+        writer.close()
+
+        manifest_path = manifest_path_for(self.json_file)
+        manifest = read_manifest(manifest_path)
+        paths = shard_paths(manifest_path, manifest)
+        self.assertEqual(len(paths), 4)
+        self.assertFalse(os.path.exists(self.json_file))
+        for shard, path in zip(manifest["shards"], paths):
+            records = list(iter_records(path))
+            self.assertLessEqual(len(records), 2)
+            self.assertEqual(shard["records"], len(records))
+            self.assertEqual(shard["bytes"], os.path.getsize(path))
+            formats = {}
+            for record in records:
+                formats[record["original_format"]] = formats.get(record["original_format"], 0) + 1
+            self.assertEqual(shard["format_counts"], formats)
+        self.assertEqual(manifest["total_records"], sum(shard["records"] for shard in manifest["shards"]))
+        self.assertEqual(manifest["total_records"], 7)
+        self.assertEqual([record["asset_id"] for record in iter_records(manifest_path)], names)
+
+        # A later run carries on in the last shard
+        writer = JSONMetadataWriter(self.json_file, rotate_records=2)
+        writer.write_records([self.record(writer, "7.pdf", "7.pdf")])
+        self.assertEqual(writer.get_record("0.pdf")["asset_id"], "0.pdf")
+        writer.close()
+        manifest = read_manifest(manifest_path)
+        self.assertEqual(len(manifest["shards"]), 4)
+        self.assertEqual(manifest["total_records"], 8)
+
+
+class StaleIndexTest(OutputTestCase):
+    def test_index_is_rebuilt_after_an_outside_edit(self):
+        writer = JSONMetadataWriter(self.json_file)
+        writer.write_records([self.record(writer, "a.pdf", "Alpha"), self.record(writer, "b.pdf", "Bravo")])
+
+        # Same size, so only the modification time gives the edit away
+        with open(self.json_file, encoding="utf-8") as f:
+            text = f.read()
+        with open(self.json_file, "w", encoding="utf-8") as f:
+            f.write(text.replace('"Alpha"', '"Gamma"'))
+        stat = os.stat(self.json_file)
+        os.utime(self.json_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertFalse(writer.index.is_current())
+        self.assertIsNone(OutputIndex.open_current(self.json_file))
+
+        self.assertEqual(writer.get_record("a.pdf")["metadata"]["Title"], "Gamma")
+        self.assertTrue(writer.index.is_current())
+
+        # Records removed by hand are no longer counted, and appends keep the edit
+        with open(self.json_file, encoding="utf-8") as f:
+            envelope = json.load(f)
+        envelope["metadata"] = envelope["metadata"][:1]
+        with open(self.json_file, "w", encoding="utf-8") as f:
+            json.dump(envelope, f)
+        self.assertEqual(writer.get_record_count(), 1)
+        writer.write_records([self.record(writer, "c.pdf", "Charlie")])
+        writer.close()
+        self.assertEqual(self.titles(iter_records(self.json_file)), [("a.pdf", "Gamma"), ("c.pdf", "Charlie")])
+
+
+class MetadataSinkTest(OutputTestCase):
+    def test_submissions_are_written_in_batches(self):
+        writer = JSONMetadataWriter(self.json_file)
+        with MetadataSink(writer, flush_records=3, flush_ms=60000) as sink:
+            futures = [sink.submit(json.dumps({"Title": f"T{i}"}), f"/docs/{i}.pdf") for i in range(7)]
+            bad = sink.submit("not json", "/docs/bad.pdf")
+            sink.flush()
+            records = [future.result(timeout=5) for future in futures]
+        self.assertRaises(ValueError, bad.result, timeout=5)
+        self.assertEqual(sink.records, 7)
+        self.assertEqual(sink.batches, 3)
+        self.assertEqual(list(writer.iter_records()), records)
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests for run_journal: what a resumed run picks up from the journal of an interrupted one.
+
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_journal import RunJournal, load_journal, unfinished_files  # noqa: E402
+
+
+class RunJournalResumeTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "output.json.journal")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _interrupted_run(self):
+        """A run that uploaded one file, extracted another and stopped before writing either."""
+        journal = RunJournal(self.path)
+        for pdf_path in ("a.pdf", "b.pdf", "c.pdf"):
+            journal.queue(pdf_path)
+        journal.record("a.pdf", "uploaded", file_id="file-a")
+        journal.record("b.pdf", "extracted", metadata='{"Title": "B"}', usage={"input_tokens": 10})
+        journal.close()
+
+    def test_resume_that_stops_again_keeps_uploads_and_extractions(self):
+        self._interrupted_run()
+
+        # The resumed run queues its files, then stops again before getting further
+        journal = RunJournal(self.path, resume=True)
+        for pdf_path in ("a.pdf", "b.pdf", "c.pdf"):
+            journal.queue(pdf_path)
+        journal.close()
+
+        journal = RunJournal(self.path, resume=True)
+        self.assertEqual(journal.state_of("a.pdf")["state"], "uploaded")
+        self.assertEqual(journal.state_of("a.pdf")["file_id"], "file-a")
+        self.assertEqual(journal.state_of("b.pdf")["state"], "extracted")
+        self.assertEqual(journal.state_of("b.pdf")["metadata"], '{"Title": "B"}')
+        self.assertEqual(journal.state_of("c.pdf")["state"], "queued")
+        journal.close()
+        self.assertEqual(unfinished_files(self.path), 3)
+
+    def test_load_journal_ignores_requeue_after_extraction(self):
+        # Journals written before RunJournal.queue re-queued every unwritten file on resume
+        entries = [{"path": "b.pdf", "state": "queued"},
+                   {"path": "b.pdf", "state": "extracted", "metadata": '{"Title": "B"}'},
+                   {"path": "b.pdf", "state": "queued"},
+                   {"path": "d.pdf", "state": "failed", "error": "boom"},
+                   {"path": "d.pdf", "state": "queued"}]
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        files = load_journal(self.path)
+        self.assertEqual(files["b.pdf"]["state"], "extracted")
+        self.assertEqual(files["b.pdf"]["metadata"], '{"Title": "B"}')
+        self.assertEqual(files["d.pdf"]["state"], "queued")
+
+    def test_resumed_failed_file_is_queued_again(self):
+        journal = RunJournal(self.path)
+        journal.queue("d.pdf")
+        journal.record("d.pdf", "failed", error="boom")
+        journal.close()
+
+        journal = RunJournal(self.path, resume=True)
+        journal.queue("d.pdf")
+        journal.close()
+        self.assertEqual(load_journal(self.path)["d.pdf"]["state"], "queued")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Text normalisation shared by the metadata writers.
+
+Every string field of every record is cleaned before it is written: dashes become
+colons, an ellipsis becomes three dots, anything else outside ASCII is dropped and
+surrounding whitespace is stripped. Text that is already ASCII is only stripped;
+otherwise each replacement in the table is applied if present and the rest of the
+non-ASCII characters are dropped by the ASCII codec, so the work stays in C. (A
+str.translate table looks up every character of non-ASCII text in the mapping and
+is no faster than the per-character loop it would replace.)
+
+    python text_normaliser.py --benchmark [--records 100000]
+"""
+
+from typing import Any, Dict, Iterable, List
+
+# Replacements, applied before non-ASCII characters are dropped. The first is the UTF-8
+# bytes of a dash or quote decoded as cp1252 followed by a straight quote; its first two
+# characters would otherwise be dropped, leaving the quote.
+REPLACEMENTS = (
+    ('â€"', ':'),  # common encoding issue
+    ('—', ':'),    # em-dash to colon
+    ('–', ':'),    # en-dash to colon
+    ('…', '...'),  # ellipsis to three dots
+)
+
+
+def normalise_text(text: str) -> str:
+    """
+    Clean text to remove problematic characters and ensure consistent formatting.
+
+    Args:
+        text (str): The text to clean
+
+    Returns:
+        str: Cleaned text (ASCII only)
+    """
+    if not text:
+        return ""
+    if text.isascii():
+        return text.strip()
+    for old, new in REPLACEMENTS:
+        if old in text:
+            text = text.replace(old, new)
+    return text.encode('ascii', 'ignore').decode('ascii').strip()
+
+
+def normalise_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Clean every string value of a metadata dictionary in one pass; other values are kept as they are.
+
+    Args:
+        fields (dict): Metadata fields and values
+
+    Returns:
+        dict: A new dictionary with the string values cleaned
+    """
+    return {key: normalise_text(value) if isinstance(value, str) else value for key, value in fields.items()}
+
+
+def normalise_records(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Clean the string values of many metadata dictionaries (a MetadataSink batch, via make_records).
+
+    Args:
+        records (iterable): Metadata dictionaries
+
+    Returns:
+        list: Cleaned dictionaries, in the same order
+    """
+    return [normalise_fields(fields) for fields in records]
+
+
+def _clean_text_by_replace(text: str) -> str:
+    """The earlier per-writer implementation (replace passes and a per-character join), for the benchmark."""
+    if not text:
+        return ""
+    cleaned = text
+    for old, new in {'—': ':', '–': ':', '…': '...', 'â€"': ':'}.items():
+        cleaned = cleaned.replace(old, new)
+    cleaned = ''.join(char for char in cleaned if ord(char) < 128 or char in ';:,.-()')
+    return cleaned.strip()
+
+
+def benchmark(record_count: int = 100000, repeat: int = 3) -> None:
+    """
+    Time cleaning synthetic metadata records with the earlier replace/join implementation and with
+    normalise_records, and check that the output is the same.
+
+    Args:
+        record_count (int): Number of records to generate
+        repeat (int): Runs per measurement; the best is reported
+    """
+    import random
+    import time
+
+    rng = random.Random(0)
+    words = ["annual", "report", "accounts", "Institute", "Chartered", "members", "council", "London",
+             "taxation", "audit", "Café", "naïve", "résumé", "2019–2020", "note…",
+             "Hall — exterior", "â€\"quotedâ€\""]
+
+    def sentence(length: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(length))
+
+    records = [{
+        "Title": sentence(8),
+        "Description": sentence(60),
+        "Publisher": "Institute of Chartered Accountants in England and Wales",
+        "Date": f"{1880 + i % 140}-01-01",
+        "Type": "Text",
+        "Language": "en",
+        "Rights": sentence(12),
+        "Creator": [sentence(3)],
+        "Subject": ["Accounting", "Audit"],
+    } for i in range(record_count)]
+
+    def by_replace() -> List[Dict[str, Any]]:
+        return [{key: _clean_text_by_replace(value) if isinstance(value, str) else value
+                 for key, value in fields.items()} for fields in records]
+
+    timings = {}
+    for name, run in (("replace/join", by_replace), ("normaliser", lambda: normalise_records(records))):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = (best, result)
+
+    if timings["replace/join"][1] != timings["normaliser"][1]:
+        raise AssertionError("normalise_records output differs from the replace/join implementation")
+    print(f"{record_count} records, {sum(len(fields) for fields in records)} fields; best of {repeat} runs")
+    for name, (seconds, _) in timings.items():
+        print(f"  {name:>12}: {seconds * 1000:8.1f} ms")
+    print(f"  speedup: {timings['replace/join'][0] / timings['normaliser'][0]:.1f}x (identical output)")
+
+
+def main():
+    """Command line interface for normalising text and running the benchmark."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Normalise metadata text as the writers do, and benchmark it')
+    parser.add_argument('text', nargs='*', help='Text to normalise')
+    parser.add_argument('--benchmark', action='store_true', help='Run the benchmark on synthetic records')
+    parser.add_argument('--records', type=int, default=100000,
+                        help='Number of synthetic records for the benchmark (default: 100000)')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.records)
+    for text in args.text:
+        print(normalise_text(text))
+
+
+if __name__ == '__main__':
+    main()
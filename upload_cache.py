@@ -0,0 +1,199 @@
+"""
+Content-addressed cache of uploaded files.
+
+Maps the SHA-256 of the bytes sent to OpenAI to the `file_id` they were uploaded
+as, so reruns (and partial PDFs sliced identically from the same source) reuse the
+existing upload instead of sending the file again. Entries expire after a TTL and
+are dropped when the remote file turns out to be gone.
+
+Prune expired entries, and entries whose remote file no longer exists, with:
+    python upload_cache.py --prune [--verify]
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import BinaryIO, Iterable, Optional, Set
+
+from config import UPLOAD_CACHE_PATH, UPLOAD_CACHE_TTL_DAYS
+
+
+def sha256_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Return the hex SHA-256 digest of a file's contents.
+
+    Args:
+        file_path (str): Path to the file
+        chunk_size (int): Read size in bytes
+
+    Returns:
+        str: Hex digest
+    """
+    with open(file_path, 'rb') as f:
+        return sha256_stream(f, chunk_size)
+
+
+def sha256_stream(stream: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Return the hex SHA-256 digest of a binary stream, read from its start.
+
+    Args:
+        stream: Seekable binary file object (e.g. an in-memory partial PDF)
+        chunk_size (int): Read size in bytes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    def __init__(self, db_path: str = UPLOAD_CACHE_PATH, ttl_days: float = UPLOAD_CACHE_TTL_DAYS) -> None:
+        """
+        Open (creating if needed) the upload cache database.
+
+        Args:
+            db_path (str): Path to the SQLite database file
+            ttl_days (float): Days after which a cached upload is no longer trusted
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_days * 86400
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " sha256 TEXT PRIMARY KEY,"
+            " file_id TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " uploaded_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS uploads_file_id ON uploads (file_id)")
+        self._conn.commit()
+
+    def get(self, sha256: str) -> Optional[str]:
+        """
+        Look up the file_id for a content hash.
+
+        Args:
+            sha256 (str): Hex digest of the bytes to be uploaded
+
+        Returns:
+            str: The cached file_id, or None on a miss or an expired entry
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, expires_at FROM uploads WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None:
+                return None
+            file_id, expires_at = row
+            if expires_at <= time.time():
+                self._conn.execute("DELETE FROM uploads WHERE sha256 = ?", (sha256,))
+                self._conn.commit()
+                return None
+            return file_id
+
+    def put(self, sha256: str, file_id: str, size: int) -> None:
+        """Record that content with this hash was uploaded as file_id."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (sha256, file_id, size, uploaded_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sha256, file_id, size, now, now + self.ttl_seconds))
+            self._conn.commit()
+
+    def invalidate_file_id(self, file_id: str) -> None:
+        """Drop any entry pointing at file_id (e.g. the remote file was deleted)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM uploads WHERE file_id = ?", (file_id,))
+            self._conn.commit()
+
+    def prune(self, remote_file_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Remove expired entries and, optionally, entries whose remote file is gone.
+
+        Args:
+            remote_file_ids: IDs of files that still exist remotely; when given,
+                entries pointing at any other file_id are removed
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM uploads WHERE expires_at <= ?", (time.time(),)).rowcount
+            if remote_file_ids is not None:
+                remote = set(remote_file_ids)
+                stale = [(file_id,) for (file_id,) in self._conn.execute("SELECT file_id FROM uploads")
+                         if file_id not in remote]
+                self._conn.executemany("DELETE FROM uploads WHERE file_id = ?", stale)
+                removed += len(stale)
+            self._conn.commit()
+            return removed
+
+    def file_ids(self) -> Set[str]:
+        """Return every file_id referenced by the cache."""
+        with self._lock:
+            return {file_id for (file_id,) in self._conn.execute("SELECT file_id FROM uploads")}
+
+    def count(self) -> int:
+        """Return the number of cached uploads."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    """Command line interface for inspecting and pruning the upload cache."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Inspect or prune the content-addressed upload cache',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Examples:
+  # Remove expired entries:
+  python upload_cache.py --prune
+
+  # Also remove entries whose file no longer exists on the OpenAI account:
+  python upload_cache.py --prune --verify
+        '''
+    )
+    parser.add_argument('--cache', default=UPLOAD_CACHE_PATH,
+                        help=f'Path to the cache database (default: {UPLOAD_CACHE_PATH})')
+    parser.add_argument('--prune', action='store_true', help='Remove expired entries')
+    parser.add_argument('--verify', action='store_true',
+                        help='With --prune, also remove entries whose remote file is gone')
+    args = parser.parse_args()
+
+    cache = UploadCache(args.cache)
+    print(f"Upload cache: {args.cache} ({cache.count()} entries)")
+    if args.prune:
+        remote_ids = None
+        if args.verify:
+            from openai import OpenAI
+            from dotenv import load_dotenv
+            load_dotenv()
+            # The list endpoint pages automatically; one pass covers the whole account
+            remote_ids = [f.id for f in OpenAI(api_key=os.getenv('OPENAI_API_KEY')).files.list()]
+        removed = cache.prune(remote_ids)
+        print(f"Removed {removed} entries; {cache.count()} remaining")
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Shrink PDFs before they are uploaded.
+
+Scanned and photo-heavy documents are often tens of megabytes even after slicing,
+and uploading them dominates their latency. optimise_writer works on the PdfWriter
+holding the selected pages: images drawn above a DPI ceiling are downsampled and
+recompressed as JPEG, and embedded files (file attachment annotations), page
+thumbnails and fonts that no content stream selects are dropped. If the result is
+still above the target size, DPI and JPEG quality are lowered step by step.
+
+Settings come from the profile's `upload_optimisation` section (see
+config.get_upload_optimisation).
+"""
+
+import io
+import math
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import (ArrayObject, ContentStream, EncodedStreamObject, IndirectObject, NameObject,
+                            NullObject, NumberObject)
+
+# Images whose stream is smaller than this are left alone; recompressing gains nothing
+MIN_IMAGE_BYTES = 8 * 1024
+# Floors for the step-down towards target_mb
+MIN_DPI = 72
+MIN_JPEG_QUALITY = 30
+MAX_TARGET_STEPS = 4
+# Guards against self-referencing form XObjects
+MAX_FORM_DEPTH = 8
+
+IDENTITY_MATRIX = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_UNSUPPORTED_IMAGE_FILTERS = {"/JPXDecode", "/JBIG2Decode", "/CCITTFaxDecode"}
+_DEVICE_MODES = {"/DeviceGray": "L", "/DeviceRGB": "RGB", "/DeviceCMYK": "CMYK"}
+_ICC_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+
+
+class _CountingSink:
+    """Write target that only counts bytes, used to measure a writer's output size."""
+
+    def __init__(self) -> None:
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.size
+
+
+def written_size(writer: PdfWriter) -> int:
+    """Return the number of bytes the writer would produce."""
+    sink = _CountingSink()
+    writer.write(sink)
+    return sink.size
+
+
+def multiply_matrices(m: Tuple[float, ...], n: Tuple[float, ...]) -> Tuple[float, ...]:
+    """Multiply two PDF transformation matrices [a b c d e f]."""
+    return (m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5])
+
+
+def get_resource(resources: Any, category: str) -> Dict[str, Any]:
+    """Return a resource sub-dictionary (/Font, /XObject), or an empty dict."""
+    try:
+        resources = resources.get_object() if resources is not None else None
+        return resources[category] if resources is not None and category in resources else {}
+    except (KeyError, TypeError):
+        return {}
+
+
+class _Usage:
+    """What the content streams of the selected pages actually use."""
+
+    def __init__(self) -> None:
+        # id(font dict) -> (font dict, names selected with Tf)
+        self.fonts: Dict[int, Tuple[Any, Set[str]]] = {}
+        # id(image stream) -> (image stream, largest drawn width and height in points)
+        self.images: Dict[int, Tuple[Any, float, float]] = {}
+
+    def walk(self, contents: Any, resources: Any, ctm: Tuple[float, ...], pdf: Any, depth: int = 0) -> None:
+        """Record the fonts selected and images drawn by a content stream, following form XObjects."""
+        fonts = get_resource(resources, "/Font")
+        xobjects = get_resource(resources, "/XObject")
+        used_fonts = self.fonts.setdefault(id(fonts), (fonts, set()))[1] if fonts else set()
+        stack: List[Tuple[float, ...]] = []
+        for operands, operator in ContentStream(contents, pdf).operations:
+            if operator == b"q":
+                stack.append(ctm)
+            elif operator == b"Q":
+                ctm = stack.pop() if stack else ctm
+            elif operator == b"cm" and len(operands) == 6:
+                ctm = multiply_matrices(tuple(float(x) for x in operands), ctm)
+            elif operator == b"Tf" and operands:
+                used_fonts.add(operands[0])
+            elif operator == b"Do" and operands and operands[0] in xobjects:
+                xobject = xobjects[operands[0]]
+                subtype = xobject.get("/Subtype")
+                if subtype == "/Image":
+                    width, height = math.hypot(ctm[0], ctm[1]), math.hypot(ctm[2], ctm[3])
+                    _, seen_width, seen_height = self.images.get(id(xobject), (xobject, 0.0, 0.0))
+                    self.images[id(xobject)] = (xobject, max(width, seen_width), max(height, seen_height))
+                elif subtype == "/Form" and depth < MAX_FORM_DEPTH:
+                    matrix = tuple(float(x) for x in xobject["/Matrix"]) if "/Matrix" in xobject else IDENTITY_MATRIX
+                    # A form without its own resources uses the resources of the page that draws it
+                    self.walk(xobject, xobject.get("/Resources", resources), multiply_matrices(matrix, ctm), pdf,
+                              depth + 1)
+
+
+def _image_mode(image: Any) -> Optional[Tuple[str, Optional[bytes]]]:
+    """Return the Pillow mode (and palette for indexed images) of an 8-bit image, or None if unsupported."""
+    colour_space = image.get("/ColorSpace")
+    colour_space = colour_space.get_object() if colour_space is not None else None
+    if isinstance(colour_space, str) and colour_space in _DEVICE_MODES:
+        return _DEVICE_MODES[colour_space], None
+    if isinstance(colour_space, ArrayObject) and colour_space:
+        family = colour_space[0]
+        if family == "/ICCBased":
+            return _ICC_MODES.get(int(colour_space[1].get_object().get("/N", 0))), None
+        if family == "/Indexed" and len(colour_space) == 4:
+            base = colour_space[1].get_object()
+            lookup = colour_space[3].get_object()
+            # The palette is a stream or a (byte or text) string
+            lookup = lookup.get_data() if hasattr(lookup, "get_data") else lookup.original_bytes
+            if base == "/DeviceGray":
+                lookup = b"".join(bytes([value]) * 3 for value in lookup)
+            elif base != "/DeviceRGB":
+                return None
+            return "P", lookup
+    return None
+
+
+def decode_image(image: Any) -> Optional[Any]:
+    """Decode an image XObject into a Pillow image, or return None for formats left untouched."""
+    from PIL import Image
+
+    filters = image.get("/Filter")
+    filters = [filters] if isinstance(filters, str) else list(filters or [])
+    if image.get("/ImageMask") or "/Decode" in image or isinstance(image.get("/Mask"), ArrayObject):
+        # Stencil masks, decode arrays and colour-key masks don't survive lossy recompression
+        return None
+    if filters == ["/DCTDecode"]:
+        decoded = Image.open(io.BytesIO(image._data))
+        decoded.load()
+        return decoded
+    if "/DCTDecode" in filters or _UNSUPPORTED_IMAGE_FILTERS.intersection(filters):
+        return None
+    if image.get("/BitsPerComponent") != 8:
+        # 1-bit scans compress far better as CCITT/JBIG2 than as JPEG
+        return None
+    mode = _image_mode(image)
+    if mode is None or mode[0] is None:
+        return None
+    size = (int(image["/Width"]), int(image["/Height"]))
+    decoded = Image.frombytes(mode[0], size, image.get_data())
+    if mode[1] is not None:
+        decoded.putpalette(mode[1])
+    return decoded
+
+
+def _recompress_image(image: Any, max_width: int, max_height: int, quality: int, force: bool) -> int:
+    """
+    Downsample an image to fit max_width x max_height and store it as JPEG if that is smaller.
+
+    Returns:
+        int: Bytes saved (0 if the image was left unchanged)
+    """
+    from PIL import Image
+
+    before = len(image._data)
+    if before < MIN_IMAGE_BYTES:
+        return 0
+    decoded = decode_image(image)
+    if decoded is None:
+        return 0
+    resize = decoded.width > max_width or decoded.height > max_height
+    if not (resize or force or image.get("/Filter") != "/DCTDecode"):
+        return 0
+    decoded = decoded.convert("L" if decoded.mode in ("L", "LA", "1") else "RGB")
+    if resize:
+        decoded.thumbnail((max(1, max_width), max(1, max_height)), Image.LANCZOS)
+    output = io.BytesIO()
+    decoded.save(output, format="JPEG", quality=quality, optimize=True)
+    data = output.getvalue()
+    if len(data) >= before:
+        return 0
+
+    image._data = data
+    if isinstance(image, EncodedStreamObject):
+        image.decoded_self = None
+    image[NameObject("/Filter")] = NameObject("/DCTDecode")
+    image.pop("/DecodeParms", None)
+    image[NameObject("/Width")] = NumberObject(decoded.width)
+    image[NameObject("/Height")] = NumberObject(decoded.height)
+    image[NameObject("/ColorSpace")] = NameObject("/DeviceGray" if decoded.mode == "L" else "/DeviceRGB")
+    image[NameObject("/BitsPerComponent")] = NumberObject(8)
+    return before - len(data)
+
+
+def _drop_unreachable(writer: PdfWriter) -> None:
+    """Replace objects no longer referenced from the catalog with null, so they are not written out."""
+    reachable: Set[int] = set()
+    pending: List[Any] = [writer._root, writer._info]
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is not writer or obj.idnum in reachable:
+                continue
+            reachable.add(obj.idnum)
+            obj = obj.get_object()
+        if isinstance(obj, dict):
+            pending.extend(obj.values())
+        elif isinstance(obj, list):
+            pending.extend(obj)
+    for index, obj in enumerate(writer._objects):
+        # Object numbers are positions, so unreferenced objects become tiny nulls rather than gaps
+        if obj is not None and index + 1 not in reachable and not isinstance(obj, NullObject):
+            writer._objects[index] = NullObject()
+
+
+def optimise_writer(writer: PdfWriter, max_dpi: float = 150, jpeg_quality: int = 75,
+                    target_mb: Optional[float] = None) -> Dict[str, int]:
+    """
+    Shrink the PDF held by a writer in place.
+
+    Args:
+        writer (PdfWriter): Writer holding the pages to be uploaded
+        max_dpi (float): Images drawn at a higher resolution are downsampled to this
+        jpeg_quality (int): JPEG quality (1-95) for recompressed images
+        target_mb (float, optional): Keep lowering DPI and quality (down to 72 DPI and
+            quality 30) until the output fits
+
+    Returns:
+        dict: "before" and "after" sizes in bytes, and counts of "images" recompressed and
+            "fonts", "attachments" and "thumbnails" dropped
+    """
+    report = {"before": written_size(writer), "after": 0, "images": 0, "fonts": 0, "attachments": 0,
+              "thumbnails": 0}
+
+    usage = _Usage()
+    for page in writer.pages:
+        if "/Thumb" in page:
+            del page["/Thumb"]
+            report["thumbnails"] += 1
+        if "/Annots" in page:
+            annotations = page["/Annots"]
+            kept = ArrayObject(a for a in annotations if a.get_object().get("/Subtype") != "/FileAttachment")
+            report["attachments"] += len(annotations) - len(kept)
+            page[NameObject("/Annots")] = kept
+        contents = page.get_contents()
+        if contents is not None:
+            usage.walk(contents, page.get("/Resources"), IDENTITY_MATRIX, writer)
+
+    for fonts, used in usage.fonts.values():
+        for name in [name for name in fonts if name not in used]:
+            del fonts[name]
+            report["fonts"] += 1
+
+    recompressed: Set[int] = set()
+    dpi, quality = max_dpi, jpeg_quality
+    target_bytes = int(target_mb * 1024 * 1024) if target_mb else None
+    for step in range(MAX_TARGET_STEPS + 1):
+        for key, (image, width_pt, height_pt) in usage.images.items():
+            # Points are 1/72 inch; an image drawn at w points needs w / 72 * dpi pixels
+            saved = _recompress_image(image, math.ceil(width_pt / 72 * dpi), math.ceil(height_pt / 72 * dpi),
+                                      quality, force=step > 0)
+            if saved:
+                recompressed.add(key)
+        _drop_unreachable(writer)
+        report["after"] = written_size(writer)
+        if not target_bytes or report["after"] <= target_bytes or (dpi <= MIN_DPI and quality <= MIN_JPEG_QUALITY):
+            break
+        dpi, quality = max(MIN_DPI, dpi * 0.75), max(MIN_JPEG_QUALITY, quality - 15)
+    report["images"] = len(recompressed)
+    return report
+
+
+def format_report(report: Dict[str, int]) -> str:
+    """Return a one-line summary of an optimise_writer report."""
+    return (f"{report['before'] / 1048576:.2f} MB -> {report['after'] / 1048576:.2f} MB "
+            f"({report['images']} image(s) recompressed; dropped {report['fonts']} unused font(s), "
+            f"{report['attachments']} attachment(s), {report['thumbnails']} thumbnail(s))")